@@ -11,7 +11,8 @@ from textwrap import dedent
 from autogen import Agent, AssistantAgent, UserProxyAgent, ConversableAgent
 from autogen.coding import DockerCommandLineCodeExecutor, LocalCommandLineCodeExecutor
 from autogen.code_utils import create_virtual_env
-from src.core.code_utils import filter_pip_output, get_code_abs_token
+from src.core.code_utils import filter_pip_output
+from src.core.token_counter import ConversationTokenLedger
 from src.core.prompt import USER_EXPLORER_PROMPT, CODE_ASSISTANT_PROMPT, SYSTEM_EXPLORER_PROMPT, TRAIN_PROMPT
 from src.core.tool_code_explorer import CodeExplorerTools
 from src.services.autogen_upgrade.base_agent import ExtendedUserProxyAgent, ExtendedAssistantAgent, check_code_block
@@ -53,6 +54,7 @@ class CodeExplorer(BaseCodeExplorer):
         self.current_tool_call_count = 0
         self.token_limit = 2000  # Set token count limit
         self.limit_restart_tokens = 80000  # Set restart token count limit
+        self.token_ledger = ConversationTokenLedger()  # Counts each chat message once
         
         # self.is_cleanup_venv = False
         
@@ -128,11 +130,8 @@ class CodeExplorer(BaseCodeExplorer):
         
         # Get current conversation history
         messages = self.executor.chat_messages.get(self.explore, [])
-        # Calculate total token count
-        total_tokens = 0
-        for m in messages:
-            if m.get("content"):
-                total_tokens += get_code_abs_token(str(m.get("content", "")))
+        # Calculate total token count, only messages added since the last check are counted
+        total_tokens = self.token_ledger.sync(self.explore, messages)
         
         # If over the limit, terminate
         if total_tokens > self.limit_restart_tokens:
@@ -206,6 +205,10 @@ class CodeExplorer(BaseCodeExplorer):
         if self.args.get("function_call", True) and self.code_library:
             self._register_tools()
 
+        # Keep the code tree in sync with files edited or created by executed code
+        if self.code_library:
+            self.executor.register_file_change_callback(self.code_library.update_files)
+
     async def issue_solution_search(self, issue_description: Annotated[str, "Description of specific programming issues or errors encountered by the user"]) -> str:
         """
         For specific programming issues or errors encountered during code exploration or development, perform web search to find possible solutions.
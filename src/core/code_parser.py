@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+"""
+Per-file code parser - Turns a single source file into a plain, serializable parse record
+
+A record holds everything GlobalCodeTreeBuilder needs from one file (module entry, classes,
+functions and imports) and carries no builder state, so it can be cached on disk and reused
+by later analyses of the same repository. Classes and functions only store their line range,
+their source is sliced out of the module content on demand (see src.core.lazy_source).
+Complexity metrics are computed here, in the same parse, so later analyses only read numbers.
+"""
+
+import os
+import ast
+import logging
+from typing import Dict, List, Optional
+
+from src.utils.data_preview import _parse_ipynb_file
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the layout of parse records changes, so cached records are re-parsed
+PARSER_VERSION = 4
+
+
+def module_id_from_path(rel_path: str) -> str:
+    """Create module ID with dot-separated path for a Python file"""
+    return rel_path.replace('/', '.').replace('\\', '.').replace('.py', '')
+
+
+def get_attribute_path(node: ast.Attribute) -> str:
+    """Get complete attribute path (e.g. module.submodule.function)"""
+    parts = []
+    current = node
+
+    while isinstance(current, ast.Attribute):
+        parts.append(current.attr)
+        current = current.value
+
+    if isinstance(current, ast.Name):
+        parts.append(current.id)
+
+    return '.'.join(reversed(parts))
+
+
+def get_subscript_annotation(node: ast.Subscript) -> str:
+    """Get subscript expression in type annotation (e.g. List[str])"""
+    # Handle Python 3.8+
+    try:
+        if isinstance(node.value, ast.Name):
+            container = node.value.id
+        elif isinstance(node.value, ast.Attribute):
+            container = get_attribute_path(node.value)
+        else:
+            return "unknown"
+
+        # Compatible with Python 3.8 and earlier
+        if hasattr(node, 'slice') and isinstance(node.slice, ast.Index):
+            slice_value = node.slice.value
+            if isinstance(slice_value, ast.Name):
+                param = slice_value.id
+            elif isinstance(slice_value, ast.Attribute):
+                param = get_attribute_path(slice_value)
+            else:
+                param = "unknown"
+        # Compatible with Python 3.9+
+        elif hasattr(node, 'slice'):
+            if isinstance(node.slice, ast.Name):
+                param = node.slice.id
+            elif isinstance(node.slice, ast.Attribute):
+                param = get_attribute_path(node.slice)
+            else:
+                param = "unknown"
+        else:
+            param = "unknown"
+
+        return f"{container}[{param}]"
+    except Exception:
+        return "unknown"
+
+
+def analyze_call(node: ast.Call) -> Optional[Dict]:
+    """Analyze function call expression"""
+    if isinstance(node.func, ast.Name):
+        # Simple function call func()
+        return {'type': 'simple', 'name': node.func.id}
+
+    elif isinstance(node.func, ast.Attribute):
+        # Attribute call obj.method()
+        if isinstance(node.func.value, ast.Name):
+            return {
+                'type': 'attribute',
+                'object': node.func.value.id,
+                'attribute': node.func.attr
+            }
+        # Nested attribute call module.sub.func()
+        return {
+            'type': 'nested_attribute',
+            'full_path': get_attribute_path(node.func)
+        }
+
+    return None
+
+
+def extract_function_calls(node: ast.FunctionDef) -> List[Dict]:
+    """Extract function calls from function body"""
+    calls = []
+
+    for subnode in ast.walk(node):
+        if isinstance(subnode, ast.Call):
+            call_info = analyze_call(subnode)
+            if call_info:
+                calls.append(call_info)
+
+    return calls
+
+
+def get_line_range(node: ast.AST) -> Dict:
+    """Get line range of AST node (AST line numbers start from 1, end line inclusive)"""
+    return {
+        'start_line': getattr(node, 'lineno', 0),
+        'end_line': getattr(node, 'end_lineno', None) or getattr(node, 'lineno', 0)
+    }
+
+
+class ComplexityVisitor(ast.NodeVisitor):
+    """
+    Collects complexity metrics of a module and of each function in one pass over the AST
+
+    Module metrics count every statement of the file. Function metrics only count the function's
+    own body, nested functions and classes get their own entry.
+    """
+
+    def __init__(self):
+        self.module = self._new_metrics()
+        self.module.update({'except_count': 0, 'max_def_indent': 0})
+        self.functions: Dict[int, Dict] = {}  # id(FunctionDef node) -> metrics
+        self._current: Optional[Dict] = None
+        self._depth = 0
+
+    @staticmethod
+    def _new_metrics() -> Dict:
+        return {'branch_count': 0, 'loop_count': 0, 'max_nesting': 0, 'cyclomatic_complexity': 1}
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        self.module[key] += amount
+        if self._current is not None:
+            self._current[key] += amount
+
+    def _decision(self, amount: int = 1) -> None:
+        self._count('cyclomatic_complexity', amount)
+
+    def _visit_block(self, node: ast.AST, children: Optional[List[ast.AST]] = None) -> None:
+        """Visit a statement whose body is nested one level deeper"""
+        self._depth += 1
+        self.module['max_nesting'] = max(self.module['max_nesting'], self._depth)
+        if self._current is not None:
+            self._current['max_nesting'] = max(self._current['max_nesting'], self._depth)
+        if children is None:
+            self.generic_visit(node)
+        else:
+            for child in children:
+                self.visit(child)
+        self._depth -= 1
+
+    def _visit_scope(self, node: ast.AST, metrics: Optional[Dict]) -> None:
+        outer, outer_depth = self._current, self._depth
+        self._current, self._depth = metrics, 0
+        self.generic_visit(node)
+        self._current, self._depth = outer, outer_depth
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.module['max_def_indent'] = max(self.module['max_def_indent'], node.col_offset)
+        metrics = self._new_metrics()
+        self.functions[id(node)] = metrics
+        self._visit_scope(node, metrics)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._visit_scope(node, None)
+
+    def visit_If(self, node: ast.If) -> None:
+        self._count('branch_count')
+        self._decision()
+        orelse = node.orelse
+        if len(orelse) == 1 and isinstance(orelse[0], ast.If) and orelse[0].col_offset == node.col_offset:
+            # An elif chain stays at the nesting depth of its first if
+            self._visit_block(node, [node.test] + node.body)
+            self.visit(orelse[0])
+        else:
+            self._visit_block(node)
+
+    def visit_IfExp(self, node: ast.IfExp) -> None:
+        self._count('branch_count')
+        self._decision()
+        self.generic_visit(node)
+
+    def visit_For(self, node: ast.AST) -> None:
+        self._count('loop_count')
+        self._decision()
+        self._visit_block(node)
+
+    visit_AsyncFor = visit_For
+    visit_While = visit_For
+
+    def visit_comprehension(self, node: ast.comprehension) -> None:
+        self._count('loop_count')
+        self._decision(1 + len(node.ifs))
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
+        self.module['except_count'] += 1
+        self._decision()
+        self.generic_visit(node)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> None:
+        self._decision(len(node.values) - 1)
+        self.generic_visit(node)
+
+    def visit_Try(self, node: ast.AST) -> None:
+        self._visit_block(node)
+
+    visit_TryStar = visit_Try
+    visit_With = visit_Try
+    visit_AsyncWith = visit_Try
+
+
+def _annotation_to_str(annotation: Optional[ast.AST]) -> Optional[str]:
+    """Convert a parameter or return annotation to its display string"""
+    if isinstance(annotation, ast.Name):
+        return annotation.id
+    elif isinstance(annotation, ast.Attribute):
+        return get_attribute_path(annotation)
+    elif isinstance(annotation, ast.Subscript):
+        return get_subscript_annotation(annotation)
+    return None
+
+
+def _process_imports(module_node: ast.Module) -> List[Dict]:
+    """Process import statements in the module"""
+    imports = []
+    for node in module_node.body:
+        if isinstance(node, ast.Import):
+            for name in node.names:
+                imports.append({
+                    'type': 'import',
+                    'name': name.name,
+                    'alias': name.asname
+                })
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ''
+            for name in node.names:
+                imports.append({
+                    'type': 'importfrom',
+                    'module': module,
+                    'name': name.name,
+                    'alias': name.asname,
+                    'level': node.level or 0  # Number of leading dots of a relative import
+                })
+    return imports
+
+
+def _process_function(record: Dict, node: ast.FunctionDef, module_id: str, class_id: Optional[str],
+                      metrics: Dict[int, Dict]) -> None:
+    """Process function or method definition into the record"""
+    function_name = node.name
+    if class_id:
+        function_id = f"{class_id}.{function_name}"
+        record['classes'][class_id]['methods'].append(function_id)
+    else:
+        function_id = f"{module_id}.{function_name}"
+        record['module']['functions'].append(function_id)
+
+    # Analyze function parameters
+    parameters = []
+    for arg in node.args.args:
+        parameters.append({
+            'name': arg.arg,
+            'type': _annotation_to_str(getattr(arg, 'annotation', None))
+        })
+
+    record['functions'][function_id] = {
+        'name': function_name,
+        'module': module_id,
+        'class': class_id,
+        'docstring': ast.get_docstring(node) or "",
+        'parameters': parameters,
+        'return_type': _annotation_to_str(getattr(node, 'returns', None)),
+        'calls': extract_function_calls(node),
+        'called_by': [],  # Will be populated when building call relationships
+        **get_line_range(node),
+        **metrics[id(node)]
+    }
+
+
+def parse_python_source(content: str, rel_path: str) -> Dict:
+    """
+    Parse the content of a single Python file into a parse record
+
+    Args:
+        content: File content
+        rel_path: Path relative to repository root
+
+    Returns:
+        Parse record with module, classes, functions and imports
+
+    Raises:
+        SyntaxError: If the file cannot be parsed
+    """
+    module_node = ast.parse(content, filename=rel_path)
+
+    complexity = ComplexityVisitor()
+    complexity.visit(module_node)
+
+    module_id = module_id_from_path(rel_path)
+    record = {
+        'kind': 'python',
+        'module_id': module_id,
+        'module': {
+            'path': rel_path,
+            'docstring': ast.get_docstring(module_node) or "",
+            'content': content,
+            'functions': [],
+            'classes': [],
+            'complexity': complexity.module
+        },
+        'classes': {},
+        'functions': {},
+        'imports': _process_imports(module_node)
+    }
+
+    # Parse functions and classes, methods are claimed by their class before the walk reaches them
+    claimed_methods = set()
+    for node in ast.walk(module_node):
+        # Process function definitions
+        if isinstance(node, ast.FunctionDef):
+            if id(node) not in claimed_methods:
+                _process_function(record, node, module_id, None, complexity.functions)
+
+        # Process class definitions
+        elif isinstance(node, ast.ClassDef):
+            class_id = f"{module_id}.{node.name}"
+
+            # Analyze class inheritance relationships
+            base_classes = []
+            for base in node.bases:
+                if isinstance(base, ast.Name):
+                    base_classes.append(base.id)
+                elif isinstance(base, ast.Attribute):
+                    base_classes.append(get_attribute_path(base))
+
+            record['classes'][class_id] = {
+                'name': node.name,
+                'module': module_id,
+                'docstring': ast.get_docstring(node) or "",
+                'methods': [],
+                'base_classes': base_classes,
+                **get_line_range(node)
+            }
+            record['module']['classes'].append(class_id)
+
+            # Process methods in the class
+            for class_node in node.body:
+                if isinstance(class_node, ast.FunctionDef):
+                    claimed_methods.add(id(class_node))
+                    _process_function(record, class_node, module_id, class_id, complexity.functions)
+
+    return record
+
+
+def parse_python_file(file_path: str, rel_path: str) -> Optional[Dict]:
+    """
+    Parse single Python file
+
+    Args:
+        file_path: Absolute path of the file
+        rel_path: Path relative to repository root
+
+    Returns:
+        Parse record, or None if the file could not be parsed
+    """
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return parse_python_source(content, rel_path)
+    except SyntaxError as e:
+        logger.warning(f"File {rel_path} has syntax errors: {e}")
+    except Exception as e:
+        logger.error(f"Error processing file {rel_path}: {e}")
+    return None
+
+
+def parse_other_file(file_path: str, rel_path: str) -> Optional[Dict]:
+    """
+    Parse non-Python files, including Jupyter Notebooks etc
+
+    Args:
+        file_path: Absolute path of the file
+        rel_path: Path relative to repository root
+
+    Returns:
+        Parse record, or None if the file could not be read
+    """
+    try:
+        if file_path.endswith('.ipynb'):
+            content = _parse_ipynb_file(file_path)
+        else:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+        # Create a simple module record for non-Python files
+        # Use file extension as "language" identifier
+        file_ext = os.path.splitext(file_path)[1][1:]  # Remove the dot
+        module_id = rel_path.replace('/', '.').replace('\\', '.').replace(f'.{file_ext}', '')
+
+        return {
+            'kind': 'other',
+            'module_id': module_id,
+            'other_file': {
+                'path': rel_path,
+                'docstring': f"Non-Python file: {file_ext.upper()} code",
+                'content': content,
+                'functions': [],
+                'classes': [],
+                'language': file_ext
+            }
+        }
+
+    except Exception as e:
+        logger.error(f"Error processing non-Python file {rel_path}: {e}")
+    return None
+
+
+def parse_file(file_path: str, rel_path: str) -> Optional[Dict]:
+    """Parse a repository file into a parse record, dispatching on file type"""
+    if file_path.endswith('.py'):
+        return parse_python_file(file_path, rel_path)
+    return parse_other_file(file_path, rel_path)
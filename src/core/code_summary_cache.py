@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Code summary cache - Structural summaries of source files, computed once per file content
+
+Summarizing a file builds a grep_ast TreeContext, which parses the whole file with tree-sitter,
+and one request may summarize the same file several times (different levels, fallbacks, other
+tools). Parsed contexts are kept per content hash and reset between uses, and finished summaries
+are kept per (kind, content hash, parameters), so a repeated summary is a dictionary lookup.
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from grep_ast import TreeContext
+
+logger = logging.getLogger(__name__)
+
+_SUMMARY_CACHE: Optional['CodeSummaryCache'] = None
+_SUMMARY_CACHE_LOCK = threading.Lock()
+
+
+def content_hash(source_code: str) -> bytes:
+    """Get the hash a source text is cached under"""
+    return hashlib.blake2b(source_code.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+
+
+def _language_key(filename: str) -> str:
+    """Part of a filename that selects the tree-sitter language"""
+    extension = os.path.splitext(filename)[1]
+    return extension or os.path.basename(filename)
+
+
+class CodeSummaryCache:
+    """Bounded LRU tables of parsed tree contexts and finished summaries"""
+
+    def __init__(self, max_summaries: int = 2048, max_contexts: int = 32):
+        """
+        Initialize empty cache
+
+        Args:
+            max_summaries: Maximum number of cached summaries
+            max_contexts: Maximum number of cached parsed files (each holds its tree-sitter nodes)
+        """
+        self.max_summaries = max_summaries
+        self.max_contexts = max_contexts
+        self._summaries: 'OrderedDict[Tuple, str]' = OrderedDict()
+        self._contexts: 'OrderedDict[Tuple[str, bytes], TreeContext]' = OrderedDict()
+        # Cached contexts are mutated while summarizing, summaries are computed one at a time
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self, kind: str, filename: str, source_code: str, params: Tuple[Hashable, ...],
+                compute: Callable[[], str]) -> str:
+        """
+        Get a summary of source code, computing it on the first request
+
+        Args:
+            kind: Name of the summary function (summaries of different kinds never share entries)
+            filename: File name, only its language matters
+            source_code: Source code summarized
+            params: Parameters of the summary function besides the source code
+            compute: Function computing the summary on a cache miss
+
+        Returns:
+            Summary text
+        """
+        key = (kind, _language_key(filename), content_hash(source_code), params)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                self.hits += 1
+                return summary
+
+            self.misses += 1
+            summary = compute()
+            self._summaries[key] = summary
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+            return summary
+
+    def tree_context(self, filename: str, source_code: str, child_context: bool = False) -> TreeContext:
+        """
+        Get a tree context of source code with no lines of interest, parsing the code on first use
+
+        All contexts use the options of the repository's summaries: no color, line numbers, margin
+        or marks, and no top-of-file parent scope.
+
+        Args:
+            filename: File name, selects the tree-sitter language
+            source_code: Source code
+            child_context: Whether added context includes child scopes
+
+        Returns:
+            Tree context, valid until the next call (it is shared and reset on every use)
+
+        Raises:
+            ValueError: If the language of the file is unknown
+        """
+        key = (_language_key(filename), content_hash(source_code))
+        with self._lock:
+            context = self._contexts.get(key)
+            if context is None:
+                context = TreeContext(
+                    filename,
+                    source_code,
+                    color=False,
+                    line_number=False,
+                    child_context=child_context,
+                    last_line=False,
+                    margin=0,
+                    mark_lois=False,
+                    loi_pad=0,
+                    show_top_of_file_parent_scope=False,
+                )
+                self._contexts[key] = context
+                while len(self._contexts) > self.max_contexts:
+                    self._contexts.popitem(last=False)
+            else:
+                self._contexts.move_to_end(key)
+
+            # Reset the state left by the previous summary
+            context.child_context = child_context
+            context.lines_of_interest = set()
+            context.show_lines = set()
+            context.output_lines = {}
+            return context
+
+    def clear(self) -> None:
+        """Drop all cached contexts and summaries"""
+        with self._lock:
+            self._summaries.clear()
+            self._contexts.clear()
+
+
+def get_summary_cache() -> CodeSummaryCache:
+    """Get the process-wide summary cache"""
+    global _SUMMARY_CACHE
+    if _SUMMARY_CACHE is None:
+        with _SUMMARY_CACHE_LOCK:
+            if _SUMMARY_CACHE is None:
+                _SUMMARY_CACHE = CodeSummaryCache()
+    return _SUMMARY_CACHE
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Code tree cache - Persists per-file parse records so repeated analyses of the same repository
+only re-parse files that changed
+
+Entries are keyed by relative path and validated by file size + mtime, falling back to a
+content hash when the stat information differs (e.g. after a fresh checkout).
+"""
+
+import os
+import hashlib
+import logging
+import pickle
+from typing import Dict, Optional
+
+from src.core.code_parser import PARSER_VERSION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.environ.get("CODE_TREE_CACHE_DIR", os.path.join("db", "code_tree_cache"))
+
+
+def hash_file_content(file_path: str) -> str:
+    """Compute content hash of a file"""
+    hasher = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class CodeTreeCache:
+    """On-disk cache of per-file parse records for one repository"""
+
+    def __init__(self, repo_path: str, cache_dir: Optional[str] = None):
+        """
+        Initialize code tree cache
+
+        Args:
+            repo_path: Path to the code repository
+            cache_dir: Directory holding cache files, defaults to DEFAULT_CACHE_DIR
+        """
+        self.repo_path = os.path.abspath(repo_path)
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        repo_key = hashlib.sha1(self.repo_path.encode('utf-8')).hexdigest()[:16]
+        self.cache_file = os.path.join(self.cache_dir, f"{repo_key}.pkl")
+
+        self.entries: Dict[str, Dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        """Load cache entries from disk, ignoring unreadable or outdated cache files"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') == PARSER_VERSION and data.get('repo_path') == self.repo_path:
+                self.entries = data.get('entries', {})
+                logger.info(f"Loaded code tree cache with {len(self.entries)} files: {self.cache_file}")
+        except Exception as e:
+            logger.warning(f"Unable to load code tree cache {self.cache_file}: {e}")
+            self.entries = {}
+
+    def get(self, rel_path: str, file_path: str) -> Optional[Dict]:
+        """
+        Get cached parse record of a file if it is still up to date
+
+        Args:
+            rel_path: Path relative to repository root
+            file_path: Absolute path of the file
+
+        Returns:
+            Cached parse record, or None on cache miss
+        """
+        entry = self.entries.get(rel_path)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            stat = os.stat(file_path)
+            if stat.st_size != entry['size']:
+                self.misses += 1
+                return None
+            if stat.st_mtime_ns != entry['mtime']:
+                # Same size but touched, compare content before re-parsing
+                if hash_file_content(file_path) != entry['hash']:
+                    self.misses += 1
+                    return None
+                entry['mtime'] = stat.st_mtime_ns
+                self._dirty = True
+        except OSError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return entry['record']
+
+    def put(self, rel_path: str, file_path: str, record: Optional[Dict]) -> None:
+        """
+        Store parse record of a file
+
+        Args:
+            rel_path: Path relative to repository root
+            file_path: Absolute path of the file
+            record: Parse record produced by the code parser
+        """
+        if record is None:
+            return
+        try:
+            stat = os.stat(file_path)
+            self.entries[rel_path] = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+                'hash': hash_file_content(file_path),
+                'record': record
+            }
+            self._dirty = True
+        except OSError as e:
+            logger.debug(f"Unable to cache parse record of {rel_path}: {e}")
+
+    def remove(self, rel_path: str) -> None:
+        """Drop the cached record of a file"""
+        if self.entries.pop(rel_path, None) is not None:
+            self._dirty = True
+
+    def save(self) -> None:
+        """Write cache to disk, pruning entries of files that no longer exist"""
+        for rel_path in list(self.entries):
+            if not os.path.exists(os.path.join(self.repo_path, rel_path)):
+                del self.entries[rel_path]
+                self._dirty = True
+
+        if not self._dirty:
+            return
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({
+                    'version': PARSER_VERSION,
+                    'repo_path': self.repo_path,
+                    'entries': self.entries
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self.cache_file)
+            self._dirty = False
+            logger.info(f"Code tree cache saved ({self.hits} hits, {self.misses} misses): {self.cache_file}")
+        except Exception as e:
+            logger.warning(f"Unable to save code tree cache {self.cache_file}: {e}")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+"""
+Code tree store - Versioned binary file holding a parsed code tree, opened through mmap
+
+Layout:
+    magic (8 bytes) | format version (uint32) | reserved (uint32)
+    section data and source blobs, back to back
+    header (JSON): section table {name: [offset, length]} and store metadata
+    trailer: header offset (uint64) | header length (uint64)
+
+Sections are pickled and only unpickled when requested. Module and file contents are stored as
+separate UTF-8 blobs addressed by (offset, length), so opening a large repository index only reads
+the header and the small metadata sections; content is faulted in per module on first access.
+"""
+
+import os
+import json
+import mmap
+import pickle
+import struct
+import logging
+from typing import Any, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+STORE_MAGIC = b'RMCTREE\x00'
+STORE_VERSION = 1
+
+_PREAMBLE = struct.Struct('<8sII')
+_TRAILER = struct.Struct('<QQ')
+
+
+class CodeTreeStoreWriter:
+    """Writes sections and blobs of a code tree store"""
+
+    def __init__(self, path: str):
+        """
+        Open store file for writing
+
+        Args:
+            path: Output file path, written atomically on close()
+        """
+        self.path = path
+        self.tmp_path = f"{path}.{os.getpid()}.tmp"
+        self.sections: Dict[str, Tuple[int, int]] = {}
+        self._file = open(self.tmp_path, 'wb')
+        self._file.write(_PREAMBLE.pack(STORE_MAGIC, STORE_VERSION, 0))
+
+    def add_section(self, name: str, value: Any) -> None:
+        """Append a pickled section"""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.sections[name] = (self._file.tell(), len(data))
+        self._file.write(data)
+
+    def add_blob(self, text: Union[str, bytes]) -> Tuple[int, int]:
+        """Append a text blob (str, or bytes already encoded) and return its (offset, length)"""
+        data = text if isinstance(text, bytes) else text.encode('utf-8', errors='surrogatepass')
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset, len(data)
+
+    def close(self, metadata: Optional[Dict] = None) -> None:
+        """Write header and trailer, then move the file into place"""
+        header = json.dumps({
+            'version': STORE_VERSION,
+            'sections': self.sections,
+            'metadata': metadata or {}
+        }).encode('utf-8')
+        header_offset = self._file.tell()
+        self._file.write(header)
+        self._file.write(_TRAILER.pack(header_offset, len(header)))
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Discard a partially written store"""
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class CodeTreeStore:
+    """Read access to a code tree store through a memory map"""
+
+    def __init__(self, path: str):
+        """
+        Open store file
+
+        Args:
+            path: Store file path
+
+        Raises:
+            ValueError: If the file is not a store of the supported version
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"Empty code tree store: {path}")
+
+        magic, version, _ = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported code tree store {path} (version {version})")
+
+        header_offset, header_length = _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        header = json.loads(self._mm[header_offset:header_offset + header_length].decode('utf-8'))
+        self.sections: Dict[str, Tuple[int, int]] = {name: tuple(span) for name, span in header['sections'].items()}
+        self.metadata: Dict = header.get('metadata', {})
+        self._loaded: Dict[str, Any] = {}
+
+    def load_section(self, name: str) -> Any:
+        """Unpickle a section, once"""
+        if name not in self._loaded:
+            offset, length = self.sections[name]
+            self._loaded[name] = pickle.loads(self._mm[offset:offset + length])
+        return self._loaded[name]
+
+    def read_blob(self, offset: int, length: int) -> str:
+        """Decode a text blob"""
+        return self._mm[offset:offset + length].decode('utf-8', errors='surrogatepass')
+
+    def read_blob_bytes(self, offset: int, length: int) -> bytes:
+        """Read the encoded bytes of a text blob"""
+        return self._mm[offset:offset + length]
+
+    def close(self) -> None:
+        """Release the memory map"""
+        try:
+            self._mm.close()
+        except Exception:
+            pass
+        self._file.close()
+
+
+class BlobRecord(dict):
+    """
+    Module or file record whose 'content' entry is read from the store on first access
+
+    Behaves like a record holding a 'content' key for item access, get() and membership tests.
+    Copies and pickles turn into plain dictionaries with the content included.
+    """
+
+    __slots__ = ('_store', '_blob')
+
+    def __init__(self, data: Dict, store: CodeTreeStore, blob: Tuple[int, int]):
+        super().__init__(data)
+        self._store = store
+        self._blob = blob
+
+    def __missing__(self, key):
+        if key == 'content':
+            content = self._store.read_blob(*self._blob)
+            dict.__setitem__(self, 'content', content)
+            return content
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key == 'content' or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == 'content':
+            return self['content']
+        return super().get(key, default)
+
+    def content_data(self) -> Union[str, bytes]:
+        """Get content for writing into another store, encoded bytes if it was never loaded"""
+        if dict.__contains__(self, 'content'):
+            return dict.__getitem__(self, 'content')
+        return self._store.read_blob_bytes(*self._blob)
+
+    def __reduce__(self):
+        data = dict(self)
+        data['content'] = self['content']
+        return (dict, (data,))
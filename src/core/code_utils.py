@@ -1,20 +1,20 @@
 import re
 import os
-import tiktoken
 import subprocess
-from grep_ast import TreeContext
 from autogen.oai import OpenAIWrapper
 from autogen.code_utils import create_virtual_env
 
 from typing import Annotated
 import json
+
+from src.core.token_counter import get_token_counter
+from src.core.code_summary_cache import get_summary_cache
 ignored_dirs = ['__pycache__', '.git', '.vscode', 'venv', 'env', 'node_modules', '.pytest_cache', 'build', 'dist', '.github', 'logs']
 ignored_file_patterns = [r'.*\.pyc$', r'.*\.pyo$', r'.*\.pyd$', r'.*\.so$', r'.*\.dll$', r'.*\.class$', r'.*\.egg-info$', r'.*~$', r'.*\.swp$']
 
     
 def get_code_abs_token(content):
-    encoding = tiktoken.encoding_for_model("gpt-4o")
-    return len(encoding.encode(content))
+    return get_token_counter().count(content)
 
 def should_ignore_path(path: str) -> bool:
     """Determine whether a given path should be ignored"""
@@ -61,21 +61,15 @@ def should_ignore_path(path: str) -> bool:
     return False
 
 def _get_code_abs(filename, source_code, max_token=3000, child_context=False):
-    # import pdb;pdb.set_trace()
-    
-    context = TreeContext(
-        filename,
-        source_code,
-        color=False,
-        line_number=False,  # Show line numbers
-        child_context=child_context,  # Don't show child context
-        last_line=False,
-        margin=0,  # Don't set margins
-        mark_lois=False,  # Don't mark lines of interest
-        loi_pad=0,
-        show_top_of_file_parent_scope=False,
+    # Summaries are cached by content, the file is parsed once for all summaries of it
+    cache = get_summary_cache()
+    return cache.summary(
+        'code_abs', filename, source_code, (max_token, child_context),
+        lambda: _summarize_tree_context(cache.tree_context(filename, source_code, child_context=child_context))
     )
 
+def _summarize_tree_context(context):
+    """Summarize a parsed file to its definitions, docstrings and leading imports"""
 
     structure_lines = []
     important_lines = []
@@ -243,78 +237,59 @@ def get_pip_install_command(execute_result):
     )
     
 
+# Initial characters per kept token when slicing the head and tail windows of long logs
+LOG_WINDOW_CHARS_PER_TOKEN = 8
+# Extra tokens encoded past the kept ones, so tokens split at a window edge are never kept
+LOG_WINDOW_MARGIN_TOKENS = 16
+
+
+def _encode_log_window(encoding, logs_all, needed, from_end):
+    """
+    Encode a head or tail window of a log, growing it until it holds the needed tokens
+
+    Returns:
+        Tokens of the window, None if the window would cover half of the log
+    """
+    window = max(needed * LOG_WINDOW_CHARS_PER_TOKEN, 1)
+    while 2 * window < len(logs_all):
+        tokens = encoding.encode(logs_all[-window:] if from_end else logs_all[:window])
+        if len(tokens) >= needed + LOG_WINDOW_MARGIN_TOKENS:
+            return tokens
+        window *= 4
+    return None
+
+
 def cut_logs_by_token(logs_all, max_token: int = 4000):
     """
     Cut logs based on token count limit, keeping half at head and half at tail
-    If logs are single line or few long lines, truncate text directly
-    """    
-    if get_code_abs_token(logs_all) <= max_token:
+
+    Short logs are measured exactly. Long logs are never tokenized as a whole: only a head and
+    a tail window are encoded, each sized to hold half of the token budget, so the cost does
+    not depend on the log size and the result stays within the budget.
+    """
+    # Every token covers at least one UTF-8 byte, and a character takes at most four
+    if len(logs_all) * 4 <= max_token:
         return logs_all
 
-    encoding = tiktoken.encoding_for_model("gpt-4o")
-    
-    # Cut logs
-    logs_lines = logs_all.strip().split('\n')
-    
-    # if len(logs_lines) == 1 or (len(logs_lines) < 5 and get_code_abs_token(logs_all) / len(logs_lines) > max_token / 2):
-    # Process single long text directly by characters
-    tokens = encoding.encode(logs_all)
-    
-    half_token = max_token // 2
-    head_tokens = tokens[:half_token]
-    tail_tokens = tokens[-half_token:]
-    
-    head_text = encoding.decode(head_tokens)
-    tail_text = encoding.decode(tail_tokens)
-    
-    return f"{head_text}\n\n>>> ...omitted content... <<<\n\n{tail_text}"
-    
-    # Allocate token quota, half for head and half for tail
-    half_token = max_token // 2
-    
-    # Keep head
-    head_lines = []
-    head_tokens = 0
-    for line in logs_lines:
-        line_tokens = get_code_abs_token(line) + 1  # +1 for newline
-        if head_tokens + line_tokens > half_token:
-            break
-        head_lines.append(line)
-        head_tokens += line_tokens
-    
-    # Keep tail
-    tail_lines = []
-    tail_tokens = 0
-    for line in reversed(logs_lines):
-        line_tokens = get_code_abs_token(line) + 1  # +1 for newline
-        if tail_tokens + line_tokens > half_token:
-            break
-        tail_lines.insert(0, line)  # Insert at beginning of list
-        tail_tokens += line_tokens
-    
-    # Combine results
-    result_lines = []
-    result_lines.extend(head_lines)
-    
-    # If there are omitted lines between head and tail, add omission indicator
-    if len(head_lines) + len(tail_lines) < len(logs_lines):
-        result_lines.append("\n>>> ...omitted logs... <<<\n")
-    
-    # Ensure tail lines are not duplicated
-    for line in tail_lines:
-        if line not in head_lines[-len(tail_lines):]:
-            result_lines.append(line)
-    cut_logs = '\n'.join(result_lines)
-    
-    # Final check to ensure it doesn't exceed maximum limit
-    if get_code_abs_token(cut_logs) > max_token*1.5:
-        # If still too long, truncate directly
-        encoding = tiktoken.encoding_for_model("gpt-4o")
-        tokens = encoding.encode(cut_logs)
-        cut_logs = encoding.decode(tokens[:max_token])
-        cut_logs += "\n\n>>> ...truncated content... <<<\n\n"
+    encoding = get_token_counter()
+    omitted_marker = "\n\n>>> ...omitted content... <<<\n\n"
+    # Head and tail share what the omission marker leaves of the budget
+    half_token = max(max_token - encoding.count(omitted_marker), 0) // 2
 
-    return cut_logs
+    head_tokens = _encode_log_window(encoding, logs_all, half_token, from_end=False)
+    tail_tokens = _encode_log_window(encoding, logs_all, half_token, from_end=True) if head_tokens is not None else None
+    # Disjoint windows holding more tokens than the budget prove the log is over it
+    if head_tokens is None or tail_tokens is None or len(head_tokens) + len(tail_tokens) <= max_token:
+        # The log is short enough to encode in full
+        tokens = encoding.encode(logs_all)
+        if len(tokens) <= max_token:
+            return logs_all
+        head_tokens, tail_tokens = tokens, tokens
+
+    head_text = encoding.decode(head_tokens[:half_token])
+    tail_text = encoding.decode(tail_tokens[len(tail_tokens) - half_token:])
+    
+    return f"{head_text}{omitted_marker}{tail_text}"
 
 def cut_execute_result_by_token(logs_all, max_token: int = 4000):
     """
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Compact symbol tables - Columnar, read-only storage for class and function records
+
+A table stores one column per record field instead of one dictionary per record. Strings are
+interned in a shared string table and referenced by integer ids, repeated small dictionaries
+(calls, parameters) are stored once, and list fields (calls, called_by, methods...) are kept as
+array-backed adjacency (offsets + ids). Records are exposed as read-only mapping views, so code
+written against the dict-of-dicts tables keeps working unchanged.
+"""
+
+from array import array
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+_MISSING = object()
+
+
+class StringTable:
+    """Interned strings referenced by integer id, -1 stands for None"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        """Get id of a string, adding it to the table if needed"""
+        if value is None:
+            return -1
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self.ids[value] = string_id
+        return string_id
+
+    def get(self, string_id: int) -> Optional[str]:
+        """Get string of an id"""
+        return None if string_id < 0 else self.strings[string_id]
+
+    def freeze(self) -> None:
+        """Drop the lookup map once all tables sharing this string table are built"""
+        self.ids = {}
+
+
+class ItemTable:
+    """Interned small dictionaries (e.g. call or parameter records) referenced by integer id"""
+
+    def __init__(self):
+        self.items: List[tuple] = []
+        self.ids: Dict[tuple, int] = {}
+
+    def intern(self, value: Dict) -> int:
+        """Get id of a dictionary, adding it to the table if needed"""
+        key = tuple(value.items())
+        item_id = self.ids.get(key)
+        if item_id is None:
+            item_id = len(self.items)
+            self.items.append(key)
+            self.ids[key] = item_id
+        return item_id
+
+    def get(self, item_id: int) -> Dict:
+        """Get a fresh dictionary of an id"""
+        return dict(self.items[item_id])
+
+    def freeze(self) -> None:
+        """Drop the lookup map once all tables sharing this item table are built"""
+        self.ids = {}
+
+
+def _field_codec(values: List[Any]) -> str:
+    """Choose storage of a column from its values"""
+    if any(value is _MISSING for value in values):
+        return 'object'
+    if all(value is None or isinstance(value, str) for value in values):
+        return 'str'
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return 'int'
+    if all(isinstance(value, list) for value in values):
+        elements = [element for value in values for element in value]
+        if all(element is None or isinstance(element, str) for element in elements):
+            return 'str_list'
+        if all(isinstance(element, dict) for element in elements):
+            try:
+                for element in elements:
+                    hash(tuple(element.items()))
+                return 'item_list'
+            except TypeError:
+                return 'object'
+    return 'object'
+
+
+class CompactRecordTable(Mapping):
+    """Read-only mapping from entity ID to a compact record view"""
+
+    def __init__(self, records: Dict[str, Dict], source_loader: Optional[Callable] = None,
+                 strings: Optional[StringTable] = None, items: Optional[ItemTable] = None):
+        """
+        Build compact table
+
+        Args:
+            records: Entity ID -> record dictionary
+            source_loader: Callable materializing the 'source' of a record from its line range
+            strings: String table shared with other tables
+            items: Item table shared with other tables
+        """
+        self.source_loader = source_loader
+        self.strings = strings or StringTable()
+        self.item_table = items or ItemTable()
+
+        self._ids = array('i', (self.strings.intern(record_id) for record_id in records))
+        self._index = {record_id: idx for idx, record_id in enumerate(records)}
+
+        # Field order of the first record, fields of later records are appended as seen
+        self._fields: List[str] = []
+        for record in records.values():
+            for key in record:
+                if key not in self._fields:
+                    self._fields.append(key)
+
+        self._codecs: Dict[str, str] = {}
+        self._columns: Dict[str, Any] = {}
+        for field in self._fields:
+            self._store_column(field, [record.get(field, _MISSING) for record in records.values()])
+
+    def _store_column(self, field: str, values: List[Any]) -> None:
+        """Encode one column"""
+        codec = _field_codec(values)
+        self._codecs[field] = codec
+
+        if codec == 'str':
+            self._columns[field] = array('i', (self.strings.intern(value) for value in values))
+        elif codec == 'int':
+            self._columns[field] = array('q', values)
+        elif codec in ('str_list', 'item_list'):
+            intern = self.strings.intern if codec == 'str_list' else self.item_table.intern
+            offsets = array('I', [0])
+            ids = array('i')
+            for value in values:
+                ids.extend(intern(element) for element in value)
+                offsets.append(len(ids))
+            self._columns[field] = (offsets, ids)
+        else:
+            self._columns[field] = values
+
+    def _get_field(self, idx: int, field: str) -> Any:
+        """Decode one field of one record"""
+        codec = self._codecs[field]
+        column = self._columns[field]
+
+        if codec == 'str':
+            return self.strings.get(column[idx])
+        elif codec == 'int':
+            return column[idx]
+        elif codec == 'str_list':
+            offsets, ids = column
+            return [self.strings.get(string_id) for string_id in ids[offsets[idx]:offsets[idx + 1]]]
+        elif codec == 'item_list':
+            offsets, ids = column
+            return [self.item_table.get(item_id) for item_id in ids[offsets[idx]:offsets[idx + 1]]]
+        return column[idx]
+
+    def _has_field(self, idx: int, field: str) -> bool:
+        """Check whether a record holds a field"""
+        if field not in self._codecs:
+            return False
+        return self._codecs[field] != 'object' or self._columns[field][idx] is not _MISSING
+
+    def __getitem__(self, record_id: str) -> 'CompactRecord':
+        return CompactRecord(self, self._index[record_id])
+
+    def __contains__(self, record_id) -> bool:
+        return record_id in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def record_id(self, idx: int) -> str:
+        """Get entity ID of a row"""
+        return self.strings.get(self._ids[idx])
+
+    def to_dicts(self) -> Dict[str, Dict]:
+        """Expand table back into plain record dictionaries (without materialized source)"""
+        return {record_id: self[record_id].to_dict(include_source=False) for record_id in self._index}
+
+
+class CompactRecord(Mapping):
+    """Read-only view of one row of a CompactRecordTable"""
+
+    __slots__ = ('_table', '_idx')
+
+    def __init__(self, table: CompactRecordTable, idx: int):
+        self._table = table
+        self._idx = idx
+
+    def __getitem__(self, key: str) -> Any:
+        table = self._table
+        if table._has_field(self._idx, key):
+            return table._get_field(self._idx, key)
+        if key == 'source' and table.source_loader is not None:
+            return table.source_loader(self)
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._table._has_field(self._idx, key) or (key == 'source' and self._table.source_loader is not None)
+
+    def __iter__(self) -> Iterator[str]:
+        return (field for field in self._table._fields if self._table._has_field(self._idx, field))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self, include_source: bool = True) -> Dict:
+        """Convert to plain dictionary"""
+        data = {key: self[key] for key in self}
+        if include_source and 'source' not in data and 'source' in self:
+            data['source'] = self['source']
+        return data
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+    def __repr__(self) -> str:
+        return f"CompactRecord({self._table.record_id(self._idx)!r})"
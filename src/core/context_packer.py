@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Context packer - Fills a prompt token budget with text fragments, tokenizing each fragment once
+
+Prompt builders used to re-tokenize everything collected so far before adding the next fragment,
+which is quadratic in the size of the output. The packer keeps a running total of fragment token
+counts instead. The total of the parts is a close estimate of the tokens of the joined text
+(tokens rarely merge across the separators between fragments).
+"""
+
+import logging
+from typing import List, Optional, Sequence
+
+from src.core.token_counter import TokenCounter, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Token budgets of knapsack selection are bucketed to at most this many steps
+KNAPSACK_RESOLUTION = 1000
+# Builders whose candidates are expensive to render stop collecting candidates at this multiple of the budget
+CANDIDATE_POOL_FACTOR = 2
+
+
+class ContextPacker:
+    """Text fragments collected under a running token budget"""
+
+    def __init__(self, max_tokens: int, counter: Optional[TokenCounter] = None, separator: str = "\n"):
+        """
+        Initialize empty packer
+
+        Args:
+            max_tokens: Token budget
+            counter: Token counter, defaults to the shared counter of the default model
+            separator: String the fragments are joined with
+        """
+        self.max_tokens = max_tokens
+        self.counter = counter or get_token_counter()
+        self.separator = separator
+        self.separator_tokens = self.counter.count(separator)
+        self.fragments: List[str] = []
+        self.used = 0
+
+    def __len__(self) -> int:
+        return len(self.fragments)
+
+    @property
+    def remaining(self) -> int:
+        """Tokens left in the budget, negative once forced fragments overran it"""
+        return self.max_tokens - self.used
+
+    @property
+    def is_full(self) -> bool:
+        return self.used >= self.max_tokens
+
+    def cost(self, text: str) -> int:
+        """Get the tokens adding a fragment would use, including its separator"""
+        return self.counter.count(text) + (self.separator_tokens if self.fragments else 0)
+
+    def fits(self, text: str) -> bool:
+        """Check whether a fragment fits in the remaining budget"""
+        return self.cost(text) <= self.remaining
+
+    def add(self, text: str, force: bool = False) -> bool:
+        """
+        Add a fragment if it fits in the remaining budget
+
+        Args:
+            text: Fragment
+            force: Add the fragment even if it does not fit (e.g. headers that are always included)
+
+        Returns:
+            Whether the fragment was added
+        """
+        cost = self.cost(text)
+        if not force and cost > self.remaining:
+            return False
+        self.fragments.append(text)
+        self.used += cost
+        return True
+
+    def add_best(self, fragments: Sequence[str], values: Sequence[float], strategy: str = 'greedy') -> List[int]:
+        """
+        Add the fragments that best fill the remaining budget, keeping their input order
+
+        Args:
+            fragments: Candidate fragments
+            values: Importance of each fragment
+            strategy: Selection strategy, see select_fragments
+
+        Returns:
+            Indices of the added fragments
+        """
+        # Every candidate is charged a separator, so the chosen set fits whatever its order
+        costs = [tokens + self.separator_tokens for tokens in self.counter.count_many(list(fragments))]
+        chosen = select_fragments(costs, values, max(self.remaining, 0), strategy)
+        for idx in chosen:
+            self.add(fragments[idx], force=True)
+        return chosen
+
+    def text(self) -> str:
+        """Get the packed fragments joined into one string"""
+        return self.separator.join(self.fragments)
+
+
+def select_fragments(costs: Sequence[int], values: Sequence[float], max_tokens: int,
+                     strategy: str = 'greedy') -> List[int]:
+    """
+    Choose fragments that fit a token budget
+
+    Args:
+        costs: Token count of each fragment
+        values: Importance of each fragment
+        max_tokens: Token budget
+        strategy: 'greedy' takes fragments by importance per token while they fit, 'knapsack'
+            maximizes the total importance (0/1 knapsack over bucketed token counts)
+
+    Returns:
+        Indices of the chosen fragments in input order
+    """
+    if strategy == 'greedy':
+        order = sorted(range(len(costs)), key=lambda i: values[i] / max(costs[i], 1), reverse=True)
+        chosen, used = [], 0
+        for i in order:
+            if used + costs[i] <= max_tokens:
+                chosen.append(i)
+                used += costs[i]
+        return sorted(chosen)
+
+    if strategy != 'knapsack':
+        raise ValueError(f"Unknown packing strategy: {strategy}")
+
+    # Costs are rounded up to buckets, so the chosen fragments never exceed the budget
+    bucket = max(1, -(-max_tokens // KNAPSACK_RESOLUTION))
+    capacity = max_tokens // bucket
+    weights = [-(-cost // bucket) for cost in costs]
+
+    best = [0.0] * (capacity + 1)
+    taken = []  # Per fragment: capacities at which it improved the best value
+    for i, weight in enumerate(weights):
+        improved = set()
+        if values[i] > 0:
+            for c in range(capacity, weight - 1, -1):
+                candidate = best[c - weight] + values[i]
+                if candidate > best[c]:
+                    best[c] = candidate
+                    improved.add(c)
+        taken.append(improved)
+
+    chosen, c = [], capacity
+    for i in range(len(weights) - 1, -1, -1):
+        if c in taken[i]:
+            chosen.append(i)
+            c -= weights[i]
+    return sorted(chosen)
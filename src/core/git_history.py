@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Git history index - Per-file commit counts and last commit times from a single `git log` pass
+
+Scoring files by history used to cost two git processes per file. The index streams the log of a
+repository once (`git log --name-only`) and answers per-file questions from a table. Tables are
+cached per repository path for the latest HEAD commit seen, so analyses of an unchanged checkout
+reuse them.
+"""
+
+import os
+import time
+import logging
+import subprocess
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks the start of a commit in the log output (NUL, written by git as %x00), followed by the commit time
+_COMMIT_MARKER = '\x00'
+_LOG_FORMAT = '--format=%x00%at'
+
+# Absolute repository path -> index of its latest HEAD, least recently used first
+_INDEX_CACHE: 'OrderedDict[str, GitHistoryIndex]' = OrderedDict()
+_INDEX_CACHE_SIZE = 8
+
+
+class GitHistoryIndex:
+    """Commit count and last commit time of every file touched in the history of a repository"""
+
+    def __init__(self, repo_path: str, head: Optional[str] = None):
+        """
+        Initialize empty history index
+
+        Args:
+            repo_path: Path to the code repository (may be a subdirectory of the git work tree)
+            head: HEAD commit the index describes, None outside of git repositories
+        """
+        self.repo_path = repo_path
+        self.head = head
+        self.commit_counts: Dict[str, int] = {}
+        self.last_commit_times: Dict[str, int] = {}
+
+    @classmethod
+    def for_repository(cls, repo_path: str) -> 'GitHistoryIndex':
+        """
+        Get the history index of a repository, building it on first use for the current HEAD
+
+        Args:
+            repo_path: Path to the code repository
+
+        Returns:
+            History index, empty if the path is not inside a git work tree
+        """
+        repo_path = os.path.abspath(repo_path)
+        head = cls._read_head(repo_path)
+        if head is None:
+            return cls(repo_path)
+
+        index = _INDEX_CACHE.get(repo_path)
+        if index is None or index.head != head:
+            # An index of an older HEAD is replaced, not kept next to the new one
+            index = cls(repo_path, head)
+            index.build()
+            _INDEX_CACHE[repo_path] = index
+        _INDEX_CACHE.move_to_end(repo_path)
+        while len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+        return index
+
+    @staticmethod
+    def _read_head(repo_path: str) -> Optional[str]:
+        """Get HEAD sha, None if git is unavailable or the path is not in a repository with commits"""
+        try:
+            result = subprocess.run(['git', '-C', repo_path, 'rev-parse', 'HEAD'],
+                                    capture_output=True, text=True, check=False)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip() or None
+
+    def build(self) -> None:
+        """Stream the log once and fill the per-file tables"""
+        start_time = time.time()
+        # Paths are reported relative to repo_path and limited to it, like `git log -- <rel_path>`
+        cmd = ['git', '-c', 'core.quotepath=off', '-C', self.repo_path, 'log', '--relative',
+               '--name-only', _LOG_FORMAT, '--', '.']
+        commit_counts = {}
+        last_commit_times = {}
+        try:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                  text=True, encoding='utf-8', errors='replace') as process:
+                commit_time = 0
+                for line in process.stdout:
+                    line = line.rstrip('\n')
+                    if not line:
+                        continue
+                    if line.startswith(_COMMIT_MARKER):
+                        try:
+                            commit_time = int(line[len(_COMMIT_MARKER):])
+                        except ValueError:
+                            commit_time = 0
+                        continue
+                    rel_path = os.path.normpath(line)
+                    commit_counts[rel_path] = commit_counts.get(rel_path, 0) + 1
+                    if commit_time > last_commit_times.get(rel_path, 0):
+                        last_commit_times[rel_path] = commit_time
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Failed to read git history of {self.repo_path}: {e}")
+            return
+
+        self.commit_counts = commit_counts
+        self.last_commit_times = last_commit_times
+        logger.info(f"Git history indexed in {time.time() - start_time:.2f}s: "
+                    f"{len(commit_counts)} files at {self.head[:12] if self.head else 'no HEAD'}")
+
+    def file_importance(self, rel_path: str, now: Optional[float] = None) -> float:
+        """
+        Score a file by how often and how recently it was committed
+
+        Args:
+            rel_path: Path relative to the repository path
+            now: Reference time, defaults to the current time
+
+        Returns:
+            Importance score (0.0 - 1.0)
+        """
+        rel_path = os.path.normpath(rel_path)
+        commit_count = self.commit_counts.get(rel_path, 0)
+        if not commit_count:
+            return 0.0
+
+        # Calculate score based on commit count
+        score = min(commit_count / 20.0, 1.0)
+
+        last_commit_time = self.last_commit_times.get(rel_path)
+        if last_commit_time:
+            days_since_last_commit = ((now or time.time()) - last_commit_time) / (60 * 60 * 24)
+
+            # Recently modified files may be more important, combine with commit count
+            recency_score = max(0, 1.0 - (days_since_last_commit / 365))
+            score = (score * 0.7) + (recency_score * 0.3)
+
+        return score
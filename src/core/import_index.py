@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Reverse import index - Answers "which modules import X" with a dictionary lookup
+
+Import records are indexed under the dotted name of the module they import when a module is
+added. Relative imports (`from . import x`, `from ..utils import y`) are resolved against the
+package of the importing module. `from . import x` imports the submodule `x` if the package has
+one and a name of the package otherwise; such records are indexed under both names and resolved
+against the known modules at query time, so modules parsed after their importers still count. The
+index keeps a forward map as well, so a module's entries can be replaced when its file is re-parsed.
+
+Example (`pkg/a.py` containing `from . import x`):
+
+>>> modules = {'pkg.__init__': {}, 'pkg.a': {}, 'pkg.x': {}}
+>>> index = ImportIndex({'pkg.a': [{'type': 'importfrom', 'module': '', 'name': 'x', 'level': 1}]}, modules)
+>>> [importer for importer, _ in index.importers_of('pkg.x')]
+['pkg.a']
+>>> index.importers_of('pkg.__init__')
+[]
+>>> sorted(index.imported_modules('pkg.a', modules))
+['pkg.x']
+>>> del modules['pkg.x']
+>>> [importer for importer, _ in index.importers_of('pkg.__init__')]
+['pkg.a']
+"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+
+def _relative_base(importer_id: str, imp: Dict) -> Optional[List[str]]:
+    """Get the parts of the package a relative import reads from, None if it reaches above the repository root"""
+    # The package of 'pkg.mod' and of 'pkg.__init__' is 'pkg', each further level goes one package up
+    package = importer_id.split('.')[:-1]
+    level = imp['level']
+    if level - 1 > len(package):
+        return None
+    package = package[:len(package) - (level - 1)]
+    return package + (imp['module'].split('.') if imp['module'] else [])
+
+
+def relative_submodule(importer_id: str, imp: Dict) -> Optional[str]:
+    """
+    Get the submodule a relative from-import names, if the imported name is a module
+
+    Args:
+        importer_id: ID of the importing module
+        imp: Import record
+
+    Returns:
+        Dotted name of the submodule (e.g. 'pkg.x' for `from . import x` in 'pkg.a'), None for
+        other records
+    """
+    if imp['type'] != 'importfrom' or not imp.get('level') or imp.get('name') in (None, '', '*'):
+        return None
+    base = _relative_base(importer_id, imp)
+    if base is None:
+        return None
+    return '.'.join(base + [imp['name']])
+
+
+def is_known_module(name: str, known_modules: Mapping) -> bool:
+    """Check whether a dotted name is a module or package of known_modules"""
+    return name in known_modules or f"{name}.__init__" in known_modules
+
+
+def resolve_import_target(importer_id: str, imp: Dict, known_modules: Optional[Mapping] = None) -> Optional[str]:
+    """
+    Get the dotted name of the module an import record imports from
+
+    Args:
+        importer_id: ID of the importing module
+        imp: Import record ('import' or 'importfrom')
+        known_modules: Module information dictionary, relative from-imports of submodules in it
+            resolve to the submodule instead of its package
+
+    Returns:
+        Dotted module name, None if a relative import reaches above the repository root
+    """
+    if imp['type'] == 'import':
+        return imp['name']
+
+    level = imp.get('level', 0)
+    if not level:
+        return imp['module']
+
+    if known_modules is not None:
+        submodule = relative_submodule(importer_id, imp)
+        if submodule and is_known_module(submodule, known_modules):
+            return submodule
+
+    base = _relative_base(importer_id, imp)
+    if base is None:
+        return None
+    return '.'.join(base) or None
+
+
+class ImportIndex:
+    """Module name -> import records of the modules importing it"""
+
+    def __init__(self, imports: Optional[Dict[str, List[Dict]]] = None, known_modules: Optional[Mapping] = None):
+        """
+        Build index
+
+        Args:
+            imports: Import information dictionary (module ID -> import records)
+            known_modules: Module information dictionary, read at query time to tell submodule imports
+                from package imports (the index sees later additions to it)
+        """
+        self.known_modules = known_modules
+        self.importers: Dict[str, List[Tuple[str, Dict]]] = defaultdict(list)
+        self.targets: Dict[str, Set[str]] = {}  # Importing module ID -> candidate imported module names
+        self.records: Dict[str, List[Dict]] = {}  # Importing module ID -> import records
+        for module_id, imports_list in (imports or {}).items():
+            self.add_module(module_id, imports_list)
+
+    def add_module(self, module_id: str, imports_list: Iterable[Dict]) -> None:
+        """Index the imports of a module, replacing earlier entries of the same module"""
+        self.remove_module(module_id)
+        records = list(imports_list)
+        targets = set()
+        for imp in records:
+            # Relative from-imports are indexed under the submodule as well, _resolve picks one when queried
+            for target in {resolve_import_target(module_id, imp), relative_submodule(module_id, imp)}:
+                if target:
+                    self.importers[target].append((module_id, imp))
+                    targets.add(target)
+        self.targets[module_id] = targets
+        self.records[module_id] = records
+
+    def remove_module(self, module_id: str) -> None:
+        """Drop the imports of a module"""
+        self.records.pop(module_id, None)
+        for target in self.targets.pop(module_id, ()):
+            entries = [entry for entry in self.importers[target] if entry[0] != module_id]
+            if entries:
+                self.importers[target] = entries
+            else:
+                del self.importers[target]
+
+    @staticmethod
+    def _names(module_id: str) -> List[str]:
+        """Names a module is imported by, a package's __init__ module is imported by the package name"""
+        if module_id.endswith('.__init__'):
+            return [module_id, module_id[:-len('.__init__')]]
+        return [module_id]
+
+    def importers_of(self, module_id: str) -> List[Tuple[str, Dict]]:
+        """
+        Get the imports of a module
+
+        Args:
+            module_id: ID of the imported module
+
+        Returns:
+            List of (importing module ID, import record) tuples, one per import record
+        """
+        return [entry for name in self._names(module_id) for entry in self._resolved_entries(name)]
+
+    def import_count(self, module_id: str) -> int:
+        """Get the number of import records importing a module"""
+        return sum(len(self._resolved_entries(name)) for name in self._names(module_id))
+
+    def _resolve(self, importer_id: str, imp: Dict, known_modules: Optional[Mapping] = None) -> Optional[str]:
+        return resolve_import_target(importer_id, imp, known_modules if known_modules is not None else self.known_modules)
+
+    def _resolved_entries(self, name: str) -> List[Tuple[str, Dict]]:
+        """Get the entries indexed under a name that resolve to it"""
+        return [entry for entry in self.importers.get(name, ()) if self._resolve(*entry) == name]
+
+    def imported_modules(self, module_id: str, known_modules: Dict) -> Set[str]:
+        """
+        Get the known modules a module imports
+
+        Args:
+            module_id: ID of the importing module
+            known_modules: Module information dictionary
+
+        Returns:
+            IDs of imported modules present in known_modules
+        """
+        modules = set()
+        for imp in self.records.get(module_id, ()):
+            target = self._resolve(module_id, imp, known_modules)
+            if not target:
+                continue
+            if target in known_modules:
+                modules.add(target)
+            elif f"{target}.__init__" in known_modules:
+                modules.add(f"{target}.__init__")
+        return modules
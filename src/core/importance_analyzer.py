@@ -10,17 +10,20 @@ This module provides multiple methods to analyze code importance, including:
 """
 
 import os
-import re
-import subprocess
 import networkx as nx
 from typing import Dict, List, Set, Tuple, Optional, Union, Any
 
+from src.core.git_history import GitHistoryIndex
+from src.core.import_index import ImportIndex
+from src.core.graph_scoring import GraphScores, score_graph
+
 class ImportanceAnalyzer:
     """Code importance analyzer class, used to evaluate the importance of various components in a code repository"""
     
     def __init__(self, repo_path: str, modules: Dict, classes: Dict, 
                  functions: Dict, imports: Dict, code_tree: Dict,
-                 call_graph: Optional[nx.DiGraph] = None, weights: Optional[Dict] = None):
+                 call_graph: Optional[nx.DiGraph] = None, weights: Optional[Dict] = None,
+                 import_index: Optional[ImportIndex] = None, graph_scores: Optional[GraphScores] = None):
         """
         Initialize importance analyzer
         
@@ -33,6 +36,8 @@ class ImportanceAnalyzer:
             code_tree: Code tree structure
             call_graph: Function call graph (optional)
             weights: Weights for importance calculation (optional)
+            import_index: Reverse import index over imports (optional, built from imports if omitted)
+            graph_scores: Centrality scores of the module dependency graph (optional, computed on first use)
         """
         self.repo_path = repo_path
         self.modules = modules
@@ -41,6 +46,8 @@ class ImportanceAnalyzer:
         self.imports = imports
         self.code_tree = code_tree
         self.call_graph = call_graph
+        self.import_index = import_index if import_index is not None else ImportIndex(imports, modules)
+        self.git_history: Optional[GitHistoryIndex] = None
         
         # Define weights for importance calculation
         default_weights = {
@@ -68,8 +75,16 @@ class ImportanceAnalyzer:
             'executor', 'scheduler', 'config', 'security'
         ]
         
-        # Build module dependency graph
-        self.module_dependency_graph = self._build_module_dependency_graph()
+        # Module dependency graph, only built when graph_scores have to be computed here
+        self._module_dependency_graph: Optional[nx.DiGraph] = None
+        self.graph_scores = graph_scores
+
+    @property
+    def module_dependency_graph(self) -> nx.DiGraph:
+        """Dependency graph between modules, built on first access"""
+        if self._module_dependency_graph is None:
+            self._module_dependency_graph = self._build_module_dependency_graph()
+        return self._module_dependency_graph
 
     def _build_module_dependency_graph(self) -> nx.DiGraph:
         """Build dependency graph between modules"""
@@ -79,28 +94,21 @@ class ImportanceAnalyzer:
         for module_id in self.modules:
             graph.add_node(module_id)
         
-        # Add import relationships as edges
-        for module_id, imports_list in self.imports.items():
-            for imp in imports_list:
-                if imp['type'] == 'import':
-                    imported_module = imp['name']
-                    # Check if the imported module is a known module
-                    if imported_module in self.modules:
-                        graph.add_edge(module_id, imported_module)
-                elif imp['type'] == 'importfrom':
-                    imported_module = imp['module']
-                    # Check if the imported module is a known module
-                    if imported_module in self.modules:
-                        graph.add_edge(module_id, imported_module)
+        # Add import relationships as edges, relative imports are resolved by the import index
+        for module_id in self.imports:
+            for imported_module in self.import_index.imported_modules(module_id, self.modules):
+                if imported_module != module_id:
+                    graph.add_edge(module_id, imported_module)
         
         return graph
 
-    def calculate_node_importance(self, node: Dict) -> float:
+    def calculate_node_importance(self, node: Dict, child_scores: Optional[List[float]] = None) -> float:
         """
         Calculate importance score of a node
         
         Args:
             node: Node information
+            child_scores: Already computed scores of a package's children (optional, scored recursively if omitted)
             
         Returns:
             Importance score (0.0 - 10.0)
@@ -113,7 +121,7 @@ class ImportanceAnalyzer:
         if node['type'] == 'module':
             return self._calculate_module_importance(node)
         elif node['type'] == 'package':
-            return self._calculate_package_importance(node)
+            return self._calculate_package_importance(node, child_scores)
         else:
             return 0.0
     
@@ -152,7 +160,7 @@ class ImportanceAnalyzer:
         # Normalization to ensure score is within reasonable range
         return min(importance, 10.0)
     
-    def _calculate_package_importance(self, node: Dict) -> float:
+    def _calculate_package_importance(self, node: Dict, child_scores: Optional[List[float]] = None) -> float:
         """Calculate package importance score"""
         # Package importance is based on the modules and sub-packages it contains
         importance = 0.0
@@ -163,18 +171,14 @@ class ImportanceAnalyzer:
             importance += semantic_score * self.weights['semantic']
         
         # 2. Importance of contained child nodes
-        if 'children' in node and node['children']:
-            child_scores = []
-            for child in node['children'].values():
-                child_score = self.calculate_node_importance(child)
-                child_scores.append(child_score)
-            
-            if child_scores:
-                # Combine maximum and average values
-                max_score = max(child_scores)
-                avg_score = sum(child_scores) / len(child_scores)
-                # Maximum value has higher weight
-                importance += (max_score * 0.7 + avg_score * 0.3) * 1.5
+        if child_scores is None and node.get('children'):
+            child_scores = [self.calculate_node_importance(child) for child in node['children'].values()]
+        if child_scores:
+            # Combine maximum and average values
+            max_score = max(child_scores)
+            avg_score = sum(child_scores) / len(child_scores)
+            # Maximum value has higher weight
+            importance += (max_score * 0.7 + avg_score * 0.3) * 1.5
         
         # Package specificity, if package name is special, give extra points
         if 'name' in node:
@@ -191,39 +195,21 @@ class ImportanceAnalyzer:
         if node['type'] == 'module' and 'id' in node:
             module_id = node['id']
             
-            if module_id in self.module_dependency_graph:
-                # Calculate in-degree - how many other modules import this
-                in_degree = self.module_dependency_graph.in_degree(module_id)
-                # Calculate out-degree - how many other modules this imports
-                out_degree = self.module_dependency_graph.out_degree(module_id)
+            if self.graph_scores is None:
+                # Centrality of all modules is computed in one pass and shared by every module
+                self.graph_scores = score_graph(self.module_dependency_graph.nodes(),
+                                                self.module_dependency_graph.edges())
+            
+            if module_id in self.graph_scores:
+                # In-degree - how many other modules import this, out-degree - how many other modules this imports
+                in_degree = self.graph_scores.get(module_id, 'in_degree')
+                out_degree = self.graph_scores.get(module_id, 'out_degree')
                 
-                # Calculate PageRank value - reflects module's centrality in the entire dependency network
-                if len(self.module_dependency_graph.nodes()) > 0:
-                    try:
-                        pagerank = nx.pagerank(
-                            self.module_dependency_graph, 
-                            alpha=0.85,
-                            personalization={n: 2.0 if n == module_id else 1.0 for n in self.module_dependency_graph.nodes()}
-                        )
-                        pagerank_score = pagerank.get(module_id, 0.0) * 10  # Amplify PageRank value
-                    except:
-                        pagerank_score = 0.0
-                else:
-                    pagerank_score = 0.0
+                # PageRank value - reflects module's centrality in the entire dependency network
+                pagerank_score = self.graph_scores.get(module_id, 'pagerank') * 10  # Amplify PageRank value
                 
-                # Calculate module's betweenness centrality - reflects module's importance as a "bridge"
-                betweenness = 0.0
-                if len(self.module_dependency_graph.nodes()) > 1:
-                    try:
-                        # Since computing betweenness centrality can be time-consuming, use estimation method
-                        between_dict = nx.betweenness_centrality(
-                            self.module_dependency_graph,
-                            k=min(20, len(self.module_dependency_graph.nodes())),  # Sample fewer nodes to speed up computation
-                            normalized=True
-                        )
-                        betweenness = between_dict.get(module_id, 0.0)
-                    except:
-                        betweenness = 0.0
+                # Betweenness centrality (sampled estimate) - reflects module's importance as a "bridge"
+                betweenness = self.graph_scores.get(module_id, 'betweenness')
                 
                 # Calculate comprehensive reference importance score for module
                 # In-degree weight is highest - modules referenced by many others are more important
@@ -274,13 +260,8 @@ class ImportanceAnalyzer:
         # If it's a module, check how many times it's imported
         if node['type'] == 'module' and 'id' in node:
             module_id = node['id']
-            # Count how many other modules import this module
-            import_count = 0
-            for imports in self.imports.values():
-                for imp in imports:
-                    if (imp['type'] == 'import' and imp['name'] == module_id) or \
-                       (imp['type'] == 'importfrom' and imp['module'] == module_id):
-                        import_count += 1
+            # Count how many import statements import this module
+            import_count = self.import_index.import_count(module_id)
             
             # Normalize usage frequency score
             score = min(import_count / 5.0, 1.0)
@@ -311,38 +292,23 @@ class ImportanceAnalyzer:
         return score
     
     def _analyze_complexity(self, node: Dict) -> float:
-        """Analyze node code complexity"""
+        """Analyze node code complexity from the metrics computed while parsing"""
         score = 0.0
         
-        # If it's a module, analyze its complexity
+        # If it's a module, score its branches, loops and handlers
         if node['type'] == 'module' and 'id' in node:
             module_id = node['id']
-            if module_id in self.modules and 'content' in self.modules[module_id]:
-                content = self.modules[module_id]['content']
-                
-                # Count branches and loops
-                lines = content.splitlines()
-                if_count = sum(1 for line in lines if re.search(r'\bif\b', line))
-                for_count = sum(1 for line in lines if re.search(r'\bfor\b', line))
-                while_count = sum(1 for line in lines if re.search(r'\bwhile\b', line))
-                except_count = sum(1 for line in lines if re.search(r'\bexcept\b', line))
-                
+            complexity = self.modules.get(module_id, {}).get('complexity')
+            if complexity:
                 # Calculate total branch count
-                branch_count = if_count + for_count + while_count + except_count
+                branch_count = complexity['branch_count'] + complexity['loop_count'] + complexity['except_count']
                 
                 # Normalize complexity score
                 score = min(branch_count / 50.0, 1.0)
                 
-                # Check function nesting depth
-                def_pattern = re.compile(r'^(\s*)def\s+', re.MULTILINE)
-                matches = def_pattern.findall(content)
-                if matches:
-                    # Calculate maximum indentation level
-                    max_indent = max(len(indent) for indent in matches)
-                    indent_level = max_indent / 4  # Assume each indentation level is 4 spaces
-                    
-                    # Add nesting depth score
-                    score += min(indent_level / 5.0, 1.0) * 0.3
+                # Add nesting depth score, each indentation level is 4 spaces
+                indent_level = complexity['max_def_indent'] / 4
+                score += min(indent_level / 5.0, 1.0) * 0.3
         
         return score
     
@@ -447,67 +413,9 @@ class ImportanceAnalyzer:
             Importance score (0.0 - 1.0)
         """
         try:
-            # Check if file exists
-            if not os.path.exists(file_path):
-                return 0.0
-            
-            # Check if in Git repository
-            repo_dir = os.path.dirname(file_path)
-            if not os.path.exists(os.path.join(repo_dir, '.git')) and \
-               not os.path.exists(os.path.join(self.repo_path, '.git')):
-                # Try to find .git directory upwards
-                current_dir = repo_dir
-                found_git = False
-                for _ in range(5):  # Limit upward search count
-                    parent_dir = os.path.dirname(current_dir)
-                    if parent_dir == current_dir:  # Reached root directory
-                        break
-                    if os.path.exists(os.path.join(parent_dir, '.git')):
-                        found_git = True
-                        break
-                    current_dir = parent_dir
-                
-                if not found_git:
-                    return 0.0  # Not in Git repository
-            
-            # Get commit count
-            try:
-                rel_path = os.path.relpath(file_path, self.repo_path)
-                cmd = ['git', '-C', self.repo_path, 'log', '--oneline', '--', rel_path]
-                result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-                
-                if result.returncode == 0:
-                    commit_lines = result.stdout.strip().split('\n')
-                    commit_count = len([line for line in commit_lines if line])
-                    
-                    # Calculate score based on commit count
-                    score = min(commit_count / 20.0, 1.0)
-                    
-                    # Get last modification time
-                    cmd_last_commit = ['git', '-C', self.repo_path, 'log', '-1', '--format=%at', '--', rel_path]
-                    result_last = subprocess.run(cmd_last_commit, capture_output=True, text=True, check=False)
-                    
-                    if result_last.returncode == 0 and result_last.stdout.strip():
-                        import time
-                        try:
-                            last_commit_time = int(result_last.stdout.strip())
-                            current_time = int(time.time())
-                            days_since_last_commit = (current_time - last_commit_time) / (60 * 60 * 24)
-                            
-                            # Recently modified files may be more important
-                            recency_score = max(0, 1.0 - (days_since_last_commit / 365))
-                            
-                            # Combine commit count and recent modification time
-                            score = (score * 0.7) + (recency_score * 0.3)
-                        except:
-                            pass
-                    
-                    return score
-                
-                return 0.0
-            
-            except subprocess.SubprocessError:
-                return 0.0
-                
+            # History of the whole repository is read once per HEAD and shared by all files
+            if self.git_history is None:
+                self.git_history = GitHistoryIndex.for_repository(self.repo_path)
+            return self.git_history.file_importance(os.path.relpath(file_path, self.repo_path))
         except Exception:
             return 0.0
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Lazy source - Materializes source text of classes and functions on demand
+
+Parse records only keep the line range of each entity. The text is sliced out of the module
+content through a per-module line-offset index the first time it is accessed, so the builder
+holds a single copy of every file instead of one extra copy per class and function.
+"""
+
+from array import array
+from typing import Dict, Optional
+
+
+class LineIndex:
+    """Start offsets of the lines of one module, computed once"""
+
+    __slots__ = ('offsets',)
+
+    def __init__(self, content: str):
+        """
+        Build line index
+
+        Args:
+            content: Module content
+        """
+        self.offsets = array('L', [0])
+        position = 0
+        for line in content.splitlines(keepends=True):
+            position += len(line)
+            self.offsets.append(position)
+
+    def get_lines(self, content: str, start_line: int, end_line: int) -> str:
+        """
+        Get text of a line range
+
+        Args:
+            content: Module content the index was built from
+            start_line: First line, starting from 1
+            end_line: Last line, inclusive
+
+        Returns:
+            Lines joined with newlines, without trailing line break
+        """
+        line_count = len(self.offsets) - 1
+        start = min(max(start_line - 1, 0), line_count)
+        end = min(max(end_line, start), line_count)
+        text = content[self.offsets[start]:self.offsets[end]]
+        return "\n".join(text.splitlines())
+
+
+class SourceLoader:
+    """Resolves the source text of class and function records from module content"""
+
+    def __init__(self, modules: Dict):
+        """
+        Initialize source loader
+
+        Args:
+            modules: Module information dictionary holding the content of each module
+        """
+        self.modules = modules
+        self._line_indexes: Dict[str, LineIndex] = {}
+
+    def __call__(self, record: Dict) -> str:
+        """Get source text of a class or function record"""
+        module_info = self.modules.get(record['module'])
+        if not module_info:
+            return ""
+        content = module_info.get('content', "")
+
+        line_index = self._line_indexes.get(record['module'])
+        if line_index is None:
+            line_index = LineIndex(content)
+            self._line_indexes[record['module']] = line_index
+
+        return line_index.get_lines(content, record['start_line'], record['end_line'])
+
+    def invalidate(self, module_id: Optional[str] = None) -> None:
+        """Drop line index of a module (or all modules) after its content changed"""
+        if module_id is None:
+            self._line_indexes.clear()
+        else:
+            self._line_indexes.pop(module_id, None)
+
+
+class SourceRecord(dict):
+    """
+    Class or function record whose 'source' entry is materialized lazily
+
+    Behaves like a record holding a 'source' key for item access, get() and membership tests.
+    Copies and pickles turn into plain dictionaries with the source included.
+    """
+
+    __slots__ = ('_loader',)
+
+    def __init__(self, data: Dict, loader: SourceLoader):
+        super().__init__(data)
+        self._loader = loader
+
+    def __missing__(self, key):
+        if key == 'source':
+            return self._loader(self)
+        raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key == 'source' or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == 'source' and not super().__contains__(key):
+            return self._loader(self)
+        return super().get(key, default)
+
+    def to_dict(self) -> Dict:
+        """Convert to plain dictionary with materialized source"""
+        data = dict(self)
+        data['source'] = self['source']
+        return data
+
+    def __reduce__(self):
+        return (dict, (self.to_dict(),))
+
+
+def count_lines(record: Dict) -> int:
+    """Count source lines of a class or function record"""
+    if 'start_line' in record and 'end_line' in record:
+        return max(record['end_line'] - record['start_line'] + 1, 0)
+    return len(record.get('source', "").splitlines())
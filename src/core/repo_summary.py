@@ -1,6 +1,7 @@
 from typing import Annotated
 import json
 from src.core.code_utils import get_code_abs_token
+from src.core.context_packer import ContextPacker
 
 from src.utils.agent_gpt4 import AzureGPT4Chat
 
@@ -71,13 +72,16 @@ def generate_repository_summary(
         max_token = 50000
         out_code_list = []
         split_code_list = []
+        split_tokens = 0  # Running token count of split_code_list, each file is tokenized once
         for file in code_list:
             if get_code_abs_token(str(file)) > max_token:
                 continue
             split_code_list.append(file)
-            if get_code_abs_token(json.dumps(split_code_list, ensure_ascii=False, indent=2)) > max_token:
+            split_tokens += get_code_abs_token(json.dumps(file, ensure_ascii=False, indent=2))
+            if split_tokens > max_token:
                 out_code_list.append(split_code_list)
                 split_code_list = []
+                split_tokens = 0
         if split_code_list:
             out_code_list.append(split_code_list)
         return out_code_list
@@ -95,6 +99,7 @@ def generate_repository_summary(
     print('important_files: ', len(code_list), len(important_files), [file['file_path'] for file in important_files])
     
     repository_summary = {}
+    summary_packer = ContextPacker(max_important_files_token)
     
     for file in important_files:
         file_path = file['file_path']
@@ -102,7 +107,7 @@ def generate_repository_summary(
         try:
             summary = get_readme_summary(file_content, repository_summary)
             if '<none>' not in str(summary).lower():
-                if get_code_abs_token(json.dumps(repository_summary, ensure_ascii=False)+str(summary))> max_important_files_token:
+                if not summary_packer.add(json.dumps({file_path: summary}, ensure_ascii=False)):
                     break
                 repository_summary[file_path] = summary
         except Exception as e:
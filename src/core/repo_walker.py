@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+"""
+Budgeted repository walker - Decides which files of a repository are parsed, in priority order
+
+Instead of fixed depth and per-directory file limits, every candidate file is scored (entry points,
+package modules, how often other parsed modules import it) and files are parsed best-first until
+the time / byte / file budget runs out. Files left over are reported as deferred so they can be
+parsed on demand later.
+"""
+
+import os
+import heapq
+import logging
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.core.code_parser import module_id_from_path
+from src.core.code_utils import should_ignore_path
+
+logger = logging.getLogger(__name__)
+
+# Files that usually start a program, parsed first
+ENTRY_POINT_NAMES = {
+    '__main__.py', 'main.py', 'app.py', 'cli.py', 'run.py', 'setup.py', 'manage.py',
+    'server.py', 'train.py', 'inference.py', 'demo.py'
+}
+
+# Directories that rarely hold the code an agent needs to understand first
+LOW_PRIORITY_DIRS = {'test', 'tests', 'testing', 'examples', 'example', 'docs', 'doc', 'benchmarks', 'scripts'}
+
+MAX_FILE_SIZE = 10 * 1024 * 1024  # Skip files larger than 10MB
+
+# Files handed to the parser at once. Batches are parsed by one shared process pool, so a batch
+# only needs to be large enough to keep every worker busy; imports seen in a batch promote the
+# files of the next one
+DEFAULT_BATCH_SIZE = 1024
+
+
+class WalkBudget:
+    """Limits of one repository walk, None means unlimited"""
+
+    def __init__(self, max_files: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_seconds: Optional[float] = None):
+        """
+        Initialize walk budget
+
+        Args:
+            max_files: Maximum number of files to parse
+            max_bytes: Maximum total size of parsed files
+            max_seconds: Maximum wall time spent walking and parsing
+        """
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+
+    @classmethod
+    def from_env(cls) -> 'WalkBudget':
+        """Create default budget, overridable with REPO_WALK_MAX_FILES / _MAX_BYTES / _MAX_SECONDS"""
+        def read(name, default, cast):
+            value = os.environ.get(name)
+            if value is None:
+                return default
+            return cast(value) if value.strip() not in ('', '0', 'none', 'None') else None
+
+        return cls(
+            max_files=read('REPO_WALK_MAX_FILES', 5000, int),
+            max_bytes=read('REPO_WALK_MAX_BYTES', 64 * 1024 * 1024, int),
+            max_seconds=read('REPO_WALK_MAX_SECONDS', 180.0, float)
+        )
+
+    def __repr__(self) -> str:
+        return f"WalkBudget(max_files={self.max_files}, max_bytes={self.max_bytes}, max_seconds={self.max_seconds})"
+
+
+class ModuleNameIndex:
+    """Maps dotted import names to module IDs, by full ID or dotted suffix (e.g. packages under src/)"""
+
+    def __init__(self, module_ids: Iterable[str]):
+        self.targets: Dict[str, List[str]] = defaultdict(list)
+        for module_id in module_ids:
+            name = module_id[:-len('.__init__')] if module_id.endswith('.__init__') else module_id
+            parts = name.split('.')
+            for i in range(len(parts)):
+                # Single-component suffixes are too ambiguous unless they are the full ID
+                if i == 0 or len(parts) - i >= 2:
+                    self.targets['.'.join(parts[i:])].append(module_id)
+
+    def lookup(self, name: str) -> List[str]:
+        """Get module IDs an import name may refer to"""
+        return self.targets.get(name, [])
+
+
+def imported_names(imports_list: List[Dict]) -> List[str]:
+    """Get dotted names referenced by import records, including possible submodules of from-imports"""
+    names = []
+    for imp in imports_list:
+        if imp['type'] == 'import':
+            names.append(imp['name'])
+        elif imp.get('module'):
+            names.append(imp['module'])
+            names.append(f"{imp['module']}.{imp['name']}")
+    return names
+
+
+def count_imported_by(imports: Dict[str, List[Dict]], module_ids: Iterable[str]) -> Dict[str, int]:
+    """
+    Count how many modules import each module
+
+    Args:
+        imports: Import information dictionary
+        module_ids: IDs of modules to count
+
+    Returns:
+        Dictionary mapping module ID to number of importing modules
+    """
+    name_index = ModuleNameIndex(module_ids)
+    counts = defaultdict(int)
+    for importer_id, imports_list in imports.items():
+        for module_id in {target for name in imported_names(imports_list) for target in name_index.lookup(name)}:
+            if module_id != importer_id:
+                counts[module_id] += 1
+    return counts
+
+
+class RepositoryWalker:
+    """Walks a repository and parses files best-first within a budget"""
+
+    def __init__(self, repo_path: str, ignored_dirs: Iterable[str], budget: Optional[WalkBudget] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Initialize repository walker
+
+        Args:
+            repo_path: Path to the code repository
+            ignored_dirs: Directory names never entered
+            budget: Walk budget, defaults to WalkBudget.from_env()
+            batch_size: Number of files handed to the parser at once
+        """
+        self.repo_path = repo_path
+        self.ignored_dirs = set(ignored_dirs)
+        self.budget = budget or WalkBudget.from_env()
+        self.batch_size = batch_size
+
+        self.deferred_files: List[Tuple[str, str]] = []
+        self.report: Dict = {}
+
+    def iter_candidates(self) -> Iterator[Tuple[str, str, int, bool]]:
+        """
+        Stream parseable files of the repository
+
+        Returns:
+            Iterator of (absolute path, relative path, size, inside a package) tuples
+        """
+        for root, dirs, files in os.walk(self.repo_path):
+            # Modify dirs list in place, skip ignored directories
+            dirs[:] = [d for d in dirs if d not in self.ignored_dirs]
+            in_package = '__init__.py' in files
+
+            for file in files:
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, self.repo_path)
+
+                # Use unified function to check if should be ignored
+                if should_ignore_path(rel_path):
+                    continue
+
+                try:
+                    file_size = os.path.getsize(file_path)
+                except OSError:
+                    continue
+                if file_size > MAX_FILE_SIZE:
+                    continue
+
+                yield file_path, rel_path, file_size, in_package
+
+    @staticmethod
+    def static_priority(rel_path: str, in_package: bool) -> float:
+        """Score a file from its location alone, higher is parsed earlier"""
+        parts = rel_path.split(os.sep)
+        file_name = parts[-1]
+
+        if file_name.endswith('.py'):
+            score = 10.0
+        elif file_name.endswith('.ipynb'):
+            score = 5.0
+        else:
+            score = 2.0
+
+        if file_name in ENTRY_POINT_NAMES:
+            score += 20.0
+        if file_name == '__init__.py':
+            score += 8.0
+        elif in_package and file_name.endswith('.py'):
+            score += 4.0
+        if any(part.lower() in LOW_PRIORITY_DIRS for part in parts[:-1]):
+            score -= 6.0
+
+        # Prefer files close to the repository root
+        score -= 0.5 * (len(parts) - 1)
+        return score
+
+    def walk(self, parse_batch: Callable[[List[Tuple[str, str]]], List[Dict]]) -> List[Dict]:
+        """
+        Parse repository files in priority order until the budget is exhausted
+
+        Args:
+            parse_batch: Parses a list of (absolute path, relative path) tuples into parse records
+
+        Returns:
+            Parse records in parse order
+        """
+        start_time = time.time()
+        budget = self.budget
+
+        candidates = {}
+        heap = []
+        for order, (file_path, rel_path, file_size, in_package) in enumerate(self.iter_candidates()):
+            score = self.static_priority(rel_path, in_package)
+            candidates[rel_path] = {'file_path': file_path, 'size': file_size, 'score': score,
+                                    'static_score': score, 'order': order}
+            heapq.heappush(heap, (-score, order, rel_path))
+
+        # Python files that other parsed modules import are promoted while walking
+        python_files = {module_id_from_path(rel_path): rel_path for rel_path in candidates if rel_path.endswith('.py')}
+        name_index = ModuleNameIndex(python_files)
+
+        records = []
+        parsed = set()
+        parsed_bytes = 0
+        exhausted = None
+
+        while heap and exhausted is None:
+            batch = []
+            while heap and len(batch) < self.batch_size:
+                neg_score, order, rel_path = heapq.heappop(heap)
+                candidate = candidates[rel_path]
+                if rel_path in parsed or -neg_score != candidate['score']:
+                    continue  # Already parsed or superseded by a higher score
+
+                if budget.max_files is not None and len(parsed) >= budget.max_files:
+                    heapq.heappush(heap, (neg_score, order, rel_path))
+                    exhausted = 'files'
+                    break
+                if budget.max_bytes is not None and parsed_bytes + candidate['size'] > budget.max_bytes:
+                    # Too large for what is left of the byte budget, smaller files may still fit
+                    candidate['score'] = float('-inf')
+                    continue
+
+                parsed.add(rel_path)
+                parsed_bytes += candidate['size']
+                batch.append((candidate['file_path'], rel_path))
+
+            if not batch:
+                break
+
+            batch_records = parse_batch(batch)
+            records.extend(batch_records)
+
+            for record in batch_records:
+                if record['kind'] != 'python':
+                    continue
+                targets = {target for name in imported_names(record['imports']) for target in name_index.lookup(name)}
+                for module_id in targets:
+                    rel_path = python_files[module_id]
+                    if rel_path in parsed:
+                        continue
+                    candidate = candidates[rel_path]
+                    if candidate['score'] == float('-inf'):
+                        continue
+                    candidate['score'] += 3.0
+                    heapq.heappush(heap, (-candidate['score'], candidate['order'], rel_path))
+
+            if budget.max_seconds is not None and time.time() - start_time > budget.max_seconds:
+                exhausted = 'time'
+
+        if exhausted is None and len(parsed) < len(candidates):
+            exhausted = 'bytes'
+
+        # Everything not parsed is deferred, best candidates first
+        deferred = sorted(
+            (rel_path for rel_path in candidates if rel_path not in parsed),
+            key=lambda rel_path: (-candidates[rel_path]['static_score'], candidates[rel_path]['order'])
+        )
+        self.deferred_files = [(candidates[rel_path]['file_path'], rel_path) for rel_path in deferred]
+
+        deferred_dirs = defaultdict(int)
+        for rel_path in deferred:
+            deferred_dirs[os.path.dirname(rel_path) or '.'] += 1
+
+        self.report = {
+            'parsed_files': len(parsed),
+            'parsed_bytes': parsed_bytes,
+            'deferred_files': len(deferred),
+            'deferred_bytes': sum(candidates[rel_path]['size'] for rel_path in deferred),
+            'deferred_directories': dict(sorted(deferred_dirs.items(), key=lambda x: x[1], reverse=True)[:20]),
+            'budget_exhausted': exhausted,
+            'elapsed_seconds': round(time.time() - start_time, 2)
+        }
+
+        if deferred:
+            logger.warning(f"Walk budget exhausted ({exhausted}), parsed {len(parsed)} files and deferred "
+                           f"{len(deferred)} files, top deferred directories: {list(self.report['deferred_directories'])[:5]}")
+        return records
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+"""
+Symbol index - Lookup tables built once over the parsed code tree
+
+Replaces the linear scans over all classes / functions that call resolution used to perform,
+so that each call site is resolved with a handful of dictionary lookups. EntityNameIndex does the
+same for the name lookups of the code explorer tools.
+"""
+
+from array import array
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+def call_target_name(call: Dict) -> Optional[str]:
+    """
+    Get the short name a call can resolve to
+
+    Every resolution rule ends in the called function's own name, so a call can only resolve
+    to functions whose ID ends with this name.
+    """
+    if call['type'] == 'simple':
+        return call['name']
+    elif call['type'] == 'attribute':
+        return call['attribute']
+    elif call['type'] == 'nested_attribute':
+        return call['full_path'].rsplit('.', 1)[-1]
+    return None
+
+
+class SymbolIndex:
+    """Index of functions, classes and imports used to resolve calls to function IDs"""
+
+    def __init__(self, functions: Dict, classes: Dict, imports: Dict):
+        """
+        Build symbol index
+
+        Args:
+            functions: Function information dictionary
+            classes: Class information dictionary
+            imports: Import information dictionary
+        """
+        self.functions = functions
+        self.classes = classes
+
+        # Short class name -> class IDs, in class table order
+        self.classes_by_name: Dict[str, List[str]] = defaultdict(list)
+        for class_id in classes:
+            self.classes_by_name[class_id.rsplit('.', 1)[-1]].append(class_id)
+
+        # Dotted suffix -> first function ID ending with it, in function table order
+        self.function_suffixes: Dict[str, str] = {}
+        for function_id in functions:
+            parts = function_id.split('.')
+            for i in range(1, len(parts)):
+                self.function_suffixes.setdefault('.'.join(parts[i:]), function_id)
+
+        # Per-module import alias tables
+        # from_imports: imported name -> source modules of "from X import name"
+        # module_imports: bound name or alias -> modules of "import X [as Y]"
+        self.from_imports: Dict[str, Dict[str, List[str]]] = {}
+        self.module_imports: Dict[str, Dict[str, List[str]]] = {}
+        for module_id, imports_list in imports.items():
+            from_table = defaultdict(list)
+            module_table = defaultdict(list)
+            for imp in imports_list:
+                if imp['type'] == 'importfrom':
+                    from_table[imp['name']].append(imp['module'])
+                elif imp['type'] == 'import':
+                    module_table[imp['name']].append(imp['name'])
+                    if imp['alias'] and imp['alias'] != imp['name']:
+                        module_table[imp['alias']].append(imp['name'])
+            self.from_imports[module_id] = from_table
+            self.module_imports[module_id] = module_table
+
+        # Called short name -> IDs of functions containing such a call, used to find the callers
+        # whose resolution may change when functions are added or removed
+        self.callers_by_name: Dict[str, Set[str]] = defaultdict(set)
+        for function_id, function_info in functions.items():
+            for call in function_info['calls']:
+                target_name = call_target_name(call)
+                if target_name:
+                    self.callers_by_name[target_name].add(function_id)
+
+        # Memoized resolutions keyed by (module, class, call fields)
+        self._resolved: Dict[Tuple, Optional[str]] = {}
+
+    def resolve_call(self, call: Dict, module_id: str, class_id: Optional[str]) -> Optional[str]:
+        """
+        Resolve function call and return the ID of the called function
+
+        Args:
+            call: Call information produced by the code parser
+            module_id: Module containing the call
+            class_id: Class containing the call (None for module-level functions)
+
+        Returns:
+            ID of the called function, or None if it cannot be resolved
+        """
+        key = (module_id, class_id) + tuple(call.values())
+        if key not in self._resolved:
+            self._resolved[key] = self._resolve(call, module_id, class_id)
+        return self._resolved[key]
+
+    def _resolve(self, call: Dict, module_id: str, class_id: Optional[str]) -> Optional[str]:
+        """Resolve function call without memoization"""
+        functions = self.functions
+
+        if call['type'] == 'simple':
+            name = call['name']
+
+            # Check functions in the same module
+            direct_func_id = f"{module_id}.{name}"
+            if direct_func_id in functions:
+                return direct_func_id
+
+            # Check methods in the same class
+            if class_id:
+                method_id = f"{class_id}.{name}"
+                if method_id in functions:
+                    return method_id
+
+                # Check methods in parent classes
+                if class_id in self.classes:
+                    for base_class in self.classes[class_id]['base_classes']:
+                        if '.' not in base_class:
+                            # Simple name, try to find it in the same module
+                            potential_base = f"{module_id}.{base_class}"
+                            if potential_base in self.classes:
+                                base_method_id = f"{potential_base}.{name}"
+                                if base_method_id in functions:
+                                    return base_method_id
+                        else:
+                            # Already a complete path
+                            base_method_id = f"{base_class}.{name}"
+                            if base_method_id in functions:
+                                return base_method_id
+
+            # Check imported functions
+            for imported_module in self.from_imports.get(module_id, {}).get(name, ()):
+                imported_func_id = f"{imported_module}.{name}"
+                if imported_func_id in functions:
+                    return imported_func_id
+
+        elif call['type'] == 'attribute':
+            obj_name = call['object']
+            attr_name = call['attribute']
+
+            # Check if it's a class instance method call
+            for cls_id in self.classes_by_name.get(obj_name, ()):
+                method_id = f"{cls_id}.{attr_name}"
+                if method_id in functions:
+                    return method_id
+
+            # Check imported modules
+            for imported_module in self.module_imports.get(module_id, {}).get(obj_name, ()):
+                imported_func_id = f"{imported_module}.{attr_name}"
+                if imported_func_id in functions:
+                    return imported_func_id
+
+        elif call['type'] == 'nested_attribute':
+            full_path = call['full_path']
+
+            # Check exact match
+            if full_path in functions:
+                return full_path
+
+            # Check partial match
+            return self.function_suffixes.get(full_path)
+
+        return None
+
+
+class EntityNameIndex:
+    """
+    Substring search over entity IDs through a trigram index
+
+    Results come back in the insertion order of the indexed table, like a scan of the table would
+    return them. Removed entities are tombstoned and sync() re-appends entities whose position in
+    the table moved, so the index follows incremental updates without a full rebuild.
+    """
+
+    GRAM_SIZE = 3
+
+    def __init__(self, entity_ids: Iterable[str] = ()):
+        """
+        Build index
+
+        Args:
+            entity_ids: Entity IDs in table order
+        """
+        self.ids: List[Optional[str]] = []  # Ordinal -> entity ID, None once removed
+        self.ordinals: Dict[str, int] = {}  # Entity ID -> ordinal of live entities
+        self.grams: Dict[str, array] = defaultdict(lambda: array('I'))
+        self.removed = 0
+        self.add(entity_ids)
+
+    def add(self, entity_ids: Iterable[str]) -> None:
+        """Append entities not indexed yet"""
+        size = self.GRAM_SIZE
+        for entity_id in entity_ids:
+            if entity_id in self.ordinals:
+                continue
+            ordinal = len(self.ids)
+            self.ids.append(entity_id)
+            self.ordinals[entity_id] = ordinal
+            for gram in {entity_id[i:i + size] for i in range(len(entity_id) - size + 1)}:
+                self.grams[gram].append(ordinal)
+
+    def remove(self, entity_ids: Iterable[str]) -> None:
+        """Drop entities from the index"""
+        for entity_id in entity_ids:
+            ordinal = self.ordinals.pop(entity_id, None)
+            if ordinal is not None:
+                self.ids[ordinal] = None
+                self.removed += 1
+
+    def sync(self, entity_ids: Iterable[str]) -> None:
+        """
+        Bring the index in line with the current table
+
+        Args:
+            entity_ids: Entity IDs in current table order
+        """
+        current = list(entity_ids)
+        current_set = set(current)
+        self.remove([entity_id for entity_id in self.ordinals if entity_id not in current_set])
+
+        # Entities keep their ordinals while the table order agrees, the rest is re-appended
+        last_ordinal = -1
+        tail = []
+        for position, entity_id in enumerate(current):
+            ordinal = self.ordinals.get(entity_id)
+            if ordinal is None or ordinal < last_ordinal:
+                tail = current[position:]
+                break
+            last_ordinal = ordinal
+        self.remove(tail)
+        self.add(tail)
+
+        if self.removed > len(self.ordinals):
+            # Mostly tombstones, rebuild compact posting lists
+            self.ids, self.ordinals, self.removed = [], {}, 0
+            self.grams = defaultdict(lambda: array('I'))
+            self.add(current)
+
+    def search(self, query: str) -> List[str]:
+        """
+        Find entity IDs containing a query string
+
+        Args:
+            query: Substring to look for
+
+        Returns:
+            Matching entity IDs in table order
+        """
+        size = self.GRAM_SIZE
+        if len(query) < size:
+            return [entity_id for entity_id in self.ids if entity_id is not None and query in entity_id]
+
+        postings = []
+        for i in range(len(query) - size + 1):
+            posting = self.grams.get(query[i:i + size])
+            if not posting:
+                return []
+            postings.append(posting)
+
+        # Every match holds every trigram of the query, verifying the shortest posting list is enough
+        ids = self.ids
+        return [ids[ordinal] for ordinal in min(postings, key=len)
+                if ids[ordinal] is not None and query in ids[ordinal]]
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Trigram text index - Finds the files that can contain a search string without scanning all of them
+
+Every file is reduced to the set of byte trigrams of its lowercased UTF-8 content. A file can only
+contain a (case-insensitive) substring if it holds all trigrams of that substring, so a search only
+scans the lines of candidate files. Regular expressions are narrowed by the literal runs they
+require. The bulk of the index is a sorted (trigram, file) array pair; files changed later go to
+a small delta segment until the next compaction.
+"""
+
+import re
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import re._parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
+
+logger = logging.getLogger(__name__)
+
+MIN_GRAM_LENGTH = 3
+
+
+def _grams(text: str):
+    """Get distinct byte trigrams of lowercased text, as sorted uint32 codes (NumPy) or a set of bytes"""
+    data = text.lower().encode('utf-8', errors='surrogatepass')
+    if np is None:
+        return {data[i:i + 3] for i in range(len(data) - 2)}
+    if len(data) < 3:
+        return np.zeros(0, dtype=np.uint32)
+    values = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    return np.unique((values[:-2] << 16) | (values[1:-1] << 8) | values[2:])
+
+
+def required_literals(pattern: str) -> List[str]:
+    """
+    Get literal strings every match of a regular expression contains
+
+    Only literal runs of the top-level sequence are used, anything else (groups, repeats,
+    alternatives, classes) ends a run, which keeps the result conservative.
+
+    Args:
+        pattern: Regular expression
+
+    Returns:
+        Literal runs of at least three characters
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+
+    literals, run = [], []
+    for op, value in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(value))
+        else:
+            literals.append(''.join(run))
+            run = []
+    literals.append(''.join(run))
+    return [literal for literal in literals if len(literal) >= MIN_GRAM_LENGTH]
+
+
+class TrigramTextIndex:
+    """Inverted trigram index over the contents of code tree records"""
+
+    def __init__(self, compact_ratio: float = 0.1):
+        """
+        Initialize empty index
+
+        Args:
+            compact_ratio: Fraction of files in the delta segment that triggers a rebuild of the main segment
+        """
+        self.compact_ratio = compact_ratio
+        self.doc_ids: List[Optional[str]] = []  # Ordinal -> record ID, None once removed
+        self.ordinals: Dict[str, int] = {}  # Record ID -> ordinal of live records
+        self.records: Dict[str, Dict] = {}  # Record ID -> indexed record
+        self._dead: Set[int] = set()
+
+        # Main segment: trigram codes sorted, with the ordinal of the file holding each
+        self._main_grams = None
+        self._main_docs = None
+        self._main_postings: Dict[bytes, List[int]] = {}  # Without NumPy
+        # Delta segment: ordinal -> trigrams of files added after the last build
+        self._delta: Dict[int, object] = {}
+
+    def __len__(self) -> int:
+        return len(self.ordinals)
+
+    def sync(self, records: Iterable[Tuple[str, Dict]]) -> None:
+        """
+        Bring the index in line with the current records, re-indexing only new or replaced ones
+
+        Args:
+            records: (record ID, record) pairs, records without 'content' are skipped
+        """
+        current = {record_id: record for record_id, record in records if 'content' in record}
+        stale = [record_id for record_id, record in self.records.items() if current.get(record_id) is not record]
+        for record_id in stale:
+            ordinal = self.ordinals.pop(record_id)
+            del self.records[record_id]
+            self.doc_ids[ordinal] = None
+            self._delta.pop(ordinal, None)
+            self._dead.add(ordinal)
+
+        added = [(record_id, record) for record_id, record in current.items() if record_id not in self.records]
+        if self._main_grams is None and not self._main_postings and not self._delta:
+            self._build(added)
+            return
+
+        for record_id, record in added:
+            ordinal = self._add_record(record_id, record)
+            self._delta[ordinal] = _grams(record['content'])
+
+        if len(self._delta) + len(self._dead) > max(16, self.compact_ratio * len(self.ordinals)):
+            self._build(list(self.records.items()), reset=True)
+
+    def _add_record(self, record_id: str, record: Dict) -> int:
+        ordinal = len(self.doc_ids)
+        self.doc_ids.append(record_id)
+        self.ordinals[record_id] = ordinal
+        self.records[record_id] = record
+        return ordinal
+
+    def _build(self, records: List[Tuple[str, Dict]], reset: bool = False) -> None:
+        """Index records into a fresh main segment"""
+        if reset:
+            self.doc_ids, self.ordinals, self.records = [], {}, {}
+            self._dead, self._delta = set(), {}
+        self._main_postings = {}
+
+        gram_arrays, doc_arrays = [], []
+        for record_id, record in records:
+            ordinal = self._add_record(record_id, record)
+            grams = _grams(record['content'])
+            if np is None:
+                for gram in grams:
+                    self._main_postings.setdefault(gram, []).append(ordinal)
+            else:
+                gram_arrays.append(grams)
+                doc_arrays.append(np.full(len(grams), ordinal, dtype=np.int32))
+
+        if np is not None:
+            grams = np.concatenate(gram_arrays) if gram_arrays else np.zeros(0, dtype=np.uint32)
+            docs = np.concatenate(doc_arrays) if doc_arrays else np.zeros(0, dtype=np.int32)
+            order = np.argsort(grams, kind='stable')
+            self._main_grams, self._main_docs = grams[order], docs[order]
+        logger.debug(f"Built trigram index over {len(self.ordinals)} files")
+
+    def candidates(self, literals: Iterable[str]) -> List[str]:
+        """
+        Get IDs of records that may contain all literals (case-insensitive)
+
+        Args:
+            literals: Strings every match contains, shorter ones than a trigram do not narrow the search
+
+        Returns:
+            Record IDs in index order
+        """
+        query = None
+        for literal in literals:
+            grams = _grams(literal)
+            if len(grams):
+                query = grams if query is None else (query | grams if np is None else np.union1d(query, grams))
+        if query is None:
+            return [record_id for record_id in self.doc_ids if record_id is not None]
+
+        ordinals = self._main_candidates(query)
+        for ordinal, grams in self._delta.items():
+            if (query <= grams) if np is None else bool(np.isin(query, grams, assume_unique=True).all()):
+                ordinals.append(ordinal)
+        return [self.doc_ids[ordinal] for ordinal in sorted(ordinals) if ordinal not in self._dead]
+
+    def _main_candidates(self, query) -> List[int]:
+        """Ordinals of main segment files holding every query trigram"""
+        if np is None:
+            result = None
+            for gram in query:
+                docs = set(self._main_postings.get(gram, ()))
+                result = docs if result is None else result & docs
+                if not result:
+                    return []
+            return list(result)
+
+        if self._main_grams is None:
+            return []
+        result = None
+        for gram in query:
+            lo, hi = np.searchsorted(self._main_grams, [gram, gram + 1])
+            docs = self._main_docs[lo:hi]
+            result = docs if result is None else np.intersect1d(result, docs, assume_unique=True)
+            if not len(result):
+                return []
+        return result.tolist()
+
+    def search(self, query: str, regex: bool = False) -> Tuple[List[str], Callable[[str], bool]]:
+        """
+        Get candidate records and the line matcher of a search
+
+        Args:
+            query: Search string, or regular expression if regex is set
+            regex: Whether query is a regular expression (matched case-insensitively)
+
+        Returns:
+            Tuple of (candidate record IDs, function telling whether a line matches)
+
+        Raises:
+            re.error: If query is not a valid regular expression
+        """
+        if regex:
+            matcher = re.compile(query, re.IGNORECASE).search
+            return self.candidates(required_literals(query)), lambda line: matcher(line) is not None
+
+        lowered = query.lower()
+        return self.candidates([query]), lambda line: lowered in line.lower()
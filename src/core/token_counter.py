@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""
+Token counter - Shared tiktoken encoders with cached token counts
+
+Loading an encoder and encoding the same text again are the costly parts of token budgeting. One
+counter per model holds the encoder for the lifetime of the process, and remembers the counts of
+recently counted texts by content hash. Batches of uncounted texts are encoded together, and
+RunningTokenTotal keeps the total of a message sequence up to date one message at a time.
+ConversationTokenLedger does the same for agent conversations, so budget checks on every turn
+only count the messages added since the last check.
+"""
+
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gpt-4o"
+
+# Model or encoding name -> counter
+_COUNTERS: Dict[str, 'TokenCounter'] = {}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def _content_key(text: str) -> bytes:
+    """Get the cache key of a text"""
+    return hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+
+
+class TokenCounter:
+    """Token counts of one encoder, cached by content hash in a bounded LRU table"""
+
+    def __init__(self, model: str = DEFAULT_MODEL, cache_size: int = 8192):
+        """
+        Initialize counter
+
+        Args:
+            model: Model name (e.g. 'gpt-4o') or tiktoken encoding name (e.g. 'cl100k_base')
+            cache_size: Maximum number of cached counts
+        """
+        self.model = model
+        try:
+            self.encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            self.encoding = tiktoken.get_encoding(model)
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[bytes, int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: bytes) -> Optional[int]:
+        with self._lock:
+            count = self._cache.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def _store(self, key: bytes, count: int) -> None:
+        with self._lock:
+            self._cache[key] = count
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        """
+        Count the tokens of a text
+
+        Args:
+            text: Text to count
+
+        Returns:
+            Number of tokens
+        """
+        if not text:
+            return 0
+        key = _content_key(text)
+        count = self._lookup(key)
+        if count is None:
+            count = len(self.encoding.encode(text))
+            self._store(key, count)
+        return count
+
+    def count_many(self, texts: Iterable[str]) -> List[int]:
+        """
+        Count the tokens of several texts, encoding all uncached ones in one batch
+
+        Args:
+            texts: Texts to count
+
+        Returns:
+            Number of tokens of each text, in input order
+        """
+        texts = list(texts)
+        keys = [_content_key(text) if text else None for text in texts]
+        counts = [0 if key is None else self._lookup(key) for key in keys]
+
+        missing = {}  # Key -> text, each distinct uncached text is encoded once
+        for key, text, count in zip(keys, texts, counts):
+            if count is None:
+                missing.setdefault(key, text)
+        if missing:
+            encoded = self.encoding.encode_batch(list(missing.values()))
+            for key, tokens in zip(missing, encoded):
+                missing[key] = len(tokens)
+                self._store(key, len(tokens))
+            counts = [missing[key] if count is None else count for key, count in zip(keys, counts)]
+        return counts
+
+    def encode(self, text: str) -> List[int]:
+        """Encode text to tokens"""
+        return self.encoding.encode(text)
+
+    def decode(self, tokens: List[int]) -> str:
+        """Decode tokens to text"""
+        return self.encoding.decode(tokens)
+
+    def cache_info(self) -> Dict[str, int]:
+        """Get cache statistics"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._cache), 'max_size': self.cache_size}
+
+
+def get_token_counter(model: str = DEFAULT_MODEL) -> TokenCounter:
+    """
+    Get the shared counter of a model, creating it on first use
+
+    Args:
+        model: Model name or tiktoken encoding name
+
+    Returns:
+        Token counter
+    """
+    counter = _COUNTERS.get(model)
+    if counter is None:
+        with _COUNTERS_LOCK:
+            counter = _COUNTERS.get(model)
+            if counter is None:
+                counter = TokenCounter(model)
+                _COUNTERS[model] = counter
+                logger.debug(f"Loaded token encoder {counter.encoding.name} for {model}")
+    return counter
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Count the tokens of a text with the shared counter of a model"""
+    return get_token_counter(model).count(text)
+
+
+class RunningTokenTotal:
+    """Token total of a sequence of messages, each message counted once when added"""
+
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        """
+        Initialize empty total
+
+        Args:
+            counter: Token counter, defaults to the shared counter of the default model
+        """
+        self.counter = counter or get_token_counter()
+        self.counts: Dict[Hashable, int] = {}
+        self.total = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.counts
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, key: Hashable, text: str, count: Optional[int] = None) -> int:
+        """
+        Add a message, replacing the count of an earlier message with the same key
+
+        Args:
+            key: Message key (e.g. message ID or position in the conversation)
+            text: Message content
+            count: Token count of text if already known
+
+        Returns:
+            Updated total
+        """
+        if count is None:
+            count = self.counter.count(text)
+        self.total += count - self.counts.get(key, 0)
+        self.counts[key] = count
+        return self.total
+
+    def remove(self, key: Hashable) -> int:
+        """Remove a message, returning the updated total"""
+        self.total -= self.counts.pop(key, 0)
+        return self.total
+
+    def reset(self) -> None:
+        """Remove all messages"""
+        self.counts = {}
+        self.total = 0
+
+
+class ConversationTokenLedger:
+    """
+    Running token totals of conversations, each message counted once when it enters the conversation
+
+    A conversation is a message list (e.g. an autogen chat_messages entry) under a key. Syncing a
+    conversation counts appended messages and compares only the last few known messages, by
+    identity of the message and of its content, to catch summaries written into recent messages.
+    A replaced, cleared or rewritten list is compared in full, still without re-encoding.
+    """
+
+    def __init__(self, counter: Optional[TokenCounter] = None, recheck: int = 2):
+        """
+        Initialize empty ledger
+
+        Args:
+            counter: Token counter, defaults to the shared counter of the default model
+            recheck: Number of trailing known messages compared on every sync
+        """
+        self.counter = counter or get_token_counter()
+        self.recheck = recheck
+        # Conversation key -> (message list, [(message, content)] per position, running total)
+        self._conversations: Dict[Hashable, Tuple[Optional[list], List[Tuple[Dict, object]], RunningTokenTotal]] = {}
+
+    @staticmethod
+    def message_text(message: Dict) -> str:
+        """Get the counted text of a message, its content as a string"""
+        content = message.get("content")
+        return str(content) if content else ""
+
+    def sync(self, key: Hashable, messages: List[Dict]) -> int:
+        """
+        Bring the total of a conversation in line with its messages
+
+        Args:
+            key: Conversation key (e.g. the agent the messages are exchanged with)
+            messages: Messages of the conversation, in order
+
+        Returns:
+            Token total of the conversation
+        """
+        known_list, entries, total = self._conversations.get(key) or (None, [], RunningTokenTotal(self.counter))
+        known = min(len(entries), len(messages))
+
+        start = max(0, known - self.recheck)
+        if messages is not known_list or (known and messages[known - 1] is not entries[known - 1][0]):
+            start = 0
+        for position in range(start, known):
+            message = messages[position]
+            if message is not entries[position][0] or message.get("content") is not entries[position][1]:
+                entries[position] = (message, message.get("content"))
+                total.add(position, self.message_text(message))
+
+        for position in range(known, len(entries)):
+            total.remove(position)
+        del entries[known:]
+
+        texts = [self.message_text(message) for message in messages[known:]]
+        for offset, count in enumerate(self.counter.count_many(texts)):
+            message = messages[known + offset]
+            entries.append((message, message.get("content")))
+            total.add(known + offset, texts[offset], count)
+
+        self._conversations[key] = (messages, entries, total)
+        return total.total
+
+    def total(self, key: Hashable) -> int:
+        """Get the last synced token total of a conversation, 0 for unknown conversations"""
+        conversation = self._conversations.get(key)
+        return conversation[2].total if conversation else 0
+
+    def reset(self, key: Optional[Hashable] = None) -> None:
+        """Forget one conversation, or all of them if no key is given"""
+        if key is None:
+            self._conversations = {}
+        else:
+            self._conversations.pop(key, None)
@@ -3,11 +3,15 @@ import re
 import sys
 import pickle
 import json
+import math
 from typing import Dict, List, Optional, Union, Any, Tuple, Annotated, Callable
 from src.core.tree_code import GlobalCodeTreeBuilder
+from src.core.import_index import ImportIndex
+from src.core.symbol_index import EntityNameIndex
+from src.core.text_index import TrigramTextIndex
 import ast
-from grep_ast import TreeContext
-import tiktoken
+from src.core.code_summary_cache import get_summary_cache
+from src.core.token_counter import get_token_counter
 from src.core.code_utils import get_code_abs_token, should_ignore_path, ignored_dirs, ignored_file_patterns, cut_logs_by_token
 from src.utils.data_preview import file_tree, _parse_ipynb_file
 
@@ -15,14 +19,20 @@ from src.utils.data_preview import file_tree, _parse_ipynb_file
 
 
 class CodeExplorerTools:
-    def __init__(self, repo_path: str, work_dir: Optional[str] = None, docker_work_dir: Optional[str] = None, init_embeddings: bool = False):
+    def __init__(self, repo_path: str, work_dir: Optional[str] = None, docker_work_dir: Optional[str] = None, init_embeddings: bool = False,
+                 compact_symbols: bool = False, code_tree_file: Optional[str] = None):
         """Initialize code repository exploration tool
         
         Args:
             repo_path: Local path of code repository
             work_dir: Working directory
+            compact_symbols: Store classes and functions in compact columnar tables to reduce memory
+            code_tree_file: Code tree store to load instead of parsing, written after parsing if missing
         """
         self.context_lines = 0
+        self.compact_symbols = compact_symbols
+        self.code_tree_file = code_tree_file
+        self._entity_indexes = {}  # Entity type -> (indexed table, tree version, EntityNameIndex)
         
         self.repo_path = repo_path
         self.work_dir = work_dir.rstrip('/') if work_dir else ''
@@ -36,21 +46,41 @@ class CodeExplorerTools:
         # Initialize data structures
         self._initialize_data_structures()
         
-        # Initialize vector search related properties
-        self.init_embeddings = init_embeddings
+        # Initialize vector search related properties (the flag must not shadow the init_embeddings method)
+        self.use_embeddings = init_embeddings
         
         if init_embeddings:
             self.retriever = self.init_embeddings()
     
     def _build_new_tree(self):
-        """Build new code tree"""
-        print(f"Analyzing code repository: {self.repo_path}")
-        self.builder = GlobalCodeTreeBuilder(
-            self.repo_path,
-        )
-        self.builder.parse_repository()
+        """Build new code tree, or load it from the code tree store if one is available"""
+        if not self._load_tree_store():
+            print(f"Analyzing code repository: {self.repo_path}")
+            self.builder = GlobalCodeTreeBuilder(
+                self.repo_path,
+            )
+            self.builder.parse_repository()
+            if self.code_tree_file:
+                try:
+                    self.builder.save_store(self.code_tree_file)
+                except Exception as e:
+                    print(f"Unable to save code tree store {self.code_tree_file}: {e}")
+        if self.compact_symbols:
+            self.builder.compact_symbols()
         self.code_tree = self.builder.code_tree
     
+    def _load_tree_store(self) -> bool:
+        """Load builder from the code tree store, returns whether it was loaded"""
+        if not self.code_tree_file or not os.path.exists(self.code_tree_file):
+            return False
+        try:
+            self.builder = GlobalCodeTreeBuilder.load_store(self.code_tree_file, self.repo_path)
+            print(f"Loaded code tree store: {self.code_tree_file}")
+            return True
+        except Exception as e:
+            print(f"Unable to load code tree store {self.code_tree_file}: {e}, re-analyzing repository")
+            return False
+    
     def _initialize_data_structures(self):
         """Initialize internal data structures"""
         # Ensure code_tree contains necessary basic structure
@@ -64,6 +94,7 @@ class CodeExplorerTools:
             self.functions = self.builder.functions
             self.other_files = self.builder.other_files
             self.imports = getattr(self.builder, 'imports', {})
+            self.import_index = getattr(self.builder, 'import_index', None) or ImportIndex(self.imports, self.modules)
         else:
             # If no builder, need to extract from cached code_tree or regenerate tree
             # Note: Cached code_tree may not contain complete class and function information
@@ -75,6 +106,7 @@ class CodeExplorerTools:
                 self.classes = self.builder.classes
                 self.functions = self.builder.functions
                 self.imports = getattr(self.builder, 'imports', {})
+                self.import_index = getattr(self.builder, 'import_index', None) or ImportIndex(self.imports, self.modules)
             else:
                 # Normal extraction from code_tree
                 self.modules = self.code_tree.get('modules', {})
@@ -82,12 +114,40 @@ class CodeExplorerTools:
                 self.classes = self.code_tree.get('classes', {})
                 self.functions = self.code_tree.get('functions', {})
                 self.imports = self.code_tree.get('imports', {})
+                self.import_index = ImportIndex(self.imports, self.modules)
         
         # Print debug information
         print(f"Loaded {len(self.modules)} modules")
         print(f"Loaded {len(self.classes)} classes")
         print(f"Loaded {len(self.functions)} functions")
-    
+
+    def update_files(self, changed_files: List[str], deleted_files: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """
+        Bring the code tree up to date after files in the repository were changed
+
+        Args:
+            changed_files: Created or modified file paths
+            deleted_files: Deleted file paths
+
+        Returns:
+            Dictionary with relative paths of 'updated' and 'removed' files
+        """
+        if not hasattr(self, 'builder'):
+            return {'updated': [], 'removed': []}
+
+        result = self.builder.update_files(changed_files, deleted_files)
+        if result['updated'] or result['removed']:
+            self._sync_builder_tables()
+            print(f"Code tree updated: {len(result['updated'])} files changed, {len(result['removed'])} files removed")
+        return result
+
+    def _sync_builder_tables(self):
+        """Re-read builder tables, compact class/function tables are replaced on every update"""
+        self.code_tree = self.builder.code_tree
+        self.classes = self.builder.classes
+        self.functions = self.builder.functions
+        self.import_index = self.builder.import_index
+
     def _find_entity(self, entity_id: str, entity_type: str) -> Tuple[Optional[str], Optional[str]]:
         """Generic entity search function
         
@@ -117,11 +177,8 @@ class CodeExplorerTools:
         if entity_id in entities:
             matches.append(entity_id)
         else:
-            # Partial match
-            for eid in entities:
-                # If entity ID ends with search term or contains search term
-                if eid.endswith("." + entity_id) or entity_id in eid:
-                    matches.append(eid)
+            # Partial match, entity IDs ending with or containing the search term (a suffix is also a substring)
+            matches = self._get_entity_index(entity_type, entities).search(entity_id)
         
         # Handle match results
         if len(matches) > 5:
@@ -134,6 +191,19 @@ class CodeExplorerTools:
         # Only one match
         return matches[0], None
     
+    def _get_entity_index(self, entity_type: str, entities: Dict) -> EntityNameIndex:
+        """Get name index of an entity table, synced when the table or the code tree changed"""
+        tree_version = getattr(getattr(self, 'builder', None), 'tree_version', 0)
+        cached = self._entity_indexes.get(entity_type)
+        if cached is None:
+            index = EntityNameIndex(entities)
+        else:
+            table, version, index = cached
+            if table is not entities or version != tree_version:
+                index.sync(entities)
+        self._entity_indexes[entity_type] = (entities, tree_version, index)
+        return index
+
     def _normalize_file_path(self, file_path: str, return_abs_path: bool = False) -> str:
         """Normalize file path to module ID format"""
         if return_abs_path:
@@ -146,6 +216,27 @@ class CodeExplorerTools:
             file_path = file_path[:-3]
         return file_path.replace('/', '.').replace('\\', '.')
     
+    def _load_deferred_file(self, file_path: str) -> bool:
+        """Parse a file deferred by the budgeted repository walk, returns whether it was loaded"""
+        if not hasattr(self, 'builder') or not getattr(self.builder, 'deferred_files', None):
+            return False
+        
+        abs_path = file_path if os.path.isabs(file_path) else os.path.join(self.repo_path, file_path)
+        if not os.path.isfile(abs_path):
+            return False
+        if not self.builder.parse_deferred([abs_path])['updated']:
+            return False
+        self._sync_builder_tables()
+        return True
+    
+    def _format_import(self, imp: Dict) -> str:
+        """Format import statement of an import record"""
+        alias = f" as {imp['alias']}" if imp['alias'] else ""
+        if imp['type'] == 'import':
+            return f"import {imp['name']}{alias}"
+        module = '.' * imp.get('level', 0) + imp['module']
+        return f"from {module} import {imp['name']}{alias}"
+
     def _format_call_info(self, call: Dict) -> str:
         """Format function call information"""
         if call['type'] == 'simple':
@@ -321,11 +412,12 @@ class CodeExplorerTools:
 
     def search_keyword_include_code(self, 
                                    keyword_or_code: Annotated[str, "Keywords or code snippets to search for matches"],
-                                   query_intent: Annotated[Optional[str], "Search intent, describing what problem this search aims to solve or what content to find"] = None
+                                   query_intent: Annotated[Optional[str], "Search intent, describing what problem this search aims to solve or what content to find"] = None,
+                                   use_regex: Annotated[bool, "Treat keyword_or_code as a case-insensitive regular expression"] = False
                                   ) -> Annotated[str, "Search results containing matching functions/classes and code snippets, matching lines marked with '>>> '."]:
-        """Search for text lines containing specific keywords and code snippets in code repository, and display matching lines and their files. Similar to grep command but returns more detailed results."""
+        """Search for text lines containing specific keywords and code snippets in code repository, and display matching lines and their files, most relevant files first. Similar to grep command but returns more detailed results."""
         
-        search_result, results_module_name = self._search_keyword_include_code(keyword_or_code, query_intent=query_intent)
+        search_result, results_module_name = self._search_keyword_include_code(keyword_or_code, query_intent=query_intent, use_regex=use_regex)
         
         if self.get_code_abs_token(search_result) > 5000:
             search_result = "Multiple files contain keywords or code snippets below, please select a file to view:\n"
@@ -334,7 +426,7 @@ class CodeExplorerTools:
                 output.append(f"{module_info['module_path']}:       contains {len(module_info['match_codes'])} matching code lines")
             search_result += "\n".join(output)
         
-        if self.init_embeddings:
+        if self.use_embeddings:
             # Try using vector search
             search_query = f"search intent: {query_intent}\nkeyword: {keyword_or_code}"
             vector_search_codes = self._search_with_embeddings(search_query, topk=4)
@@ -655,12 +747,8 @@ class CodeExplorerTools:
             return f"References of class {found_entity_id}:\n" + "\n".join(references)
             
         elif entity_type == "module":
-            references = []
-            for module_id, imports in self.imports.items():
-                for imp in imports:
-                    if ((imp['type'] == 'import' and imp['name'] == found_entity_id) or 
-                        (imp['type'] == 'importfrom' and imp['module'] == found_entity_id)):
-                        references.append(f"- Imported by module {module_id}")
+            references = [f"- Imported by module {module_id}"
+                          for module_id, _ in self.import_index.importers_of(found_entity_id)]
             
             if not references:
                 return f"Module {found_entity_id} is not referenced"
@@ -739,11 +827,7 @@ class CodeExplorerTools:
             
             result = [f"Module {found_entity_id} imports following modules:"]
             for imp in self.imports[found_entity_id]:
-                if imp['type'] == 'import':
-                    result.append(f"- import {imp['name']}" + (f" as {imp['alias']}" if imp['alias'] else ""))
-                else:  # importfrom
-                    result.append(f"- from {imp['module']} import {imp['name']}" + 
-                                 (f" as {imp['alias']}" if imp['alias'] else ""))
+                result.append(f"- {self._format_import(imp)}")
             
             return "\n".join(result)
         
@@ -756,34 +840,44 @@ class CodeExplorerTools:
             return [
                 Document(
                     page_content=doc['source'],
+                    metadata={'doc_id': doc['doc_id']},
                 ) for doc in docs
             ]
-    def init_embeddings(self, topk=4):
-        from src.utils.tool_retriever_embed import EmbeddingMatcher
-        import uuid
+    def init_embeddings(self, topk=4, use_local_embedding=None):
+        from src.utils.tool_retriever_embed import EmbeddingMatcher, get_embedding_model_name
+        from src.utils.embedding_store import EmbeddingStore, repo_identity
+        from src.utils.local_embeddings import use_local_embedding_enabled
+        
+        # Local embeddings (USE_LOCAL_EMBEDDING=true) run offline on the CPU
+        if use_local_embedding is None:
+            use_local_embedding = use_local_embedding_enabled()
         
         # Prepare documents
         documents = []
         for func_id, func_info in self.functions.items():
             if 'source' not in func_info:
                 continue
-            func_info['source'] = f"module: {func_info['module']}\nclass: {func_info['class']}\n{func_info['source']}"
-            content = func_info
+            # Build a separate document so the function record (and its lazily loaded source) is left untouched
+            content = dict(func_info, doc_id=func_id, source=f"module: {func_info['module']}\nclass: {func_info['class']}\n{func_info['source']}")
             documents.append(content)
         
         if not documents:
             return None   
         
+        # One collection per repository and embedding model, reused across tasks: only new or changed functions are embedded
+        persist_directory = EmbeddingStore().open(repo_identity(self.repo_path), get_embedding_model_name(use_local_embedding))
         retriever = EmbeddingMatcher(
             topk=topk, 
+            use_local_embedding=use_local_embedding,
             chunk_size=5000,
             chunk_overlap=0,
             embedding_weight=0.6,
             document_converter=self._prepare_documents,
             initial_docs=documents,
             persistent_db=True,
-            persistent_db_path=f"db/{str(uuid.uuid4())}",
-            persistent_collection_name=str(uuid.uuid4()),
+            persistent_db_path=persist_directory,
+            persistent_collection_name="functions",
+            incremental=True,
         )
         
         return retriever
@@ -818,7 +912,16 @@ class CodeExplorerTools:
             print(f"Vector search failed: {e}")
             return ''
 
-    def _search_keyword_include_code(self, query, max_token=2000, query_intent=None):
+    def _get_text_index(self) -> TrigramTextIndex:
+        """Get trigram index over module and file contents"""
+        if hasattr(self, 'builder'):
+            return self.builder.get_text_index()
+        if getattr(self, '_text_index', None) is None:
+            self._text_index = TrigramTextIndex()
+            self._text_index.sync(list(self.modules.items()) + list(self.other_files.items()))
+        return self._text_index
+
+    def _search_keyword_include_code(self, query, max_token=2000, query_intent=None, use_regex=False):
         # Create a result dictionary grouped by module
         results_by_module = []
         results_module_name = []
@@ -826,14 +929,21 @@ class CodeExplorerTools:
         # If there's search intent, add to results
         if query_intent:
             results_by_module.append(f"# Search intent: {query_intent}\n# Keywords: {query}\n# Search results:\n")
+        
+        # Only files holding every trigram of the query (or of the literals a regex requires) are scanned
+        try:
+            candidate_ids, line_matches = self._get_text_index().search(query, regex=use_regex)
+        except re.error as e:
+            return f"Invalid regular expression {query!r}: {e}", []
             
-        # If vector search has no results, fallback to simple text search
-        def _search_keywords(code, query, context_lines=0):
+        def _search_keywords(code, context_lines=0):
             # Extract matching lines and their context
             context = []
+            matched = 0
             lines = code.split('\n')
             for i, line in enumerate(lines):
-                if query.lower() in line.lower():
+                if line_matches(line):
+                    matched += 1
                     start = max(0, i - context_lines)
                     end = min(len(lines), i + context_lines + 1)
                     for j in range(start, end):
@@ -841,22 +951,30 @@ class CodeExplorerTools:
                         context.append(f"{prefix}{lines[j]}")
                 if len(context) > 50:
                     break
-            return "\n".join(context)        
+            return "\n".join(context), matched, len(lines)
+        
+        importance = self.builder.get_module_importance() if hasattr(self, 'builder') else {}
         
         # Search classes and methods
-        for module_id, module_info in {**self.modules, **self.other_files}.items():
-            # import pdb;pdb.set_trace()
-            if 'content' not in module_info:
+        ranked = []
+        for module_id in candidate_ids:
+            module_info = self.modules.get(module_id) or self.other_files.get(module_id)
+            if module_info is None or 'content' not in module_info:
                 continue
-            code = module_info['content']
-            match_code = _search_keywords(code, query)
+            match_code, matched, total_lines = _search_keywords(module_info['content'])
             if match_code:
-                results_by_module.append(f"```## {module_info['path']}\n" + match_code + "\n```")
-                results_module_name.append({
-                    'module_name': module_id,
-                    'module_path': module_info['path'],
-                    'match_codes': match_code.split('\n')
-                })
+                # Rank by match density, boosted by module importance
+                score = matched / math.sqrt(total_lines) * (1.0 + importance.get(module_id, 0.0) / 10.0)
+                ranked.append((score, module_id, module_info, match_code))
+        
+        ranked.sort(key=lambda x: x[0], reverse=True)
+        for _, module_id, module_info, match_code in ranked:
+            results_by_module.append(f"```## {module_info['path']}\n" + match_code + "\n```")
+            results_module_name.append({
+                'module_name': module_id,
+                'module_path': module_info['path'],
+                'match_codes': match_code.split('\n')
+            })
         
         return "\n".join(results_by_module), results_module_name
     
@@ -992,6 +1110,9 @@ class CodeExplorerTools:
         if query_intent:
             result.append(f"# Browse intent/purpose: {query_intent}\n")
         
+        # Parse the file now if the budgeted repository walk deferred it
+        self._load_deferred_file(file_path)
+        
         # Check if it's Python module path
         module_id = self._normalize_file_path(file_path)
         found_module_id, error = self._find_entity(module_id, "module")
@@ -1079,21 +1200,20 @@ class CodeExplorerTools:
         """
         # Use tiktoken to calculate token count of file content
         try:
-            import tiktoken
-            encoding = tiktoken.encoding_for_model("gpt-4o")
-            content_tokens = len(encoding.encode(module_info['content']))
+            counter = get_token_counter()
+            content_tokens = counter.count(module_info['content'])
             
             # If token count exceeds 3000, return tree-sitter summary
             if content_tokens < max_tokens:
                 summary = module_info['content']
             else:
                 summary = self._get_code_abs(f"{found_module_id}.py", module_info['content'], max_token=max_tokens)
-                if len(encoding.encode(summary)) > max_tokens:
+                if counter.count(summary) > max_tokens:
                     summary = self._get_code_summary(module_info['content'])
-                    if len(encoding.encode(summary)) > max_tokens:
+                    if counter.count(summary) > max_tokens:
                         summary = self._view_filename_tree_sitter(found_module_id, simplified=True)
                 
-                print(f"compare: before {content_tokens} after {len(encoding.encode(summary))}")
+                print(f"compare: before {content_tokens} after {counter.count(summary)}")
         
                 # return self._view_filename_tree_sitter(found_module_id, simplified=True)
                 # summary = self._get_code_summary(module_info['content'])
@@ -1109,29 +1229,22 @@ class CodeExplorerTools:
         return f"### Module: {found_module_id}\n\n**File absolute path: {self.repo_path}/{module_info['path']}**\n\n```python\n{module_info['content']}\n```"
     
     def get_code_abs_token(self, content):
-        encoding = tiktoken.encoding_for_model("gpt-4o")
-        return len(encoding.encode(content))
+        return get_token_counter().count(content)
     
     def _get_code_abs(self, filename, source_code, level=1, max_token=3000):
-        # import pdb;pdb.set_trace()
-        
+        # Summaries are cached by (content hash, level, max_token), all levels share one parse of the file
+        return get_summary_cache().summary(
+            'explorer_code_abs', filename, source_code, (level, max_token),
+            lambda: self._compute_code_abs(filename, source_code, level, max_token)
+        )
+
+    def _compute_code_abs(self, filename, source_code, level, max_token):
         if level == 2:
             child_context = True
         else:
             child_context = False
         
-        context = TreeContext(
-            filename,
-            source_code,
-            color=False,
-            line_number=False,  # Show line numbers
-            child_context=child_context,  # Don't show child context
-            last_line=False,
-            margin=0,  # Don't set margin
-            mark_lois=False,  # Don't mark lines of interest
-            loi_pad=0,
-            show_top_of_file_parent_scope=False,
-        )
+        context = get_summary_cache().tree_context(filename, source_code, child_context=child_context)
 
         if level == 1:
             # Find all function, class definitions and key structures
@@ -1178,7 +1291,12 @@ class CodeExplorerTools:
         return formatted_code
         
     def _get_code_summary(self, source_code: str, max_lines: int = 20) -> str:
-        import ast
+        return get_summary_cache().summary(
+            'ast_summary', 'module.py', source_code, (max_lines,),
+            lambda: self._compute_code_summary(source_code, max_lines)
+        )
+
+    def _compute_code_summary(self, source_code: str, max_lines: int = 20) -> str:
         tree = ast.parse(source_code)
         
         # Extract main structures
@@ -1385,12 +1503,7 @@ class CodeExplorerTools:
             
             # Find other modules that import current module
             result.append("\n## Imported by following modules:")
-            imports_by = []
-            for module_id, imports in self.imports.items():
-                for imp in imports:
-                    if ((imp['type'] == 'import' and imp['name'] == found_entity_id) or 
-                        (imp['type'] == 'importfrom' and imp['module'] == found_entity_id)):
-                        imports_by.append(f"- {module_id}")
+            imports_by = [f"- {module_id}" for module_id, _ in self.import_index.importers_of(found_entity_id)]
             
             if imports_by:
                 result.extend(imports_by)
@@ -1401,11 +1514,7 @@ class CodeExplorerTools:
             result.append("\n## Imports following modules:")
             if found_entity_id in self.imports and self.imports[found_entity_id]:
                 for imp in self.imports[found_entity_id]:
-                    if imp['type'] == 'import':
-                        result.append(f"- import {imp['name']}" + (f" as {imp['alias']}" if imp['alias'] else ""))
-                    else:  # importfrom
-                        result.append(f"- from {imp['module']} import {imp['name']}" + 
-                                     (f" as {imp['alias']}" if imp['alias'] else ""))
+                    result.append(f"- {self._format_import(imp)}")
             else:
                 result.append("- Does not import other modules")
         
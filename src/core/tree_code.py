@@ -5,22 +5,32 @@ Can save code tree locally and generate context content suitable for LLM browsin
 """
 
 import os
-import ast
 import re
 import json
 import networkx as nx
-from typing import Dict, List, Set, Tuple, Optional, Union, Any
+from typing import Dict, Iterable, List, Set, Tuple, Optional, Union, Any
 import argparse
 import logging
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import time
 import pickle
 from tqdm import tqdm
-import tiktoken
+from src.core.context_packer import CANDIDATE_POOL_FACTOR, ContextPacker
 from src.core.code_utils import _get_code_abs, get_code_abs_token, should_ignore_path, ignored_dirs, ignored_file_patterns
 from src.core.repo_summary import generate_repository_summary
+from src.core.code_parser import parse_file, PARSER_VERSION
+from src.core.code_tree_cache import CodeTreeCache
+from src.core.symbol_index import SymbolIndex
+from src.core.import_index import ImportIndex
+from src.core.graph_scoring import GraphScores, score_graph
+from src.core.text_index import TrigramTextIndex
+from src.core.lazy_source import SourceLoader, SourceRecord, count_lines
+from src.core.repo_walker import RepositoryWalker, WalkBudget, count_imported_by
+from src.core.compact_symbols import CompactRecord, CompactRecordTable, StringTable, ItemTable
+from src.core.code_tree_store import CodeTreeStore, CodeTreeStoreWriter, BlobRecord
 import glob
-from src.utils.data_preview import _parse_ipynb_file
 # Import importance analyzer
 try:
     from src.core.importance_analyzer import ImportanceAnalyzer
@@ -43,14 +53,20 @@ logger = logging.getLogger(__name__)
 class GlobalCodeTreeBuilder:
     """Global code tree builder, used to parse code repositories and build LLM-friendly structured representations"""
     
-    def __init__(self, repo_path: str):
+    def __init__(self, repo_path: str, use_cache: bool = True, cache_dir: Optional[str] = None,
+                 max_workers: Optional[int] = None, parallel_min_files: int = 64,
+                 walk_budget: Optional[WalkBudget] = None, key_module_limit: Optional[int] = None):
         """
         Initialize code tree builder
         
         Args:
             repo_path: Path to the code repository
-            ignored_dirs: List of directories to ignore
-            ignored_file_patterns: List of file patterns to ignore
+            use_cache: Whether to reuse per-file parse records cached by earlier analyses
+            cache_dir: Directory of the parse record cache, defaults to CODE_TREE_CACHE_DIR
+            max_workers: Number of parser processes, defaults to the number of CPUs
+            parallel_min_files: Minimum number of files to parse before using the process pool
+            walk_budget: Time / byte / file budget of the repository walk, defaults to WalkBudget.from_env()
+            key_module_limit: Maximum number of modules scored when identifying key modules, None scores all
         """
         self.repo_path = repo_path
         self.call_graph = nx.DiGraph()  # Function call graph
@@ -59,6 +75,17 @@ class GlobalCodeTreeBuilder:
         self.classes = {}  # Class information
         self.other_files = {}  # Other file information
         self.imports = defaultdict(list)  # Import information
+        self.import_index = ImportIndex(known_modules=self.modules)  # Reverse imports (module -> importing modules)
+        self.symbol_index = None  # Lookup tables for call resolution, built after parsing
+        self.source_loader = SourceLoader(self.modules)  # Materializes class/function source on demand
+        self.tree_version = 0  # Incremented on every incremental update, used to invalidate derived caches
+        self.graph_scores = {}  # Centrality of modules and classes, see get_graph_scores()
+        self.graph_scores_version = None  # Tree version graph_scores were computed for
+        self.module_graph_version = 0  # Incremented when modules or the imports between them change
+        self.module_scores_version = None  # Module graph version the module scores were computed for
+        self.text_index = None  # Trigram index over module and file contents, see get_text_index()
+        self.text_index_version = None  # Tree version text_index was synced for
+        self.unscored_modules = set()  # Modules whose tree nodes were re-rendered since nodes were last scored
         self.code_tree = {  # Hierarchical code tree
             'modules': {},
             'stats': {
@@ -74,6 +101,24 @@ class GlobalCodeTreeBuilder:
         self.ignored_dirs = ignored_dirs
         self.ignored_file_patterns = ignored_file_patterns
         
+        # Per-file parse record cache, shared by repeated analyses of the same repository
+        self.cache = CodeTreeCache(repo_path, cache_dir) if use_cache else None
+        
+        # Parallel parsing settings, small repositories are parsed serially
+        self.max_workers = max_workers
+        self.parallel_min_files = parallel_min_files
+        self._executor = None  # Parser process pool shared by the batches of one run, see _parse_pool()
+        
+        # Budgeted walk settings, files left over are kept for on-demand parsing
+        self.walk_budget = walk_budget
+        self.key_module_limit = key_module_limit
+        self.deferred_files = []
+        self.walk_report = {}
+        self.unparsed_files = set()  # Files the parser could not read, kept so store refreshes do not retry them
+        
+        # Code tree store backing module contents when the tree was loaded with load_store
+        self.store = None
+        
         # Check if Jupyter Notebook parsing is supported
         self.jupyter_support = False
         try:
@@ -105,61 +150,16 @@ class GlobalCodeTreeBuilder:
         """Parse the entire code repository"""
         logger.info(f"Starting to parse code repository: {self.repo_path}")
         
-        # Find and parse all Python files and Jupyter Notebook files
-        for root, dirs, files in os.walk(self.repo_path):
-            # Calculate current directory depth (relative to repository root)
-            rel_path = os.path.relpath(root, self.repo_path)
-            current_depth = 0 if rel_path == '.' else len(rel_path.split(os.sep))
-            
-            # If directory depth exceeds 5, skip this directory and its subdirectories
-            if current_depth > 3:
-                dirs[:] = []  # Clear dirs list so os.walk won't enter subdirectories
-                # logger.info(f"Directory {rel_path} depth exceeds 4, skipping this directory and its subdirectories")
-                continue
-            
-            # Modify dirs list in place, skip ignored directories
-            dirs[:] = [d for d in dirs if d not in self.ignored_dirs]
-            
-            # Limit processing to maximum 40 files per directory
-            file_count = 0
-            max_files_per_dir = 40
-            
-            if len(files) > 100:
-                continue
-            elif len(files) > 50:
-                files = files[:5]
-            
-            
-            for file in files:
-                # If already processed 40 files, ignore remaining files in this directory
-                if file_count >= max_files_per_dir:
-                    # logger.info(f"Directory {rel_path} contains more than {max_files_per_dir} files, ignoring remaining files")
-                    break
-                
-                file_path = os.path.join(root, file)
-                rel_path = os.path.relpath(file_path, self.repo_path)
-                
-                # Use unified function to check if should be ignored
-                if should_ignore_path(rel_path):
-                    continue
-                
-                # Add before processing files
-                file_size = os.path.getsize(file_path)
-                if file_size > 10 * 1024 * 1024:  # Skip files larger than 10MB
-                    # logger.info(f"File {rel_path} is too large ({file_size/1024/1024:.2f}MB), skipping")
-                    continue
-                
-                try:
-                    if file.endswith('.py'):
-                        self._parse_python_file(file_path, rel_path)
-                    else:
-                        self._parse_other_file(file_path, rel_path)
-                    
-                    # Increment count after successfully processing file
-                    file_count += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error parsing file {rel_path}: {e}", exc_info=True)
+        # Parse Python files, Jupyter Notebook files and other text files best-first within the walk budget
+        walker = RepositoryWalker(self.repo_path, self.ignored_dirs, self.walk_budget)
+        with self._parse_pool():
+            records = walker.walk(lambda batch: self._parse_files(batch, save_cache=False))
+        for record in records:
+            self._merge_file_record(record)
+        if self.cache:
+            self.cache.save()
+        self.deferred_files = walker.deferred_files
+        self.walk_report = walker.report
         
         # Build various relationships
         self._build_call_relationships()
@@ -175,285 +175,437 @@ class GlobalCodeTreeBuilder:
             logger.info(f"Identified {len(key_modules)} key modules")
         
         logger.info(f"Code repository parsing completed, found {len(self.modules)} modules, {len(self.classes)} classes, {len(self.functions)} functions")
-    
-    def _parse_python_file(self, file_path: str, rel_path: str) -> None:
+
+    def update_files(self, changed_files: List[str], deleted_files: Optional[List[str]] = None) -> Dict[str, List[str]]:
         """
-        Parse single Python file
-        
+        Incrementally update the code tree after files were created, modified or deleted
+
+        Only the touched files are re-parsed. Call edges and called_by lists are patched for the
+        functions whose call resolution can be affected, instead of rebuilding all relationships,
+        and only the tree nodes of modules whose entities changed are re-rendered.
+
+        Args:
+            changed_files: Created or modified files, absolute or relative to the repository root
+            deleted_files: Deleted files, absolute or relative to the repository root
+
+        Returns:
+            Dictionary with relative paths of 'updated' and 'removed' files
+        """
+        changed_list = []
+        for path in changed_files or []:
+            rel_path = self._to_repo_rel_path(path)
+            if rel_path is None or should_ignore_path(rel_path):
+                continue
+            file_path = os.path.join(self.repo_path, rel_path)
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) > 10 * 1024 * 1024:
+                continue
+            changed_list.append((file_path, rel_path))
+
+        removed_paths = []
+        for path in deleted_files or []:
+            rel_path = self._to_repo_rel_path(path)
+            if rel_path is not None and not os.path.exists(os.path.join(self.repo_path, rel_path)):
+                removed_paths.append(rel_path)
+
+        if not changed_list and not removed_paths:
+            return {'updated': [], 'removed': []}
+
+        # Files parsed or removed here are no longer waiting for on-demand parsing
+        touched_paths = {rel_path for _, rel_path in changed_list} | set(removed_paths)
+        self.deferred_files = [item for item in self.deferred_files if item[1] not in touched_paths]
+        if self.walk_report:
+            self.walk_report['deferred_files'] = len(self.deferred_files)
+
+        # Compact tables are read-only, expand them for the duration of the update
+        was_compact = self.is_compact
+        if was_compact:
+            self.expand_symbols()
+
+        # Modules of touched files, their tree nodes are re-rendered below
+        touched_modules = {module_id for module_id, module_info in self.modules.items() if module_info['path'] in touched_paths}
+        removed_lines = sum(self._module_lines(self.modules[module_id]) for module_id in touched_modules)
+
+        # Imports of touched modules before the update, modules they imported are scored again below
+        old_imported = {
+            module_id: self.import_index.imported_modules(module_id, self.modules) for module_id in touched_modules
+        }
+        import_targets = self._import_target_modules(touched_modules)
+
+        # Drop entities of every touched file, remembering which functions disappeared
+        removed_functions = set()
+        changed_callees = set()
+        for rel_path in [rel_path for _, rel_path in changed_list] + removed_paths:
+            removed_functions |= self._remove_file_entities(rel_path, changed_callees)
+            if rel_path in removed_paths:
+                self.unparsed_files.discard(rel_path)
+                if self.cache:
+                    self.cache.remove(rel_path)
+
+        # Re-parse changed files
+        added_functions = set()
+        with self._parse_pool():
+            records = self._parse_files(changed_list)
+        for record in records:
+            self._merge_file_record(record)
+            if record['kind'] == 'python':
+                touched_modules.add(record['module_id'])
+                added_functions.update(record['functions'])
+
+        # Only callers of a name that was added or removed can resolve differently
+        self.symbol_index = SymbolIndex(self.functions, self.classes, self.imports)
+        affected_names = {function_id.rsplit('.', 1)[-1] for function_id in removed_functions | added_functions}
+        affected_functions = set(added_functions)
+        for name in affected_names:
+            affected_functions |= self.symbol_index.callers_by_name.get(name, set())
+
+        for func_id in affected_functions:
+            if func_id in self.functions:
+                changed_callees |= self._patch_call_relationships(func_id, removed_functions)
+
+        # Tree nodes list calls and called_by, so modules of re-resolved callers and of their callees change too
+        dirty_modules = set(touched_modules)
+        for func_id in affected_functions | changed_callees:
+            if func_id in self.functions:
+                dirty_modules.add(self.functions[func_id]['module'])
+
+        # Modules imported before or after the update change importers, a changed module graph moves every centrality
+        touched_existing = [module_id for module_id in touched_modules if module_id in self.modules]
+        import_targets = {
+            module_id for module_id in import_targets | self._import_target_modules(touched_existing)
+            if module_id in self.modules
+        }
+        module_graph_changed = set(touched_existing) != set(old_imported) or any(
+            self.import_index.imported_modules(module_id, self.modules) != old_imported[module_id]
+            for module_id in touched_existing
+        )
+
+        # Refresh derived structures
+        self.tree_version += 1
+        if module_graph_changed:
+            self.module_graph_version += 1
+            self.code_tree.pop('importance_version', None)
+        self.unscored_modules.update(import_targets)
+        self._patch_hierarchical_code_tree(dirty_modules)
+        self.code_tree['stats']['total_lines'] += (
+            sum(self._module_lines(self.modules[module_id]) for module_id in touched_existing) - removed_lines
+        )
+        self._identify_key_class()
+
+        # Touched and imported modules are scored again, every key module when the module graph changed
+        rescored = set(touched_existing) | import_targets
+        if module_graph_changed:
+            rescored.update(m['id'] for m in self.code_tree.get('key_modules', []) if m['id'] in self.modules)
+        key_modules = [
+            m for m in self.code_tree.get('key_modules', [])
+            if m['id'] in self.modules and m['id'] not in rescored
+        ]
+        if rescored:
+            key_modules.extend(self._identify_key_modules([module_id for module_id in self.modules if module_id in rescored]))
+        if key_modules or 'key_modules' in self.code_tree:
+            self.code_tree['key_modules'] = sorted(key_modules, key=lambda x: x['importance_score'], reverse=True)
+        if was_compact:
+            self.compact_symbols()
+
+        updated_paths = [rel_path for _, rel_path in changed_list]
+        logger.info(f"Code tree updated: {len(updated_paths)} files re-parsed, {len(removed_paths)} files removed, "
+                    f"{len(affected_functions)} functions re-resolved")
+        return {'updated': updated_paths, 'removed': removed_paths}
+
+    @property
+    def is_compact(self) -> bool:
+        """Whether class and function tables are compact columnar tables"""
+        return isinstance(self.functions, CompactRecordTable)
+
+    def compact_symbols(self) -> None:
+        """
+        Replace class and function tables with compact, read-only columnar tables
+
+        Records keep the same lookup API (mapping access, 'source' on demand) but strings are
+        interned and calls / called_by / methods lists are stored as arrays, which cuts resident
+        memory of large repositories by an order of magnitude.
+        """
+        if self.is_compact:
+            return
+        strings, items = StringTable(), ItemTable()
+        self.functions = CompactRecordTable(self.functions, self.source_loader, strings, items)
+        self.classes = CompactRecordTable(self.classes, self.source_loader, strings, items)
+        strings.freeze()
+        items.freeze()
+        self._rebind_symbol_tables()
+        logger.info(f"Compacted symbol tables: {len(self.functions)} functions, {len(self.classes)} classes, "
+                    f"{len(strings.strings)} distinct strings")
+
+    def expand_symbols(self) -> None:
+        """Turn compact tables back into mutable record dictionaries"""
+        if not self.is_compact:
+            return
+        self.functions = {
+            function_id: SourceRecord(record, self.source_loader) for function_id, record in self.functions.to_dicts().items()
+        }
+        self.classes = {
+            class_id: SourceRecord(record, self.source_loader) for class_id, record in self.classes.to_dicts().items()
+        }
+        self._rebind_symbol_tables()
+
+    def _rebind_symbol_tables(self) -> None:
+        """Point helpers holding references to the class and function tables at the current tables"""
+        self.symbol_index = None
+        if getattr(self, 'importance_analyzer', None) is not None:
+            self.importance_analyzer.functions = self.functions
+            self.importance_analyzer.classes = self.classes
+
+    def parse_deferred(self, paths: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """
+        Parse files that the budgeted walk deferred
+
+        Args:
+            paths: Files or directories to parse, absolute or relative to the repository root (None for all)
+
+        Returns:
+            Dictionary with relative paths of 'updated' and 'removed' files
+        """
+        if paths is None:
+            selected = self.deferred_files
+        else:
+            prefixes = [rel_path for rel_path in (self._to_repo_rel_path(path) for path in paths) if rel_path]
+            selected = [
+                (file_path, rel_path) for file_path, rel_path in self.deferred_files
+                if any(rel_path == prefix or rel_path.startswith(prefix + os.sep) for prefix in prefixes)
+            ]
+        if not selected:
+            return {'updated': [], 'removed': []}
+
+        # Selected files that vanished since the walk are dropped here, update_files skips them
+        selected_paths = {rel_path for _, rel_path in selected}
+        self.deferred_files = [item for item in self.deferred_files if item[1] not in selected_paths]
+        logger.info(f"Parsing {len(selected)} deferred files, {len(self.deferred_files)} still deferred")
+        return self.update_files([file_path for file_path, _ in selected])
+
+    def _to_repo_rel_path(self, path: str) -> Optional[str]:
+        """Convert a file path to a path relative to the repository root, None if outside the repository"""
+        repo_root = os.path.abspath(self.repo_path)
+        abs_path = os.path.abspath(path if os.path.isabs(path) else os.path.join(repo_root, path))
+        if os.path.commonpath([repo_root, abs_path]) != repo_root or abs_path == repo_root:
+            return None
+        return os.path.relpath(abs_path, repo_root)
+
+    def _import_target_modules(self, module_ids: Iterable[str]) -> Set[str]:
+        """Get IDs of known modules that the given modules may import, from the targets of the import index"""
+        imported = set()
+        for module_id in module_ids:
+            for target in self.import_index.targets.get(module_id, ()):
+                for candidate in (target, f"{target}.__init__"):
+                    if candidate in self.modules:
+                        imported.add(candidate)
+        return imported
+
+    def _remove_file_entities(self, rel_path: str, changed_callees: Optional[Set[str]] = None) -> Set[str]:
+        """
+        Remove module, classes, functions and call edges that came from one file
+
         Args:
-            file_path: Absolute path of the file
             rel_path: Path relative to repository root
+            changed_callees: Collects IDs of remaining functions whose called_by lists were edited (optional)
+
+        Returns:
+            IDs of removed functions
         """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            module_node = ast.parse(content, filename=rel_path)
-            module_docstring = ast.get_docstring(module_node) or ""
-            
-            # Create module ID with dot-separated path
-            module_id = rel_path.replace('/', '.').replace('\\', '.').replace('.py', '')
-            self.modules[module_id] = {
-                'path': rel_path,
-                'docstring': module_docstring,
-                'content': content,
-                'functions': [],
-                'classes': []
-            }
-            
-            # Process import statements
-            self._process_imports(module_node, module_id)
-            
-            # Parse functions and classes
-            for node in ast.walk(module_node):
-                # Process function definitions
-                if isinstance(node, ast.FunctionDef):
-                    if not hasattr(node, 'parent_class'):
-                        self._process_function(node, module_id, None)
-                
-                # Process class definitions
-                elif isinstance(node, ast.ClassDef):
-                    class_id = f"{module_id}.{node.name}"
-                    class_docstring = ast.get_docstring(node) or ""
-                    
-                    # Analyze class inheritance relationships
-                    base_classes = []
-                    for base in node.bases:
-                        if isinstance(base, ast.Name):
-                            base_classes.append(base.id)
-                        elif isinstance(base, ast.Attribute):
-                            base_classes.append(self._get_attribute_path(base))
-                    
-                    self.classes[class_id] = {
-                        'name': node.name,
-                        'module': module_id,
-                        'docstring': class_docstring,
-                        'methods': [],
-                        'base_classes': base_classes,
-                        'source': self._get_source(content, node)
-                    }
-                    
-                    self.modules[module_id]['classes'].append(class_id)
-                    
-                    # Process methods in the class
-                    for class_node in node.body:
-                        if isinstance(class_node, ast.FunctionDef):
-                            # Add parent class attribute for method
-                            class_node.parent_class = class_id
-                            self._process_function(class_node, module_id, class_id)
-        
-        except SyntaxError as e:
-            logger.warning(f"File {rel_path} has syntax errors: {e}")
-        except Exception as e:
-            logger.error(f"Error processing file {rel_path}: {e}")
-    
-    def _parse_other_file(self, file_path: str, rel_path: str) -> None:
+        for module_id, file_info in list(self.other_files.items()):
+            if file_info['path'] == rel_path:
+                del self.other_files[module_id]
+
+        removed_functions = set()
+        for module_id, module_info in list(self.modules.items()):
+            if module_info['path'] != rel_path:
+                continue
+
+            del self.modules[module_id]
+            self.imports.pop(module_id, None)
+            self.import_index.remove_module(module_id)
+            self.source_loader.invalidate(module_id)
+
+            removed_functions.update(module_info['functions'])
+            for class_id in module_info['classes']:
+                class_info = self.classes.pop(class_id, None)
+                if class_info:
+                    removed_functions.update(class_info['methods'])
+
+        for func_id in removed_functions:
+            func_info = self.functions.pop(func_id, None)
+            if func_info is None:
+                continue
+            # Remove this function from called_by lists of the functions it called
+            for called_func_id in set(func_info.get('resolved_calls') or []):
+                if called_func_id in self.functions and called_func_id not in removed_functions:
+                    called_by = self.functions[called_func_id]['called_by']
+                    if func_id in called_by:
+                        called_by.remove(func_id)
+                        if changed_callees is not None:
+                            changed_callees.add(called_func_id)
+            if self.call_graph.has_node(func_id):
+                self.call_graph.remove_node(func_id)
+
+        return removed_functions
+
+    def _patch_call_relationships(self, func_id: str, removed_functions: Set[str]) -> Set[str]:
+        """
+        Re-resolve the calls of one function and patch call edges and called_by lists
+
+        Args:
+            func_id: Function ID
+            removed_functions: IDs of functions removed by the current update, their edges are already gone
+
+        Returns:
+            IDs of called functions whose called_by lists changed
+        """
+        func_info = self.functions[func_id]
+        old_targets = {
+            called_func_id for called_func_id in func_info.get('resolved_calls') or []
+            if called_func_id and called_func_id not in removed_functions
+        }
+
+        resolved_calls = [self._resolve_call(call, func_info['module'], func_info['class']) for call in func_info['calls']]
+        func_info['resolved_calls'] = resolved_calls
+        new_targets = {called_func_id for called_func_id in resolved_calls if called_func_id in self.functions}
+
+        for called_func_id in old_targets - new_targets:
+            if self.call_graph.has_edge(func_id, called_func_id):
+                self.call_graph.remove_edge(func_id, called_func_id)
+            if called_func_id in self.functions and func_id in self.functions[called_func_id]['called_by']:
+                self.functions[called_func_id]['called_by'].remove(func_id)
+
+        for called_func_id in new_targets - old_targets:
+            self.call_graph.add_edge(func_id, called_func_id)
+            if func_id not in self.functions[called_func_id]['called_by']:
+                self.functions[called_func_id]['called_by'].append(func_id)
+
+        return old_targets ^ new_targets
+
+    def _parse_files(self, file_list: List[Tuple[str, str]], save_cache: bool = True) -> List[Dict]:
         """
-        Parse non-Python files, including Jupyter Notebooks etc
+        Parse files into parse records, reusing cached records of unchanged files
         
         Args:
-            file_path: Absolute path of the file
-            rel_path: Path relative to repository root
+            file_list: List of (absolute path, relative path) tuples
+            save_cache: Whether to write the parse record cache to disk afterwards
+            
+        Returns:
+            Parse records in the order of file_list, unparseable files are left out
         """
-        try:
-            if file_path.endswith('.ipynb'):
-                content = _parse_ipynb_file(file_path)
+        records = [None] * len(file_list)
+        pending = []
+        for idx, (file_path, rel_path) in enumerate(file_list):
+            record = self.cache.get(rel_path, file_path) if self.cache else None
+            if record is None:
+                pending.append(idx)
             else:
-                content = open(file_path, 'r', encoding='utf-8').read()
-            
-            # Create a simple module record for non-Python files
-            # Use file extension as "language" identifier
-            file_ext = os.path.splitext(file_path)[1][1:]  # Remove the dot
-            module_id = rel_path.replace('/', '.').replace('\\', '.').replace(f'.{file_ext}', '')
-            
-            self.other_files[module_id] = {
-                'path': rel_path,
-                'docstring': f"Non-Python file: {file_ext.upper()} code",
-                'content': content,
-                'functions': [],
-                'classes': [],
-                'language': file_ext
-            }
-            
-            logger.debug(f"Recorded non-Python file: {rel_path}")
-        
-        except Exception as e:
-            logger.error(f"Error processing non-Python file {rel_path}: {e}")
-    
-    def _process_imports(self, module_node: ast.Module, module_id: str) -> None:
-        """Process import statements in the module"""
-        for node in module_node.body:
-            if isinstance(node, ast.Import):
-                for name in node.names:
-                    self.imports[module_id].append({
-                        'type': 'import',
-                        'name': name.name,
-                        'alias': name.asname
-                    })
-            elif isinstance(node, ast.ImportFrom):
-                module = node.module or ''
-                for name in node.names:
-                    self.imports[module_id].append({
-                        'type': 'importfrom',
-                        'module': module,
-                        'name': name.name,
-                        'alias': name.asname
-                    })
-    
-    def _process_function(self, node: ast.FunctionDef, module_id: str, class_id: Optional[str]) -> None:
-        """Process function or method definition"""
-        function_name = node.name
-        if class_id:
-            function_id = f"{class_id}.{function_name}"
-            self.classes[class_id]['methods'].append(function_id)
-        else:
-            function_id = f"{module_id}.{function_name}"
-            self.modules[module_id]['functions'].append(function_id)
-        
-        docstring = ast.get_docstring(node) or ""
-        
-        # Get source code
-        source = self._get_source(self.modules[module_id]['content'], node)
-        
-        # Analyze function parameters
-        parameters = []
-        for arg in node.args.args:
-            param_name = arg.arg
-            param_type = None
-            if hasattr(arg, 'annotation') and arg.annotation:
-                if isinstance(arg.annotation, ast.Name):
-                    param_type = arg.annotation.id
-                elif isinstance(arg.annotation, ast.Attribute):
-                    param_type = self._get_attribute_path(arg.annotation)
-                elif isinstance(arg.annotation, ast.Subscript):
-                    param_type = self._get_subscript_annotation(arg.annotation)
-            parameters.append({
-                'name': param_name,
-                'type': param_type
-            })
+                records[idx] = record
+        
+        start_time = time.time()
+        parsed = self._run_parse_jobs([file_list[idx] for idx in pending])
+        for idx, record in zip(pending, parsed):
+            records[idx] = record
+            file_path, rel_path = file_list[idx]
+            if record is None:
+                self.unparsed_files.add(rel_path)
+            else:
+                self.unparsed_files.discard(rel_path)
+            if self.cache:
+                self.cache.put(rel_path, file_path, record)
+        logger.info(f"Parsed {len(pending)} files in {time.time() - start_time:.2f}s, {len(file_list) - len(pending)} loaded from cache")
         
-        # Analyze function return type
-        return_type = None
-        if hasattr(node, 'returns') and node.returns:
-            if isinstance(node.returns, ast.Name):
-                return_type = node.returns.id
-            elif isinstance(node.returns, ast.Attribute):
-                return_type = self._get_attribute_path(node.returns)
-            elif isinstance(node.returns, ast.Subscript):
-                return_type = self._get_subscript_annotation(node.returns)
-        
-        # Analyze function calls in the function body
-        calls = self._extract_function_calls(node)
-        
-        self.functions[function_id] = {
-            'name': function_name,
-            'module': module_id,
-            'class': class_id,
-            'docstring': docstring,
-            'parameters': parameters,
-            'return_type': return_type,
-            'calls': calls,
-            'called_by': [],  # Will be populated when building call relationships
-            'source': source
-        }
+        if self.cache and save_cache:
+            self.cache.save()
         
-        # Add node to call graph
-        self.call_graph.add_node(function_id)
+        return [record for record in records if record is not None]
     
-    def _extract_function_calls(self, node: ast.FunctionDef) -> List[Dict]:
-        """Extract function calls from function body"""
-        calls = []
-        
-        for subnode in ast.walk(node):
-            if isinstance(subnode, ast.Call):
-                call_info = self._analyze_call(subnode)
-                if call_info:
-                    calls.append(call_info)
+    @contextmanager
+    def _parse_pool(self):
+        """
+        Keep one parser process pool open for every batch parsed inside the block
+
+        Worker processes start on the first batch large enough for parallel parsing, so runs
+        that only parse a few files never start them. Nested blocks reuse the outer pool.
+        """
+        workers = self.max_workers or os.cpu_count() or 1
+        if workers <= 1 or self._executor is not None:
+            yield
+            return
         
-        return calls
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            yield
+        finally:
+            executor, self._executor = self._executor, None
+            executor.shutdown()
     
-    def _analyze_call(self, node: ast.Call) -> Optional[Dict]:
-        """Analyze function call expression"""
-        if isinstance(node.func, ast.Name):
-            # Simple function call func()
-            return {'type': 'simple', 'name': node.func.id}
-        
-        elif isinstance(node.func, ast.Attribute):
-            # Attribute call obj.method()
-            if isinstance(node.func.value, ast.Name):
-                return {
-                    'type': 'attribute',
-                    'object': node.func.value.id,
-                    'attribute': node.func.attr
-                }
-            # Nested attribute call module.sub.func()
-            return {
-                'type': 'nested_attribute',
-                'full_path': self._get_attribute_path(node.func)
-            }
+    def _run_parse_jobs(self, jobs: List[Tuple[str, str]]) -> List[Optional[Dict]]:
+        """
+        Run the parser over files, using a process pool unless the batch is small
         
-        return None
-    
-    def _get_attribute_path(self, node: ast.Attribute) -> str:
-        """Get complete attribute path (e.g. module.submodule.function)"""
-        parts = []
-        current = node
+        Args:
+            jobs: List of (absolute path, relative path) tuples
+            
+        Returns:
+            Parse records (None for unparseable files) in the order of jobs
+        """
+        workers = self.max_workers or os.cpu_count() or 1
+        if workers <= 1 or len(jobs) < self.parallel_min_files:
+            return [parse_file(file_path, rel_path) for file_path, rel_path in jobs]
         
-        while isinstance(current, ast.Attribute):
-            parts.append(current.attr)
-            current = current.value
+        file_paths = [file_path for file_path, _ in jobs]
+        rel_paths = [rel_path for _, rel_path in jobs]
+        chunksize = max(1, len(jobs) // (workers * 4))
+        try:
+            if self._executor is not None:
+                return list(self._executor.map(parse_file, file_paths, rel_paths, chunksize=chunksize))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(parse_file, file_paths, rel_paths, chunksize=chunksize))
+        except Exception as e:
+            logger.warning(f"Parallel parsing failed: {e}, falling back to serial parsing")
+            return [parse_file(file_path, rel_path) for file_path, rel_path in jobs]
+    
+    def _merge_file_record(self, record: Dict) -> None:
+        """
+        Merge a per-file parse record into the code tree tables
         
-        if isinstance(current, ast.Name):
-            parts.append(current.id)
+        Args:
+            record: Parse record produced by the code parser
+        """
+        module_id = record['module_id']
+        if record['kind'] == 'other':
+            self.other_files[module_id] = record['other_file']
+            logger.debug(f"Recorded non-Python file: {record['other_file']['path']}")
+            return
         
-        return '.'.join(reversed(parts))
-    
-    def _get_subscript_annotation(self, node: ast.Subscript) -> str:
-        """Get subscript expression in type annotation (e.g. List[str])"""
-        # Handle Python 3.8+
-        try:
-            if isinstance(node.value, ast.Name):
-                container = node.value.id
-            elif isinstance(node.value, ast.Attribute):
-                container = self._get_attribute_path(node.value)
-            else:
-                return "unknown"
-            
-            # Compatible with Python 3.8 and earlier
-            if hasattr(node, 'slice') and isinstance(node.slice, ast.Index):
-                slice_value = node.slice.value
-                if isinstance(slice_value, ast.Name):
-                    param = slice_value.id
-                elif isinstance(slice_value, ast.Attribute):
-                    param = self._get_attribute_path(slice_value)
-                else:
-                    param = "unknown"
-            # Compatible with Python 3.9+
-            elif hasattr(node, 'slice'):
-                if isinstance(node.slice, ast.Name):
-                    param = node.slice.id
-                elif isinstance(node.slice, ast.Attribute):
-                    param = self._get_attribute_path(node.slice)
-                else:
-                    param = "unknown"
-            else:
-                param = "unknown"
-            
-            return f"{container}[{param}]"
-        except Exception:
-            return "unknown"
+        self.modules[module_id] = record['module']
+        if record['imports']:
+            self.imports[module_id].extend(record['imports'])
+            self.import_index.add_module(module_id, self.imports[module_id])
+        for class_id, class_info in record['classes'].items():
+            self.classes[class_id] = SourceRecord(class_info, self.source_loader)
+        for function_id, function_info in record['functions'].items():
+            # Copy so call relationships never leak back into the cached record
+            self.functions[function_id] = SourceRecord(dict(function_info, called_by=[]), self.source_loader)
+            # Add node to call graph
+            self.call_graph.add_node(function_id)
     
     def _build_call_relationships(self) -> None:
         """Build call relationships between functions"""
         logger.info("Building function call relationships...")
         
+        # Build lookup tables once, every call site is then resolved with dictionary lookups
+        self.symbol_index = SymbolIndex(self.functions, self.classes, self.imports)
+        
         for func_id, func_info in self.functions.items():
             calls = func_info['calls']
             module_id = func_info['module']
             
-            for call in calls:
-                called_func_id = self._resolve_call(call, module_id, func_info['class'])
-                
+            # Store resolved IDs alongside the calls so later passes never resolve again
+            resolved_calls = [self._resolve_call(call, module_id, func_info['class']) for call in calls]
+            func_info['resolved_calls'] = resolved_calls
+            
+            for called_func_id in resolved_calls:
                 if called_func_id and called_func_id in self.functions:
                     # Add to call graph
                     self.call_graph.add_edge(func_id, called_func_id)
@@ -464,183 +616,206 @@ class GlobalCodeTreeBuilder:
     
     def _resolve_call(self, call: Dict, module_id: str, class_id: Optional[str]) -> Optional[str]:
         """Resolve function call and return the ID of the called function"""
-        if call['type'] == 'simple':
-            # Check functions in the same module
-            direct_func_id = f"{module_id}.{call['name']}"
-            if direct_func_id in self.functions:
-                return direct_func_id
-            
-            # Check methods in the same class
-            if class_id:
-                method_id = f"{class_id}.{call['name']}"
-                if method_id in self.functions:
-                    return method_id
-                
-                # Check methods in parent classes
-                if class_id in self.classes:
-                    for base_class in self.classes[class_id]['base_classes']:
-                        # Try to construct complete base class path
-                        # If it's a simple name, try to find it in the same module
-                        if '.' not in base_class:
-                            potential_base = f"{module_id}.{base_class}"
-                            if potential_base in self.classes:
-                                base_method_id = f"{potential_base}.{call['name']}"
-                                if base_method_id in self.functions:
-                                    return base_method_id
-                        else:
-                            # Already a complete path
-                            base_method_id = f"{base_class}.{call['name']}"
-                            if base_method_id in self.functions:
-                                return base_method_id
-            
-            # Check imported functions
-            for imp in self.imports[module_id]:
-                if imp['type'] == 'importfrom' and imp['name'] == call['name']:
-                    imported_module = imp['module']
-                    imported_func_id = f"{imported_module}.{call['name']}"
-                    if imported_func_id in self.functions:
-                        return imported_func_id
-        
-        elif call['type'] == 'attribute':
-            obj_name = call['object']
-            attr_name = call['attribute']
-            
-            # Check if it's a class instance method call
-            for cls_id in self.classes:
-                if cls_id.endswith(f".{obj_name}"):
-                    method_id = f"{cls_id}.{attr_name}"
-                    if method_id in self.functions:
-                        return method_id
-            
-            # Check imported modules
-            for imp in self.imports[module_id]:
-                if ((imp['type'] == 'import' and imp['name'] == obj_name) or 
-                    (imp['type'] == 'import' and imp['alias'] == obj_name)):
-                    imported_func_id = f"{imp['name']}.{attr_name}"
-                    if imported_func_id in self.functions:
-                        return imported_func_id
-        
-        elif call['type'] == 'nested_attribute':
-            # Handle nested attribute calls
-            full_path = call['full_path']
-            
-            # Check exact match
-            if full_path in self.functions:
-                return full_path
-            
-            # Check partial match
-            for func_id in self.functions:
-                if func_id.endswith(f".{full_path}"):
-                    return func_id
-        
-        return None
+        if self.symbol_index is None:
+            self.symbol_index = SymbolIndex(self.functions, self.classes, self.imports)
+        return self.symbol_index.resolve_call(call, module_id, class_id)
+    
+    def _get_resolved_calls(self, func_info: Dict) -> List[Optional[str]]:
+        """Get resolved IDs of the calls of a function, aligned with func_info['calls']"""
+        if 'resolved_calls' not in func_info:
+            func_info['resolved_calls'] = [self._resolve_call(call, func_info['module'], func_info['class'])
+                                           for call in func_info['calls']]
+        return func_info['resolved_calls']
+    
+    def _module_lines(self, module_info: Dict) -> int:
+        """Get line count of a module, stored modules carry it so their content is not read"""
+        if 'lines' in module_info:
+            return module_info['lines']
+        return len(module_info.get('content', '').splitlines())
     
-    def _get_source(self, content: str, node: ast.AST) -> str:
-        """Extract source code corresponding to AST node"""
-        source_lines = content.splitlines()
-        if hasattr(node, 'lineno') and hasattr(node, 'end_lineno'):
-            start_line = node.lineno - 1  # AST line numbers start from 1, list indices start from 0
-            end_line = node.end_lineno
-            return "\n".join(source_lines[start_line:end_line])
-        return ""
-
     def _build_hierarchical_code_tree(self) -> None:
         """Build hierarchical code tree structure for easy browsing and analysis"""
         logger.info("Building hierarchical code tree...")
         
+        # Every node is new, so they are all scored again
+        self.code_tree.pop('importance_version', None)
+        
         # Calculate statistics
         self.code_tree['stats']['total_modules'] = len(self.modules)
         self.code_tree['stats']['total_classes'] = len(self.classes)
         self.code_tree['stats']['total_functions'] = len(self.functions)
         
         total_lines = 0
-        for module_id, module_info in self.modules.items():
-            module_lines = len(module_info['content'].splitlines())
-            total_lines += module_lines
+        for module_id in self.modules:
+            total_lines += self._add_module_to_tree(module_id)
+        
+        self.code_tree['stats']['total_lines'] = total_lines
+        
+        self._init_importance_analyzer()
+    
+    def _patch_hierarchical_code_tree(self, module_ids: Set[str]) -> None:
+        """
+        Re-render the tree nodes of some modules, leaving the rest of the hierarchical tree untouched
+        
+        Args:
+            module_ids: IDs of modules whose entities changed, including modules that no longer exist
+        """
+        self.code_tree['stats']['total_modules'] = len(self.modules)
+        self.code_tree['stats']['total_classes'] = len(self.classes)
+        self.code_tree['stats']['total_functions'] = len(self.functions)
+        
+        for module_id in module_ids:
+            self._remove_module_from_tree(module_id)
+            if module_id in self.modules:
+                self._add_module_to_tree(module_id)
+        self.unscored_modules.update(module_ids)
+        
+        self._init_importance_analyzer()
+    
+    def _add_module_to_tree(self, module_id: str) -> int:
+        """
+        Add the node of a module with its classes and functions to the hierarchical tree
+        
+        Args:
+            module_id: Module ID
             
-            # Create module node
-            path_parts = module_id.split('.')
-            self._add_to_tree(self.code_tree['modules'], path_parts, {
-                'type': 'module',
-                'id': module_id,
-                'name': path_parts[-1],
-                'docstring': module_info['docstring'][:100] + ('...' if len(module_info['docstring']) > 100 else ''),
-                'classes': [],
-                'functions': [],
-                'lines': module_lines,
-                'is_notebook': module_info.get('is_notebook', False)  # Pass notebook flag
-            })
+        Returns:
+            Number of lines of the module
+        """
+        module_info = self.modules[module_id]
+        module_lines = self._module_lines(module_info)
+        
+        # Create module node
+        path_parts = module_id.split('.')
+        self._add_to_tree(self.code_tree['modules'], path_parts, {
+            'type': 'module',
+            'id': module_id,
+            'name': path_parts[-1],
+            'docstring': module_info['docstring'][:100] + ('...' if len(module_info['docstring']) > 100 else ''),
+            'classes': [],
+            'functions': [],
+            'lines': module_lines,
+            'is_notebook': module_info.get('is_notebook', False)  # Pass notebook flag
+        })
+        
+        # Add classes
+        for class_id in module_info['classes']:
+            class_info = self.classes[class_id]
+            class_lines = count_lines(class_info)
+            
+            class_node = {
+                'type': 'class',
+                'id': class_id,
+                'name': class_info['name'],
+                'docstring': class_info['docstring'][:100] + ('...' if len(class_info['docstring']) > 100 else ''),
+                'methods': [],
+                'base_classes': class_info['base_classes'],
+                'lines': class_lines,
+                'from_notebook': class_info.get('from_notebook', False)  # Pass from_notebook flag
+            }
             
-            # Add classes
-            for class_id in module_info['classes']:
-                class_info = self.classes[class_id]
-                class_lines = len(class_info['source'].splitlines())
+            # Ensure module node has classes key
+            if 'classes' not in self.code_tree['modules'][path_parts[0]]:
+                self.code_tree['modules'][path_parts[0]]['classes'] = []
+            
+            self.code_tree['modules'][path_parts[0]]['classes'].append(class_node)
+            
+            # Add methods
+            for method_id in class_info['methods']:
+                method_info = self.functions[method_id]
+                method_lines = count_lines(method_info)
                 
-                class_node = {
-                    'type': 'class',
-                    'id': class_id,
-                    'name': class_info['name'],
-                    'docstring': class_info['docstring'][:100] + ('...' if len(class_info['docstring']) > 100 else ''),
-                    'methods': [],
-                    'base_classes': class_info['base_classes'],
-                    'lines': class_lines,
-                    'from_notebook': class_info.get('from_notebook', False)  # Pass from_notebook flag
+                method_node = {
+                    'type': 'method',
+                    'id': method_id,
+                    'name': method_info['name'],
+                    'docstring': method_info['docstring'][:100] + ('...' if len(method_info['docstring']) > 100 else ''),
+                    'parameters': method_info['parameters'],
+                    'return_type': method_info['return_type'],
+                    'calls': [c for c, r in zip(method_info['calls'], self._get_resolved_calls(method_info)) if r],
+                    'called_by': method_info['called_by'],
+                    'lines': method_lines
                 }
                 
-                # Ensure module node has classes key
-                if 'classes' not in self.code_tree['modules'][path_parts[0]]:
-                    self.code_tree['modules'][path_parts[0]]['classes'] = []
-                
-                self.code_tree['modules'][path_parts[0]]['classes'].append(class_node)
-                
-                # Add methods
-                for method_id in class_info['methods']:
-                    method_info = self.functions[method_id]
-                    method_lines = len(method_info['source'].splitlines())
-                    
-                    method_node = {
-                        'type': 'method',
-                        'id': method_id,
-                        'name': method_info['name'],
-                        'docstring': method_info['docstring'][:100] + ('...' if len(method_info['docstring']) > 100 else ''),
-                        'parameters': method_info['parameters'],
-                        'return_type': method_info['return_type'],
-                        'calls': [c for c in method_info['calls'] if self._resolve_call(c, method_info['module'], method_info['class'])],
-                        'called_by': method_info['called_by'],
-                        'lines': method_lines
-                    }
-                    
-                    class_node['methods'].append(method_node)
+                class_node['methods'].append(method_node)
+        
+        # Add module-level functions
+        for func_id in module_info['functions']:
+            func_info = self.functions[func_id]
+            func_lines = count_lines(func_info)
+            
+            func_node = {
+                'type': 'function',
+                'id': func_id,
+                'name': func_info['name'],
+                'docstring': func_info['docstring'][:100] + ('...' if len(func_info['docstring']) > 100 else ''),
+                'parameters': func_info['parameters'],
+                'return_type': func_info['return_type'],
+                'calls': [c for c, r in zip(func_info['calls'], self._get_resolved_calls(func_info)) if r],
+                'called_by': func_info['called_by'],
+                'lines': func_lines
+            }
             
-            # Add module-level functions
-            for func_id in module_info['functions']:
-                func_info = self.functions[func_id]
-                func_lines = len(func_info['source'].splitlines())
-                
-                func_node = {
-                    'type': 'function',
-                    'id': func_id,
-                    'name': func_info['name'],
-                    'docstring': func_info['docstring'][:100] + ('...' if len(func_info['docstring']) > 100 else ''),
-                    'parameters': func_info['parameters'],
-                    'return_type': func_info['return_type'],
-                    'calls': [c for c in func_info['calls'] if self._resolve_call(c, func_info['module'], None)],
-                    'called_by': func_info['called_by'],
-                    'lines': func_lines
-                }
+            # Get reference to module node
+            module_node = self._get_tree_node(self.code_tree['modules'], path_parts)
+            if module_node:
+                # Ensure module node has functions key
+                if 'functions' not in module_node:
+                    module_node['functions'] = []
                 
-                # Get reference to module node
-                module_node = self._get_tree_node(self.code_tree['modules'], path_parts)
-                if module_node:
-                    # Ensure module node has functions key
-                    if 'functions' not in module_node:
-                        module_node['functions'] = []
-                    
-                    module_node['functions'].append(func_node)
+                module_node['functions'].append(func_node)
         
-        self.code_tree['stats']['total_lines'] = total_lines
+        return module_lines
+    
+    def _remove_module_from_tree(self, module_id: str) -> None:
+        """
+        Remove the node, class nodes and function nodes of a module from the hierarchical tree, pruning packages left empty
+        
+        Args:
+            module_id: Module ID
+        """
+        path_parts = module_id.split('.')
+        top_node = self.code_tree['modules'].get(path_parts[0])
+        if top_node is None:
+            return
         
-        # Initialize importance analyzer
+        # Class nodes are kept on the top-level node of the module path
+        if top_node.get('classes'):
+            top_node['classes'] = [c for c in top_node['classes'] if c['id'].rsplit('.', 1)[0] != module_id]
+        
+        parents = []
+        tree = self.code_tree['modules']
+        for part in path_parts[:-1]:
+            node = tree.get(part)
+            if node is None or 'children' not in node:
+                return
+            parents.append((tree, part))
+            tree = node['children']
+        
+        node = tree.get(path_parts[-1])
+        if node is None:
+            return
+        if node.get('id') != module_id:
+            # Functions of a module shadowed by a package node were attached to that node
+            if node.get('functions'):
+                node['functions'] = [f for f in node['functions'] if f['id'].rsplit('.', 1)[0] != module_id]
+            return
+        
+        if node.get('children'):
+            # Modules below a module of the same name keep their package node
+            package_node = {'type': 'package', 'name': path_parts[-1], 'children': node['children']}
+            if node.get('classes'):
+                package_node['classes'] = node['classes']
+            tree[path_parts[-1]] = package_node
+        else:
+            del tree[path_parts[-1]]
+            for parent_tree, part in reversed(parents):
+                if parent_tree[part].get('children') or parent_tree[part].get('classes'):
+                    break
+                del parent_tree[part]
+
+    def _init_importance_analyzer(self) -> None:
+        """Initialize importance analyzer over the current tables"""
         self.importance_analyzer = None
         if ImportanceAnalyzer is not None:
             try:
@@ -651,6 +826,8 @@ class GlobalCodeTreeBuilder:
                     functions=self.functions,
                     imports=self.imports,
                     code_tree=self.code_tree,
+                    import_index=self.import_index,
+                    graph_scores=self.get_graph_scores()['modules'],
                     call_graph=self.call_graph
                 )
                 logger.info("Initialized code importance analyzer")
@@ -705,54 +882,61 @@ class GlobalCodeTreeBuilder:
         
         return self._get_tree_node(tree[path[0]]['children'], path[1:])
     
+    def _class_call_edges(self) -> List[Tuple[str, str]]:
+        """Get (caller class, called class) pairs from calls between methods of different classes"""
+        edges = set()
+        for class_id, class_info in self.classes.items():
+            for method_id in class_info['methods']:
+                if method_id not in self.functions:
+                    continue
+                for called_func_id in self._get_resolved_calls(self.functions[method_id]):
+                    if called_func_id and called_func_id in self.functions:
+                        called_class = self.functions[called_func_id]['class']
+                        if called_class and called_class != class_id:
+                            edges.add((class_id, called_class))
+        return list(edges)
+
+    def get_graph_scores(self) -> Dict[str, GraphScores]:
+        """
+        Get centrality scores of the module import graph and the class call graph
+
+        Scores are computed in one vectorized pass per graph. Class scores are cached until the tree
+        changes, module scores until modules or the imports between them change.
+
+        Returns:
+            Dictionary with GraphScores of 'modules' and 'classes'
+        """
+        if self.graph_scores and self.graph_scores_version == self.tree_version:
+            return self.graph_scores
+
+        start_time = time.time()
+        module_scores = self.graph_scores.get('modules')
+        if module_scores is None or self.module_scores_version != self.module_graph_version:
+            module_edges = [
+                (module_id, imported_module)
+                for module_id in self.imports
+                for imported_module in self.import_index.imported_modules(module_id, self.modules)
+            ]
+            module_scores = score_graph(self.modules, module_edges)
+            self.module_scores_version = self.module_graph_version
+        self.graph_scores = {
+            'modules': module_scores,
+            'classes': score_graph(self.classes, self._class_call_edges())
+        }
+        self.graph_scores_version = self.tree_version
+        logger.info(f"Scored module and class graphs in {time.time() - start_time:.2f}s "
+                    f"({len(self.modules)} modules, {len(self.classes)} classes)")
+        return self.graph_scores
+
     def _identify_key_components(self) -> None:
         """Identify key components in the codebase"""
         logger.info("Identifying key components...")
         
         # Only identify class-level key components
         try:
-            # 1. Calculate class importance
-            class_importance = {}
-            
-            # Create a virtual node for each class
-            class_graph = nx.DiGraph()
-            
-            # Add all classes as nodes
-            for class_id in self.classes:
-                class_graph.add_node(class_id)
-            
-            # Add call relationship edges between classes
-            for class_id, class_info in self.classes.items():
-                # Get all methods of this class
-                methods = class_info['methods']
-                
-                # Record other classes called by this class
-                called_classes = set()
-                
-                # Iterate through all methods of this class
-                for method_id in methods:
-                    if method_id in self.functions:
-                        method_info = self.functions[method_id]
-                        
-                        # Iterate through all functions called by this method
-                        for call in method_info['calls']:
-                            called_func_id = self._resolve_call(call, method_info['module'], method_info['class'])
-                            
-                            if called_func_id and called_func_id in self.functions:
-                                called_func = self.functions[called_func_id]
-                                
-                                # If calling a method of another class
-                                if called_func['class'] and called_func['class'] != class_id:
-                                    called_classes.add(called_func['class'])
-                
-                # Add edges for each call relationship
-                for called_class in called_classes:
-                    class_graph.add_edge(class_id, called_class)
-            
-            # If class graph is not empty, calculate PageRank
-            if len(class_graph.nodes()) > 0:
-                class_pagerank = nx.pagerank(class_graph, alpha=0.85, max_iter=100)
-                class_importance = class_pagerank
+            # 1. Calculate class importance, PageRank over calls between methods of different classes
+            class_scores = self.get_graph_scores()['classes']
+            class_importance = {class_id: class_scores.get(class_id, 'pagerank') for class_id in self.classes}
             
             # Add important classes
             key_components = []
@@ -760,7 +944,7 @@ class GlobalCodeTreeBuilder:
                 class_info = self.classes[class_id]
                 
                 # Calculate total lines of the class
-                class_lines = len(class_info['source'].splitlines())
+                class_lines = count_lines(class_info)
                 
                 # Calculate number of methods in the class
                 methods_count = len(class_info['methods'])
@@ -808,8 +992,7 @@ class GlobalCodeTreeBuilder:
                         if method_id in self.functions:
                             method_info = self.functions[method_id]
                             called_by_count += len(method_info['called_by'])
-                            calls_count += len([c for c in method_info['calls'] 
-                                              if self._resolve_call(c, method_info['module'], method_info['class'])])
+                            calls_count += len([r for r in self._get_resolved_calls(method_info) if r])
                     
                     # Simple weighted calculation of importance score
                     importance = (0.4 * called_by_count) + (0.3 * calls_count) + (0.3 * methods_count)
@@ -828,7 +1011,7 @@ class GlobalCodeTreeBuilder:
                         'importance_score': score,
                         'methods_count': len(class_info['methods']),
                         'called_by_count': sum(len(self.functions[m]['called_by']) for m in class_info['methods'] if m in self.functions),
-                        'lines': len(class_info['source'].splitlines()),
+                        'lines': count_lines(class_info),
                         'docstring': class_info['docstring'][:200] if class_info['docstring'] else ""
                     })
                 
@@ -838,8 +1021,16 @@ class GlobalCodeTreeBuilder:
             except Exception as e:
                 logger.error(f"Error calculating component importance using fallback method: {e}", exc_info=True)
     
-    def _identify_key_modules(self) -> List[Dict]:
-        """Identify key modules in the codebase"""
+    def _identify_key_modules(self, module_ids: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Identify key modules in the codebase
+        
+        Args:
+            module_ids: Modules to score (optional, all modules or the most imported ones if omitted)
+            
+        Returns:
+            Key module entries sorted by importance score
+        """
         logger.info("Identifying key modules...")
         
         # Only identify module-level key components
@@ -847,10 +1038,17 @@ class GlobalCodeTreeBuilder:
             logger.warning("No module information available, unable to identify key modules")
             return []
         
-        # Check if there are too many modules
-        if len(self.modules) > 300:
-            logger.warning(f"Too many modules ({len(self.modules)}), skipping key module importance calculation")
-            return []
+        # Score only the most imported modules of large repositories
+        score_all = module_ids is None
+        module_ids = list(self.modules) if score_all else list(module_ids)
+        if score_all and self.key_module_limit is not None and len(module_ids) > self.key_module_limit:
+            imported_by = count_imported_by(self.imports, module_ids)
+            module_ids = sorted(
+                module_ids,
+                key=lambda m: (imported_by.get(m, 0), len(self.modules[m]['classes']) + len(self.modules[m]['functions'])),
+                reverse=True
+            )[:self.key_module_limit]
+            logger.info(f"Scoring {len(module_ids)} of {len(self.modules)} modules for key module identification")
             
         key_modules = []
         
@@ -861,7 +1059,8 @@ class GlobalCodeTreeBuilder:
             # Check if importance analyzer is available
             if hasattr(self, 'importance_analyzer') and self.importance_analyzer is not None:
                 # Use ImportanceAnalyzer to calculate importance scores
-                for module_id, module_info in self.modules.items():
+                for module_id in module_ids:
+                    module_info = self.modules[module_id]
                     # Create node dictionary, ensure it has 'type' field
                     node_info = {'id': module_id, 'type': 'module'}
                     if 'docstring' in module_info:
@@ -880,7 +1079,8 @@ class GlobalCodeTreeBuilder:
             else:
                 # Use internal method to calculate importance
                 logger.info("Using internal method to calculate module importance")
-                for module_id, module_info in self.modules.items():
+                for module_id in module_ids:
+                    module_info = self.modules[module_id]
                     node_info = {
                         'id': module_id, 
                         'type': 'module',
@@ -888,8 +1088,7 @@ class GlobalCodeTreeBuilder:
                         'classes': module_info.get('classes', []),
                         'functions': module_info.get('functions', [])
                     }
-                    if 'content' in module_info:
-                        node_info['lines'] = len(module_info['content'].splitlines())
+                    node_info['lines'] = self._module_lines(module_info)
                     
                     module_importance[module_id] = self._calculate_node_importance(node_info)
             
@@ -900,7 +1099,7 @@ class GlobalCodeTreeBuilder:
                 # Calculate number of classes and functions in the module
                 classes_count = len(module_info.get('classes', []))
                 functions_count = len(module_info.get('functions', []))
-                lines_count = len(module_info.get('content', '').splitlines())
+                lines_count = self._module_lines(module_info)
                 
                 # Add to key modules list
                 key_modules.append({
@@ -917,18 +1116,18 @@ class GlobalCodeTreeBuilder:
             
             logger.info(f"Identified {len(key_modules)} key modules")
             
-            # Add key modules to code tree
-            if 'key_modules' not in self.code_tree:
-                self.code_tree['key_modules'] = []
-            
-            self.code_tree['key_modules'] = sorted(key_modules, key=lambda x: x['importance_score'], reverse=True)
+            # Add key modules to code tree, partial scorings are merged by the caller
+            key_modules = sorted(key_modules, key=lambda x: x['importance_score'], reverse=True)
+            if score_all:
+                self.code_tree['key_modules'] = key_modules
             
         except Exception as e:
             logger.error(f"Error identifying key modules: {e}", exc_info=True)
             # Error handling, ensure returning a valid list
             if not key_modules:
                 # Use simple heuristic method as fallback
-                for module_id, module_info in list(self.modules.items())[:10]:  # Only process first 10 modules
+                for module_id in module_ids[:10]:  # Only process first 10 modules
+                    module_info = self.modules[module_id]
                     key_modules.append({
                         'id': module_id,
                         'name': module_id.split('.')[-1],
@@ -949,15 +1148,19 @@ class GlobalCodeTreeBuilder:
             self._identify_key_components()
             return
         
-        if len(self.modules) > 300:
-            logger.warning(f"Too many modules ({len(self.modules)}), skipping key class importance calculation")
-            return
-            
         try:
-            # Collect all class nodes and calculate their importance
+            # Score classes by their centrality in the class call graph, each measure scaled to 0-1
+            class_scores = self.get_graph_scores()['classes']
+            max_pagerank = class_scores.max('pagerank') or 1.0
+            max_in_degree = class_scores.max('in_degree') or 1.0
+            max_betweenness = class_scores.max('betweenness') or 1.0
             class_importance = {}
-            for class_id, class_info in self.classes.items():
-                class_importance[class_id] = 0            
+            for class_id in self.classes:
+                class_importance[class_id] = (
+                    0.5 * class_scores.get(class_id, 'pagerank') / max_pagerank
+                    + 0.3 * class_scores.get(class_id, 'in_degree') / max_in_degree
+                    + 0.2 * class_scores.get(class_id, 'betweenness') / max_betweenness
+                )
 
             # Add important classes
             key_components = []
@@ -965,7 +1168,7 @@ class GlobalCodeTreeBuilder:
                 class_info = self.classes[class_id]
                 
                 # Calculate total lines of the class
-                class_lines = len(class_info['source'].splitlines())
+                class_lines = count_lines(class_info)
                 
                 # Calculate number of methods in the class
                 methods_count = len(class_info['methods'])
@@ -999,6 +1202,13 @@ class GlobalCodeTreeBuilder:
             logger.info("Falling back to original method to identify key components")
             self._identify_key_components()
     
+    def _export_records(self, records: Dict) -> Dict:
+        """Convert class or function records to plain dictionaries with materialized source"""
+        return {
+            record_id: record.to_dict() if isinstance(record, (SourceRecord, CompactRecord)) else record
+            for record_id, record in records.items()
+        }
+    
     def save_code_tree(self, output_file: str) -> None:
         """
         Save code tree to file
@@ -1011,8 +1221,8 @@ class GlobalCodeTreeBuilder:
             'modules': self.code_tree['modules'],
             'stats': self.code_tree['stats'],
             'key_components': self.code_tree['key_components'],
-            'classes': self.classes,  # Add complete class information
-            'functions': self.functions,  # Add complete function information
+            'classes': self._export_records(self.classes),  # Add complete class information
+            'functions': self._export_records(self.functions),  # Add complete function information
             'imports': dict(self.imports)  # Add import information
         }
         
@@ -1024,12 +1234,13 @@ class GlobalCodeTreeBuilder:
             pickle.dump(complete_tree, f)
         logger.info(f"Code tree saved to file: {output_file}")
     
-    def _calculate_node_importance(self, node: Dict) -> float:
+    def _calculate_node_importance(self, node: Dict, child_scores: Optional[List[float]] = None) -> float:
         """
         Calculate node importance score
         
         Args:
             node: Node information
+            child_scores: Already computed scores of a package's children (optional, scored recursively if omitted)
             
         Returns:
             Importance score
@@ -1037,7 +1248,7 @@ class GlobalCodeTreeBuilder:
         # If there's a dedicated importance analyzer, use it
         if hasattr(self, 'importance_analyzer') and self.importance_analyzer is not None:
             try:
-                return self.importance_analyzer.calculate_node_importance(node)
+                return self.importance_analyzer.calculate_node_importance(node, child_scores)
             except Exception as e:
                 logger.warning(f"Error calculating node importance using importance analyzer: {e}")
         
@@ -1067,12 +1278,127 @@ class GlobalCodeTreeBuilder:
         # If it's a package node
         elif node['type'] == 'package':
             # Recursively calculate importance of child nodes
-            if 'children' in node:
-                for child in node['children'].values():
-                    importance += self._calculate_node_importance(child) * 0.5
+            if child_scores is None:
+                child_scores = [self._calculate_node_importance(child) for child in node.get('children', {}).values()]
+            importance += sum(child_scores) * 0.5
         
         return importance
 
+    def _score_tree_importance(self) -> None:
+        """
+        Score every package and module node of the hierarchical tree bottom-up, once per tree version
+
+        Each score is stored on its node as 'importance', so rendering, thresholds and sorting only read it.
+        After incremental updates only the nodes on the paths of re-rendered modules are scored again.
+        """
+        if self.code_tree.get('importance_version') == self.tree_version:
+            return
+
+        def score(node: Dict) -> float:
+            child_scores = None
+            if node.get('type') == 'package':
+                child_scores = [score(child) for child in node.get('children', {}).values()]
+            node['importance'] = self._calculate_node_importance(node, child_scores)
+            return node['importance']
+
+        start_time = time.time()
+        if self.code_tree.get('importance_version') is None:
+            for node in self.code_tree['modules'].values():
+                score(node)
+        else:
+            # Re-score module nodes and their packages deepest first, other children keep their scores
+            paths = set()
+            for module_id in self.unscored_modules:
+                parts = module_id.split('.')
+                paths.update(tuple(parts[:depth]) for depth in range(1, len(parts) + 1))
+            for path in sorted(paths, key=len, reverse=True):
+                node = self._get_tree_node(self.code_tree['modules'], list(path))
+                if node is None:
+                    continue
+                child_scores = None
+                if node.get('type') == 'package':
+                    child_scores = [
+                        child['importance'] if 'importance' in child else score(child)
+                        for child in node.get('children', {}).values()
+                    ]
+                node['importance'] = self._calculate_node_importance(node, child_scores)
+        self.unscored_modules = set()
+        self.code_tree['importance_version'] = self.tree_version
+        logger.info(f"Scored code tree nodes in {time.time() - start_time:.2f}s")
+
+    def get_module_importance(self) -> Dict[str, float]:
+        """
+        Get importance scores of the module nodes of the hierarchical tree
+
+        Returns:
+            Dictionary mapping module ID to importance score
+        """
+        self._score_tree_importance()
+        scores = {}
+        stack = list(self.code_tree['modules'].values())
+        while stack:
+            node = stack.pop()
+            if node.get('type') == 'package':
+                stack.extend(node.get('children', {}).values())
+            elif node.get('type') == 'module' and 'id' in node:
+                scores[node['id']] = node.get('importance', 0.0)
+        return scores
+
+    def check_incremental_scores(self, tolerance: float = 1e-6) -> Dict[str, Tuple[float, float]]:
+        """
+        Compare importance scores kept up to date by update_files with the scores of a full rebuild
+
+        The repository is parsed again by a fresh builder with the same settings, so this is meant for
+        debugging incremental updates rather than for regular use. Sampled betweenness depends on module
+        order, so repositories with more modules than betweenness samples can differ slightly.
+
+        Args:
+            tolerance: Largest accepted difference between two scores
+
+        Returns:
+            Dictionary mapping 'tree:<module ID>' / 'key:<module ID>' to (incremental, full rebuild) scores
+            that differ, missing scores are None
+        """
+        full = type(self)(
+            self.repo_path, use_cache=self.cache is not None, cache_dir=self.cache.cache_dir if self.cache else None,
+            max_workers=self.max_workers, walk_budget=self.walk_budget, key_module_limit=self.key_module_limit
+        )
+        full.parse_repository()
+
+        mismatches = {}
+        for prefix, incremental_scores, full_scores in (
+            ('tree', self.get_module_importance(), full.get_module_importance()),
+            ('key', {m['id']: m['importance_score'] for m in self.code_tree.get('key_modules', [])},
+             {m['id']: m['importance_score'] for m in full.code_tree.get('key_modules', [])})
+        ):
+            for module_id in set(incremental_scores) | set(full_scores):
+                incremental_score, full_score = incremental_scores.get(module_id), full_scores.get(module_id)
+                if incremental_score is None or full_score is None or abs(incremental_score - full_score) > tolerance:
+                    mismatches[f"{prefix}:{module_id}"] = (incremental_score, full_score)
+
+        if mismatches:
+            logger.warning(f"{len(mismatches)} incremental importance scores differ from a full rebuild: "
+                           f"{dict(list(mismatches.items())[:10])}")
+        return mismatches
+
+    def get_text_index(self) -> TrigramTextIndex:
+        """
+        Get trigram index over module and file contents
+
+        The index is synced with the tables once per tree version, only new or re-parsed files are re-indexed.
+
+        Returns:
+            Text index keyed by module / file ID
+        """
+        if self.text_index is None:
+            self.text_index = TrigramTextIndex()
+        if self.text_index_version != self.tree_version:
+            start_time = time.time()
+            self.text_index.sync(list(self.modules.items()) + list(self.other_files.items()))
+            self.text_index_version = self.tree_version
+            logger.info(f"Text index synced in {time.time() - start_time:.2f}s: {len(self.text_index)} files")
+        return self.text_index
+
     def _append_package_structure(self, content_parts: List[str], tree: Dict, level: int, min_importance: float = 0.5) -> None:
         """
         Recursively add package structure to content, only showing important parts
@@ -1085,6 +1411,9 @@ class GlobalCodeTreeBuilder:
         """
         # Use ignore lists already defined in class attributes, rather than redefining
         
+        # Node scores are computed once per tree version
+        self._score_tree_importance()
+        
         # Sort nodes by name and importance score
         sorted_nodes = []
         for name, node in tree.items():
@@ -1092,8 +1421,7 @@ class GlobalCodeTreeBuilder:
             if name in self.ignored_dirs or any(re.match(pattern, name) for pattern in self.ignored_file_patterns):
                 continue
             
-            importance = self._calculate_node_importance(node)
-            sorted_nodes.append((name, node, importance))
+            sorted_nodes.append((name, node, node['importance']))
         
         # Sort by importance in descending order
         sorted_nodes.sort(key=lambda x: x[2], reverse=True)
@@ -1158,8 +1486,8 @@ class GlobalCodeTreeBuilder:
             'modules': self.code_tree['modules'],
             'stats': self.code_tree['stats'],
             'key_components': self.code_tree['key_components'],
-            'classes': self.classes,
-            'functions': self.functions,
+            'classes': self._export_records(self.classes),
+            'functions': self._export_records(self.functions),
             'imports': dict(self.imports)
         }
         
@@ -1181,6 +1509,153 @@ class GlobalCodeTreeBuilder:
             f.write(self.to_json())
         logger.info(f"Code tree saved to file in JSON format: {output_file}")
 
+    def save_store(self, output_file: str) -> None:
+        """
+        Save code tree to a binary code tree store that can be reopened with load_store
+
+        Symbols, call graph and tree metadata are written as separate sections, file contents as
+        per-file blobs, so loading only reads what is accessed.
+
+        Args:
+            output_file: Output file path
+        """
+        start_time = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        writer = CodeTreeStoreWriter(output_file)
+        try:
+            stored_paths = []
+            blob_tables = {}
+            for table_name, table in (('modules', self.modules), ('other_files', self.other_files)):
+                entries = {}
+                for entity_id, info in table.items():
+                    metadata = {key: value for key, value in dict.items(info) if key != 'content'}
+                    if table_name == 'modules':
+                        metadata['lines'] = self._module_lines(info)
+                    # Blobs of a loaded store are copied as bytes, without loading them into the records
+                    content = info.content_data() if isinstance(info, BlobRecord) else info.get('content', '')
+                    entries[entity_id] = (metadata, writer.add_blob(content))
+                    stored_paths.append(info['path'])
+                blob_tables[table_name] = entries
+
+            # Size and mtime of every file the tree reflects, unreadable files included, for load_store refreshes
+            files = {}
+            for rel_path in stored_paths + sorted(self.unparsed_files):
+                try:
+                    stat = os.stat(os.path.join(self.repo_path, rel_path))
+                    files[rel_path] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    pass
+
+            for table_name, entries in blob_tables.items():
+                writer.add_section(table_name, entries)
+            writer.add_section('classes', self._store_records(self.classes))
+            writer.add_section('functions', self._store_records(self.functions))
+            writer.add_section('imports', dict(self.imports))
+            writer.add_section('call_graph', (list(self.call_graph.nodes()), list(self.call_graph.edges())))
+            writer.add_section('code_tree', self.code_tree)
+            writer.add_section('files', files)
+            writer.close({
+                'repo_path': os.path.abspath(self.repo_path),
+                'parser_version': PARSER_VERSION,
+                'tree_version': self.tree_version,
+                'deferred_files': [rel_path for _, rel_path in self.deferred_files],
+                'unparsed_files': sorted(self.unparsed_files),
+                'walk_report': self.walk_report
+            })
+        except Exception:
+            writer.abort()
+            raise
+        logger.info(f"Code tree store saved in {time.time() - start_time:.2f}s: {output_file}")
+
+    def _store_records(self, records: Dict) -> Dict:
+        """Convert class or function records to plain dictionaries without materialized source"""
+        if isinstance(records, CompactRecordTable):
+            return records.to_dicts()
+        return {record_id: dict(record) for record_id, record in records.items()}
+
+    @classmethod
+    def load_store(cls, store_file: str, repo_path: Optional[str] = None, refresh: bool = True,
+                   resave: bool = True, **kwargs) -> 'GlobalCodeTreeBuilder':
+        """
+        Create builder from a code tree store without parsing the repository
+
+        Args:
+            store_file: File written by save_store
+            repo_path: Repository path, defaults to the path recorded in the store
+            refresh: Whether to re-parse files created, deleted or changed in size or mtime since the store was written
+            resave: Whether to write the store again when the refresh changed the tree
+            **kwargs: Additional constructor arguments
+
+        Returns:
+            Builder with tables backed by the store
+
+        Raises:
+            ValueError: If the file is not a supported code tree store or holds stale parse records
+        """
+        start_time = time.time()
+        store = CodeTreeStore(store_file)
+        if store.metadata.get('parser_version') != PARSER_VERSION:
+            store.close()
+            raise ValueError(f"Code tree store {store_file} was written by another parser version")
+        builder = cls(repo_path or store.metadata['repo_path'], **kwargs)
+        builder.store = store
+
+        for table_name in ('modules', 'other_files'):
+            table = getattr(builder, table_name)
+            for entity_id, (metadata, blob) in store.load_section(table_name).items():
+                table[entity_id] = BlobRecord(metadata, store, blob)
+
+        for table_name in ('classes', 'functions'):
+            table = getattr(builder, table_name)
+            for record_id, record in store.load_section(table_name).items():
+                table[record_id] = SourceRecord(record, builder.source_loader) if 'start_line' in record else record
+
+        builder.imports.update(store.load_section('imports'))
+        builder.import_index = ImportIndex(builder.imports, builder.modules)
+        nodes, edges = store.load_section('call_graph')
+        builder.call_graph.add_nodes_from(nodes)
+        builder.call_graph.add_edges_from(edges)
+        builder.code_tree.clear()
+        builder.code_tree.update(store.load_section('code_tree'))
+
+        builder.tree_version = store.metadata.get('tree_version', 0)
+        builder.walk_report = store.metadata.get('walk_report', {})
+        builder.deferred_files = [
+            (os.path.join(builder.repo_path, rel_path), rel_path) for rel_path in store.metadata.get('deferred_files', [])
+        ]
+        builder.unparsed_files = set(store.metadata.get('unparsed_files', []))
+        builder._init_importance_analyzer()
+        logger.info(f"Code tree store loaded in {time.time() - start_time:.2f}s: {store_file}")
+
+        if refresh:
+            known_files = store.load_section('files')
+            changed_files, deleted_files = [], []
+            for rel_path, (size, mtime) in known_files.items():
+                try:
+                    stat = os.stat(os.path.join(builder.repo_path, rel_path))
+                except OSError:
+                    deleted_files.append(rel_path)
+                    continue
+                if stat.st_size != size or stat.st_mtime_ns != mtime:
+                    changed_files.append(rel_path)
+
+            # Files created after the store was written, deferred files stay deferred
+            deferred_paths = {rel_path for _, rel_path in builder.deferred_files}
+            walker = RepositoryWalker(builder.repo_path, builder.ignored_dirs)
+            for _, rel_path, _, _ in walker.iter_candidates():
+                if rel_path not in known_files and rel_path not in deferred_paths:
+                    changed_files.append(rel_path)
+
+            if changed_files or deleted_files:
+                result = builder.update_files(changed_files, deleted_files)
+                if resave and (result['updated'] or result['removed']):
+                    try:
+                        builder.save_store(store_file)
+                    except Exception as e:
+                        logger.warning(f"Unable to save refreshed code tree store {store_file}: {e}")
+
+        return builder
+
     def _parse_package_import(self, codes: str) -> str:
         # Parse import statements in code
         code_dependce = ""
@@ -1232,24 +1707,37 @@ class GlobalCodeTreeBuilder:
         
         important_codes = {}
         if self.code_tree['key_components']:
+            # Track the size of the rendered string by its parts: header, per-file blocks and class summaries
+            packer = ContextPacker(max_tokens)
+            packer.add("# Key component source code examples\n", force=True)
             # Select top 3 key components to display source code
             for component in self.code_tree['key_components']:
-                token = tiktoken.encoding_for_model("gpt-4o")
-                if len(token.encode(class_code_to_string(important_codes))) > max_tokens:
-                    continue
                 # Check if component ID exists in corresponding dictionary
                 if component['type'] == 'class' and component['id'] in self.classes:
                     class_info = self.classes[component['id']]
                     class_path = self.modules[class_info['module']]['path']
+                    # important_codes[class_path].append(f"## {class_info['name']} (Class)\n")
+                    # Use tree-sitter to generate code structure summary instead of complete source code
+                    fragments = [self._get_ast_simple_summary(class_info['source'])]
+                    if class_path not in important_codes:
+                        # The first class of a file also brings the file header and its imports
+                        code_content = self.modules[class_info['module']]['content']
+                        fragments += [f"```python\n## {class_path}\n", self._parse_package_import(code_content), "\n```\n"]
+                    if sum(packer.cost(fragment) for fragment in fragments) > packer.remaining:
+                        # Skip what does not fit, a later smaller component may still fit
+                        if packer.is_full:
+                            break
+                        continue
+                    for fragment in fragments:
+                        packer.add(fragment, force=True)
+
                     if class_path not in important_codes:
                         important_codes[class_path] = {
                             'module': class_info['module'],
                             'name': class_info['name'],
                             'class_list': []
                         }
-                    # important_codes[class_path].append(f"## {class_info['name']} (Class)\n")
-                    # Use tree-sitter to generate code structure summary instead of complete source code
-                    important_codes[class_path]['class_list'].append(self._get_ast_simple_summary(class_info['source']))
+                    important_codes[class_path]['class_list'].append(fragments[0])
         
         return class_code_to_string(important_codes)
     
@@ -1494,7 +1982,7 @@ class GlobalCodeTreeBuilder:
                 return "\n".join(lines[:max_lines]) + f"\n... (omitted remaining {len(lines) - max_lines} lines)"
             return source_code
     
-    def get_repo_summary_list(self, max_tokens, is_file_summary):
+    def get_repo_summary_list(self, max_tokens, is_file_summary, packing_strategy='greedy'):
 
         # Get repository core files, LLM generates repository summary
         important_repo_files_keys = [
@@ -1542,21 +2030,35 @@ class GlobalCodeTreeBuilder:
             # Add summary of other files to result
             repo_summary_list.extend(other_summary_list)
         else:
-            # Directly add file content without generating summary
-            for file_info in other_important_files:
-                if get_code_abs_token(json.dumps(file_info, ensure_ascii=False, indent=2))+current_token > max_tokens:
-                    break
+            # Directly add file content without generating summary, the files that best fill the remaining budget
+            packer = ContextPacker(max_tokens - current_token)
+            chosen = packer.add_best(
+                [json.dumps(file_info, ensure_ascii=False, indent=2) for file_info in other_important_files],
+                # Files found earlier rank higher
+                [len(other_important_files) - idx for idx in range(len(other_important_files))],
+                strategy=packing_strategy
+            )
+            for idx in chosen:
                 repo_summary_list.append({
-                    'file_path': file_info['file_path'],
-                    'file_content': file_info['file_content']
+                    'file_path': other_important_files[idx]['file_path'],
+                    'file_content': other_important_files[idx]['file_content']
                 })
                 
         return repo_summary_list
 
-    def generate_llm_important_modules(self, max_tokens: int = 4000, is_file_summary: bool = True) -> str:
-        """Get the most core parts of the entire repository code"""
+    def generate_llm_important_modules(self, max_tokens: int = 4000, is_file_summary: bool = True,
+                                       packing_strategy: str = 'greedy') -> str:
+        """
+        Get the most core parts of the entire repository code
+
+        Args:
+            max_tokens: Token budget
+            is_file_summary: Whether to summarize important files that do not fit with an LLM
+            packing_strategy: How key module summaries are chosen for the budget, 'greedy' by importance
+                per token or 'knapsack' for the highest total importance (see select_fragments)
+        """
         out_content_list = []
-        repo_summary_list = self.get_repo_summary_list(max_tokens, is_file_summary)
+        repo_summary_list = self.get_repo_summary_list(max_tokens, is_file_summary, packing_strategy)
         out_content_list.append("# Repository core file summary\n")
         out_content_list.append(json.dumps(repo_summary_list, ensure_ascii=False))
         # out_content_list.append(json.dumps([{'file_summary': file_info['file_content']} for file_info in repo_summary_list], indent=2, ensure_ascii=False))
@@ -1576,13 +2078,31 @@ class GlobalCodeTreeBuilder:
             
             key_modules.sort(key=lambda x: x['importance_score'], reverse=True)
             
+            # Running token count of out_content_list, each part is tokenized once as it is dumped to JSON
+            packer = ContextPacker(max_tokens, separator=",\n  ")
+            for content in out_content_list:
+                packer.add(json.dumps(content, ensure_ascii=False), force=True)
+
+            # Candidates in importance order, until they would fill the budget several times over
+            candidates, candidate_tokens = [], 0
             for module in key_modules:
-                if get_code_abs_token("\n".join(out_content_list)) > max_tokens:
+                if candidate_tokens > CANDIDATE_POOL_FACTOR * packer.remaining:
                     break
                 code_content = self.modules[module['id']]['content']
                 module_path = self.modules[module['id']]['path']
                 tree_sitter_summary = _get_code_abs(module_path, code_content, child_context=False)
-                
+                module_content = f"```python\n## {module_path}\n"+tree_sitter_summary+"\n```\n"
+                fragment = json.dumps(module_content, ensure_ascii=False)
+                candidates.append((module, code_content, module_path, tree_sitter_summary, module_content, fragment))
+                candidate_tokens += packer.cost(fragment)
+
+            chosen = packer.add_best(
+                [candidate[-1] for candidate in candidates],
+                [candidate[0]['importance_score'] for candidate in candidates],
+                strategy=packing_strategy
+            )
+            for idx in chosen:
+                module, code_content, module_path, tree_sitter_summary, module_content, _ = candidates[idx]
                 important_codes_list[module['id']] = {
                     'name': module['name'],
                     'id': module['id'],
@@ -1593,7 +2113,7 @@ class GlobalCodeTreeBuilder:
                 
                 # out_content_list.append(f"```python\n## {self.modules[module['id']]['path']}\n")
                 # out_content_list.append(tree_sitter_summary+"\n```\n")
-                out_content_list.append(f"```python\n## {self.modules[module['id']]['path']}\n"+tree_sitter_summary+"\n```\n")
+                out_content_list.append(module_content)
             
             other_content_list = []
             for module in self.code_tree['key_modules'][:20]:
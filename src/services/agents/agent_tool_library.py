@@ -2,7 +2,7 @@ import json
 import requests
 from typing import Annotated, Optional, Union, Callable
 from src.utils.agent_gpt4 import AzureGPT4Chat
-import tiktoken
+from src.core.token_counter import count_tokens
 
 class AgentToolLibrary:
     def __init__(
@@ -171,7 +171,7 @@ Please analyze the provided webpage browsing results based on the above principl
         Browse detailed content of a specific URL and extract relevant information
         """
         browsing_result = await self.web_browser.browsing_url(url)
-        token_count = len(tiktoken.encoding_for_model("gpt-4o").encode(browsing_result))
+        token_count = count_tokens(browsing_result)
         if token_count < 2000:
             return browsing_result
         
@@ -20,7 +20,7 @@ from src.services.agents.agent_general_coder import GeneralCoder
 from src.utils.tools_util import get_autogen_message_history
 
 import traceback
-import tiktoken  # Add this import for calculating token count
+from src.core.token_counter import get_token_counter
 from copy import deepcopy
 
 from src.utils.tool_summary import generate_summary
@@ -113,7 +113,7 @@ class AutogenDeepSearchAgent:
         self.max_tool_messages_before_summary = 2  # How many rounds of tool calls before summarizing
         self.current_tool_call_count = 0
         self.token_limit = 2000  # Set token count limit
-        self.encoding = tiktoken.get_encoding("cl100k_base")  # Use OpenAI's encoder
+        self.token_counter = get_token_counter("cl100k_base")  # Use OpenAI's encoder
         
         # Create researcher agent - responsible for thinking and analysis
         self.researcher = ExtendedAssistantAgent(
@@ -172,11 +172,12 @@ class AutogenDeepSearchAgent:
         # Add message handling interception for executor
         def executor_receive_with_summary(message, sender, silent):
             # Check if it's a function call from the researcher
-            message_history = deepcopy(self.executor.chat_messages[self.researcher])
+            # Only the last two messages are checked, the history is copied when it is summarized
+            message_history = self.executor.chat_messages[self.researcher]
             if sender == self.researcher and len(message_history)>1:
                 if 'tool_responses' in message_history[-1] and 'tool_calls' in message_history[-2]:
                     # Increase tool call count
-                    self._summarize_tool_response(message_history, message)
+                    self._summarize_tool_response(deepcopy(message_history), message)
                     self.current_tool_call_count += 1
             
             # Process message normally
@@ -225,7 +226,7 @@ class AutogenDeepSearchAgent:
                 tool_calls = str(tool_calls)
             
             # Calculate token count instead of character count
-            token_count = len(self.encoding.encode(tool_responses))
+            token_count = self.token_counter.count(tool_responses)
             if token_count < self.token_limit:
                 continue
             
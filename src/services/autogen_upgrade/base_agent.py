@@ -15,7 +15,7 @@ from autogen import AssistantAgent, UserProxyAgent, ConversableAgent
 from src.core.code_utils import filter_pip_output, cut_execute_result_by_token, cut_logs_by_token
 from src.utils.pip_install_error.judge_pip_error import judge_pip_package
 from src.services.autogen_upgrade.autogen_fix_execution import filter_duplicate_commands
-from src.services.autogen_upgrade.file_monitor import get_directory_files, compare_and_display_new_files
+from src.services.autogen_upgrade.file_monitor import get_directory_files, compare_and_display_new_files, diff_directory_files
 from autogen import Agent
 from autogen.agentchat.conversable_agent import logger
 
@@ -132,9 +132,29 @@ class ExtendedUserProxyAgent(BasicConversableAgent, TrackableUserProxyAgent):
         self.local_repo_path = local_repo_path
         self.work_dir = work_dir
         
+        # Callbacks notified with (changed_files, deleted_files) after code execution touched the working directory
+        self.file_change_callbacks = []
+        
         # self.replace_function_call_func()
         self.replace_code_execution_func()
 
+    def register_file_change_callback(self, callback):
+        """Register a callback called with (changed_files, deleted_files) after each code execution"""
+        self.file_change_callbacks.append(callback)
+
+    def notify_file_changes(self, before_files, after_files):
+        """Pass files created, modified or deleted by the last code execution to registered callbacks"""
+        if not self.file_change_callbacks:
+            return
+        changed_files, deleted_files = diff_directory_files(before_files, after_files)
+        if not changed_files and not deleted_files:
+            return
+        for callback in self.file_change_callbacks:
+            try:
+                callback(changed_files, deleted_files)
+            except Exception as e:
+                print(f"File change callback failed: {traceback.format_exc()}", flush=True)
+
     async def a_initiate_chat(
         self,
         recipient: "ConversableAgent",
@@ -494,6 +514,8 @@ class ExtendedUserProxyAgent(BasicConversableAgent, TrackableUserProxyAgent):
             except Exception as e:
                 file_changes_info = f"Error monitoring file changes: {str(e)}"
                 print(f"File monitoring error: {traceback.format_exc()}", flush=True)
+            
+            self.notify_file_changes(before_files, after_files)
         
         if 0:
             re_execute_result = self.process_import_error(
@@ -7,7 +7,7 @@ import json
 import tempfile
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 
 def should_ignore_path(path: Path) -> bool:
@@ -91,6 +91,27 @@ def get_directory_files(directory: Path) -> Dict[str, Dict]:
     return files_info
 
 
+def diff_directory_files(before_files: Dict[str, Dict], after_files: Dict[str, Dict]) -> Tuple[List[str], List[str]]:
+    """Compare two directory snapshots taken by get_directory_files.
+
+    Args:
+        before_files: Snapshot before the operation
+        after_files: Snapshot after the operation
+
+    Returns:
+        Tuple of (created or modified file paths, deleted file paths)
+    """
+    changed_files = []
+    for file_path, info in after_files.items():
+        before_info = before_files.get(file_path)
+        if (before_info is None or before_info["mtime"] != info["mtime"]
+                or before_info["size"] != info["size"]):
+            changed_files.append(file_path)
+
+    deleted_files = [file_path for file_path in before_files if file_path not in after_files]
+    return changed_files, deleted_files
+
+
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human-readable format.
     
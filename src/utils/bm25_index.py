@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+BM25 index - In-process inverted index for lexical search over a chunk corpus
+
+The index is built once over all chunks, grows and shrinks with the corpus (documents can be
+added and removed one at a time) and is saved as JSON next to the vector store. Queries only
+touch the postings of their terms. Rankings of independent retrievers are combined with
+reciprocal rank fusion.
+"""
+
+import os
+import re
+import json
+import math
+import heapq
+import logging
+import tempfile
+from collections import Counter, defaultdict
+from typing import Container, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "bm25_index.json"
+FORMAT_VERSION = 1
+
+_WORD_RE = re.compile(r'[A-Za-z0-9_]+')
+_CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase search terms
+
+    Identifiers also yield their parts, so 'get_code_abs' matches 'code' and
+    'EmbeddingMatcher' matches 'matcher'.
+    """
+    terms = []
+    for word in _WORD_RE.findall(text):
+        lowered = word.lower()
+        terms.append(lowered)
+        parts = [part.lower() for piece in word.split('_') for part in _CAMEL_RE.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over an appendable set of documents"""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        """
+        Initialize empty index
+
+        Args:
+            k1: Term frequency saturation
+            b: Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)  # Term -> document ID -> term frequency
+        self.doc_lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Dict] = {}  # Document ID -> {'text', 'metadata'}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict] = None) -> None:
+        """Index a document, replacing an earlier document with the same ID"""
+        if doc_id in self.doc_lengths:
+            self.remove(doc_id)
+        terms = tokenize(text)
+        for term, frequency in Counter(terms).items():
+            self.postings[term][doc_id] = frequency
+        self.doc_lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+        self.documents[doc_id] = {'text': text, 'metadata': metadata or {}}
+
+    def add_many(self, items: Iterable[Tuple[str, str, Optional[Dict]]]) -> None:
+        """Index (document ID, text, metadata) tuples"""
+        for doc_id, text, metadata in items:
+            self.add(doc_id, text, metadata)
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document from the index"""
+        if doc_id not in self.doc_lengths:
+            return
+        for term in set(tokenize(self.documents[doc_id]['text'])):
+            documents = self.postings.get(term)
+            if documents is not None:
+                documents.pop(doc_id, None)
+                if not documents:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        del self.documents[doc_id]
+
+    def search(self, query: str, k: int = 10, allowed: Optional[Container[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Rank documents for a query
+
+        Args:
+            query: Query text
+            k: Number of results
+            allowed: Only rank the documents with these IDs (None ranks all)
+
+        Returns:
+            Up to k (document ID, score) tuples, best first, documents sharing no term are left out
+        """
+        if not self.doc_lengths:
+            return []
+        n = len(self.doc_lengths)
+        average_length = self.total_length / n or 1.0
+
+        scores: Dict[str, float] = defaultdict(float)
+        for term, query_frequency in Counter(tokenize(query)).items():
+            documents = self.postings.get(term)
+            if not documents:
+                continue
+            idf = math.log(1.0 + (n - len(documents) + 0.5) / (len(documents) + 0.5))
+            for doc_id, frequency in documents.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] += query_frequency * idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str) -> None:
+        """Write the index to a JSON file (atomically)"""
+        data = {
+            'version': FORMAT_VERSION,
+            'k1': self.k1,
+            'b': self.b,
+            'documents': self.documents,
+        }
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.bm25-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional['BM25Index']:
+        """
+        Read an index written by save
+
+        Postings are rebuilt from the stored documents, which keeps the file format small and simple.
+
+        Args:
+            path: Index file
+
+        Returns:
+            Index, None if the file is missing or unreadable
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable BM25 index {path}: {e}")
+            return None
+        if data.get('version') != FORMAT_VERSION:
+            return None
+
+        index = cls(k1=data['k1'], b=data['b'])
+        for doc_id, document in data['documents'].items():
+            index.add(doc_id, document['text'], document['metadata'])
+        return index
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], weights: Optional[Sequence[float]] = None,
+                           c: int = 60) -> List[Tuple[Hashable, float]]:
+    """
+    Combine rankings of independent retrievers
+
+    Args:
+        rankings: Item keys of each retriever, best first
+        weights: Weight of each retriever, equal weights by default
+        c: Rank offset, damps the influence of the top ranks
+
+    Returns:
+        (item key, fused score) tuples, best first
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + weight / (rank + 1 + c)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
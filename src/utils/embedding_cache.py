@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Embedding cache - Vectors of already embedded texts, kept on disk by content hash
+
+Identical text (the same README chunk or function in another task, a repeated search snippet) is
+embedded once per embedding model. The cache is a SQLite database in WAL mode, so several
+processes can share it, and CachedEmbeddings wraps any embedding model (langchain Embeddings
+interface) so that only texts missing from the cache reach the model.
+"""
+
+import os
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = "db/embedding_cache.sqlite"
+# Hashes per SQLite query (stays under the default limit of bound parameters)
+LOOKUP_BATCH_SIZE = 500
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def text_hash(text: str) -> bytes:
+    """Get the hash a text's vector is cached under"""
+    return hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """SQLite table of (model, text hash) -> float32 vector"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        """
+        Open cache, creating the database if missing
+
+        Args:
+            path: SQLite database file
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors ("
+                "model TEXT NOT NULL, hash BLOB NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, hash))"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Look up vectors of texts
+
+        Args:
+            model: Embedding model name, vectors of different models never mix
+            texts: Texts to look up
+
+        Returns:
+            Vector of each text, None for texts not in the cache
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start_idx in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+                batch = list(set(hashes[start_idx:start_idx + LOOKUP_BATCH_SIZE]))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM vectors WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                found.update(rows)
+
+        vectors = [np.frombuffer(found[h], dtype=np.float32).tolist() if h in found else None for h in hashes]
+        hits = sum(vector is not None for vector in vectors)
+        self.hits += hits
+        self.misses += len(vectors) - hits
+        return vectors
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Store vectors of texts"""
+        rows = [
+            (model, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in zip(texts, vectors) if vector is not None
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO vectors (model, hash, vector) VALUES (?, ?, ?)", rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def get_embedding_cache(path: Optional[str] = None) -> EmbeddingCache:
+    """
+    Get the process-wide cache of a database file
+
+    Args:
+        path: SQLite database file, defaults to EMBEDDING_CACHE_PATH or db/embedding_cache.sqlite
+
+    Returns:
+        Embedding cache
+    """
+    path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+    with _CACHES_LOCK:
+        if path not in _CACHES:
+            _CACHES[path] = EmbeddingCache(path)
+        return _CACHES[path]
+
+
+class CachedEmbeddings:
+    """Embedding model wrapper that only embeds texts missing from an embedding cache"""
+
+    def __init__(self, embeddings, model_name: str, cache: Optional[EmbeddingCache] = None):
+        """
+        Initialize wrapper
+
+        Args:
+            embeddings: Embedding model with embed_documents and embed_query
+            model_name: Name identifying the vectors of the model (see get_embedding_model_name)
+            cache: Embedding cache, defaults to the process-wide cache
+        """
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or get_embedding_cache()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = self.cache.get_many(self.model_name, texts)
+        # Each distinct missing text is embedded once
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.embeddings.embed_documents(missing)))
+            self.cache.put_many(self.model_name, missing, [computed[text] for text in missing])
+            vectors = [computed[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        # Some models embed queries differently from documents, so queries are cached under their own name
+        query_model = f"{self.model_name}#query"
+        vector = self.cache.get_many(query_model, [text])[0]
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many(query_model, [text], [vector])
+        return vector
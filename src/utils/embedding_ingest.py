@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Embedding ingestion - Embeds large document sets with bounded concurrency and rate-limit backoff
+
+Texts are embedded in batches by a small thread pool. A batch is limited by the number of texts
+and by tokens. The batch size grows while requests succeed, and shrinks when the API answers 429.
+Rate-limit responses pause all workers until the time the API asks for (Retry-After), or an
+exponential backoff with jitter when the response does not say. No fixed sleeps between batches.
+"""
+
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from src.core.token_counter import get_token_counter
+
+try:
+    from openai import APIConnectionError, APITimeoutError, RateLimitError
+except ImportError:
+    APIConnectionError = APITimeoutError = RateLimitError = None
+
+logger = logging.getLogger(__name__)
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    """Get the HTTP status of an API error, if it carries one"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Get the delay an error response asks for in its Retry-After header, in seconds"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    value = headers.get('retry-after-ms')
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except (TypeError, ValueError):
+            pass
+    value = headers.get('retry-after')
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error: Exception) -> Tuple[bool, bool]:
+    """
+    Tell how to react to an embedding request error
+
+    Args:
+        error: Exception raised by the embedding client
+
+    Returns:
+        Tuple of (is rate limited, is worth retrying)
+    """
+    status = _error_status(error)
+    if status == 429 or (RateLimitError is not None and isinstance(error, RateLimitError)):
+        return True, True
+    if status is not None and status >= 500:
+        return False, True
+    if APIConnectionError is not None and isinstance(error, (APIConnectionError, APITimeoutError)):
+        return False, True
+    return False, False
+
+
+class EmbeddingIngestor:
+    """Embeds texts with a thread pool, adaptive batches and rate-limit-aware backoff"""
+
+    def __init__(self, embeddings, max_workers: int = 4, batch_size: int = 128, min_batch_size: int = 8,
+                 max_batch_size: int = 1024, max_batch_tokens: int = 200000, max_retries: int = 8,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 count_tokens: Optional[Callable[[List[str]], List[int]]] = None):
+        """
+        Initialize ingestor
+
+        Args:
+            embeddings: Embedding model with embed_documents(texts) (langchain Embeddings interface)
+            max_workers: Maximum number of concurrent embedding requests
+            batch_size: Initial number of texts per request
+            min_batch_size: Smallest batch size rate limiting shrinks batches to
+            max_batch_size: Largest batch size successful requests grow batches to
+            max_batch_tokens: Maximum tokens per request
+            max_retries: Retries of a batch before it is given up
+            base_delay: First backoff delay in seconds, doubled on every retry
+            max_delay: Maximum backoff delay in seconds
+            count_tokens: Token counts of a list of texts, defaults to the shared tiktoken counter
+        """
+        self.embeddings = embeddings
+        self.max_workers = max(1, max_workers)
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.count_tokens = count_tokens
+
+        self._lock = threading.Lock()
+        self._resume_at = 0.0  # No request starts before this time after a rate limit
+        self.stats: Dict[str, float] = {}
+
+    def _next_batch(self, cursor: int, token_counts: Sequence[int]) -> int:
+        """Get the end of the batch starting at cursor, limited by batch size and tokens"""
+        end, tokens = cursor, 0
+        while end < len(token_counts) and end - cursor < self.batch_size:
+            if end > cursor and tokens + token_counts[end] > self.max_batch_tokens:
+                break
+            tokens += token_counts[end]
+            end += 1
+        return end
+
+    def _wait_for_rate_limit(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _embed_batch(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Embed one batch, retrying rate-limited and transient failures"""
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_rate_limit()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                rate_limited, retryable = classify_error(e)
+                if not retryable or attempt == self.max_retries:
+                    logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                    return None
+
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(self.base_delay * 2 ** attempt, self.max_delay) * (0.5 + random.random())
+                with self._lock:
+                    self.stats['retries'] += 1
+                    if rate_limited:
+                        # All workers hold off, and later batches get smaller
+                        self.stats['rate_limited'] += 1
+                        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+                logger.info(f"Embedding request {'rate limited' if rate_limited else 'failed'}, retrying in {delay:.1f}s")
+                if not rate_limited:
+                    time.sleep(delay)
+                continue
+
+            with self._lock:
+                self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            return vectors
+        return None
+
+    def embed(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        Embed texts
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Vector of each text in input order, None for texts whose batch failed
+        """
+        texts = list(texts)
+        start_time = time.time()
+        self.stats = {'chunks': 0, 'tokens': 0, 'failed': 0, 'retries': 0, 'rate_limited': 0, 'seconds': 0.0}
+        if not texts:
+            return []
+
+        token_counts = (self.count_tokens or get_token_counter().count_many)(texts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        cursor = 0
+        cursor_lock = threading.Lock()
+
+        def worker():
+            nonlocal cursor
+            while True:
+                with cursor_lock:
+                    if cursor >= len(texts):
+                        return
+                    begin = cursor
+                    cursor = self._next_batch(begin, token_counts)
+                    end = cursor
+                vectors = self._embed_batch(texts[begin:end])
+                with self._lock:
+                    if vectors is None or len(vectors) != end - begin:
+                        self.stats['failed'] += end - begin
+                        continue
+                    results[begin:end] = vectors
+                    self.stats['chunks'] += end - begin
+                    self.stats['tokens'] += sum(token_counts[begin:end])
+
+        workers = min(self.max_workers, len(texts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(worker) for _ in range(workers)]:
+                future.result()
+
+        seconds = max(time.time() - start_time, 1e-9)
+        self.stats['seconds'] = seconds
+        self.stats['chunks_per_second'] = self.stats['chunks'] / seconds
+        self.stats['tokens_per_second'] = self.stats['tokens'] / seconds
+        logger.info(f"Embedded {self.stats['chunks']} chunks ({self.stats['tokens']} tokens) in {seconds:.1f}s: "
+                    f"{self.stats['chunks_per_second']:.1f} chunks/s, {self.stats['tokens_per_second']:.0f} tokens/s, "
+                    f"{self.stats['retries']} retries, {self.stats['failed']} failed")
+        return results
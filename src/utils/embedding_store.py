@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+Embedding store - Persistent per-repository vector collections that survive across tasks
+
+Every (repository, embedding model) pair gets one directory under the store root, shared by all
+checkouts and branches of the repository. The vector store inside is synced rather than rebuilt:
+chunk IDs are derived from the document ID and the chunk content, so unchanged chunks keep their
+vectors and only new or changed ones are embedded. Syncing only adds chunks, a task searches the
+chunks of its own checkout, and chunks no checkout used for a while are collected (ChunkUsage).
+Syncs of one collection are serialized across processes with a file lock (collection_lock).
+A registry records when each collection was last used, collections not used for a while and
+directories no registry entry refers to are deleted.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks on Windows, syncs of one collection are then not serialized across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_ROOT = "db/embedding_store"
+REGISTRY_FILE = "registry.json"
+SECONDS_PER_DAY = 60 * 60 * 24
+
+
+def _short_hash(*parts: str, size: int = 16) -> str:
+    return hashlib.blake2b('\0'.join(parts).encode('utf-8', errors='surrogatepass'), digest_size=size).hexdigest()
+
+
+def chunk_id(doc_id: str, chunk_index: int, content: str) -> str:
+    """
+    Get the content-addressed ID of a document chunk
+
+    Args:
+        doc_id: ID of the document the chunk belongs to (e.g. function ID)
+        chunk_index: Position of the chunk in the document
+        content: Chunk text
+
+    Returns:
+        ID that changes whenever the chunk content changes
+    """
+    return f"{doc_id}:{chunk_index}:{_short_hash(content)}"
+
+
+def _write_json_atomic(path: str, data) -> None:
+    """Write a JSON file atomically, so concurrent readers never see a partial file"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def collection_lock(lock_path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock while a collection is read, changed and saved
+
+    Args:
+        lock_path: Lock file of the collection (created if missing)
+    """
+    os.makedirs(os.path.dirname(lock_path) or '.', exist_ok=True)
+    with open(lock_path, 'a') as f:
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ChunkUsage:
+    """Last time each chunk of a collection belonged to a synced checkout, read and written under collection_lock"""
+
+    def __init__(self, path: str):
+        """
+        Load usage file
+
+        Args:
+            path: JSON file of chunk ID -> last use time
+        """
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.last_used: Dict[str, float] = json.load(f)
+        except FileNotFoundError:
+            self.last_used = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable chunk usage file {path}, starting a new one: {e}")
+            self.last_used = {}
+
+    def touch(self, chunk_ids: Iterable[str], now: Optional[float] = None) -> None:
+        """Record that chunks are used now"""
+        now = now or time.time()
+        for chunk_key in chunk_ids:
+            self.last_used[chunk_key] = now
+
+    def track(self, chunk_ids: Iterable[str], now: Optional[float] = None) -> None:
+        """Start tracking chunks that have no usage record yet (e.g. stored before usage was recorded)"""
+        now = now or time.time()
+        for chunk_key in chunk_ids:
+            self.last_used.setdefault(chunk_key, now)
+
+    def expired(self, max_age_days: float, now: Optional[float] = None) -> List[str]:
+        """Get the chunks not used within max_age_days"""
+        now = now or time.time()
+        max_age = max_age_days * SECONDS_PER_DAY
+        return [chunk_key for chunk_key, last_used in self.last_used.items() if now - last_used > max_age]
+
+    def forget(self, chunk_ids: Iterable[str]) -> None:
+        for chunk_key in chunk_ids:
+            self.last_used.pop(chunk_key, None)
+
+    def save(self) -> None:
+        _write_json_atomic(self.path, self.last_used)
+
+
+def repo_identity(repo_path: str) -> str:
+    """
+    Get an ID of a repository that is the same for every checkout of it
+
+    Args:
+        repo_path: Path to the code repository
+
+    Returns:
+        Remote URL of the 'origin' remote, or the absolute path outside of git clones
+    """
+    try:
+        result = subprocess.run(['git', '-C', repo_path, 'remote', 'get-url', 'origin'],
+                                capture_output=True, text=True, check=False)
+        url = result.stdout.strip()
+        if result.returncode == 0 and url:
+            return url[:-len('.git')] if url.endswith('.git') else url
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return os.path.abspath(repo_path)
+
+
+class EmbeddingStore:
+    """Directory of persistent vector collections, one per repository and embedding model"""
+
+    def __init__(self, root: str = DEFAULT_STORE_ROOT, max_age_days: float = 30):
+        """
+        Initialize store
+
+        Args:
+            root: Directory holding the collections and the registry
+            max_age_days: Collections not opened for this many days are deleted
+        """
+        self.root = root
+        self.max_age_days = max_age_days
+        self.registry_path = os.path.join(root, REGISTRY_FILE)
+
+    def _load_registry(self) -> Dict[str, Dict]:
+        try:
+            with open(self.registry_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable embedding store registry {self.registry_path}, starting a new one: {e}")
+            return {}
+
+    def _save_registry(self, registry: Dict[str, Dict]) -> None:
+        _write_json_atomic(self.registry_path, registry)
+
+    @staticmethod
+    def collection_name(repo_id: str, model_name: str) -> str:
+        """Get the directory name of the collection of a repository and embedding model"""
+        return f"repo_{_short_hash(repo_id, model_name)}"
+
+    def open(self, repo_id: str, model_name: str) -> str:
+        """
+        Get the persist directory of a collection, registering its use and collecting garbage
+
+        Args:
+            repo_id: Repository ID (see repo_identity)
+            model_name: Embedding model the vectors are computed with
+
+        Returns:
+            Persist directory of the collection (created if missing)
+        """
+        name = self.collection_name(repo_id, model_name)
+        registry = self._load_registry()
+        registry[name] = {'repo_id': repo_id, 'model': model_name, 'last_used': time.time()}
+        self._save_registry(registry)
+
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        self.collect_garbage()
+        return path
+
+    def collect_garbage(self, now: Optional[float] = None) -> int:
+        """
+        Delete collections that were not used within max_age_days or that no registry entry refers to
+
+        Unregistered directories are only deleted once they are older than max_age_days as well,
+        so a collection another process is just creating is left alone.
+
+        Args:
+            now: Reference time, defaults to the current time
+
+        Returns:
+            Number of deleted collections
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        now = now or time.time()
+        max_age = self.max_age_days * SECONDS_PER_DAY
+
+        registry = self._load_registry()
+        expired = {name for name, entry in registry.items() if now - entry.get('last_used', 0) > max_age}
+        for name in expired:
+            del registry[name]
+        if expired:
+            self._save_registry(registry)
+
+        deleted = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or name in registry:
+                continue
+            if name not in expired and now - os.path.getmtime(path) <= max_age:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            deleted += 1
+
+        if deleted:
+            logger.info(f"Deleted {deleted} unused embedding collections from {self.root}")
+        return deleted
@@ -1,5 +1,6 @@
 import uuid
 import os
+from contextlib import nullcontext
 from dotenv import load_dotenv
 from openai import OpenAI
 from openai import AzureOpenAI
@@ -8,28 +9,61 @@ from functools import partial
 from typing import List, Dict, Annotated, Callable
 
 from langchain.schema import Document
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OpenAIEmbeddings, HuggingFaceEmbeddings
+from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.retrievers import EnsembleRetriever
-from langchain_community.retrievers import BM25Retriever
 
-def get_embeddings(model_name="text-embedding-ada-002", use_local_embedding=False, local_model_name=None):
+from src.utils.embedding_store import ChunkUsage, chunk_id, collection_lock
+from src.utils.embedding_ingest import EmbeddingIngestor
+from src.utils.bm25_index import BM25Index, INDEX_FILE as BM25_INDEX_FILE, reciprocal_rank_fusion
+from src.utils.vector_backends import DEFAULT_BACKEND, create_vector_backend
+from src.utils.embedding_cache import CachedEmbeddings
+from src.utils.local_embeddings import (
+    estimate_token_counts, get_local_embeddings, local_embedding_options, local_model_id, use_local_embedding_enabled
+)
+
+def get_embedding_model_name(use_local_embedding=False, local_model_name=None):
+    """
+    Get the name of the embedding model get_embeddings would use
+
+    Args:
+        use_local_embedding: Whether to use local embedding model
+        local_model_name: Local embedding model name
+
+    Returns:
+        Model name, identifies the vector space of stored embeddings
+    """
+    if use_local_embedding:
+        options = local_embedding_options()
+        return local_model_id(local_model_name or options['model_name'], options['backend'], options['onnx_file'])
+    return os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-ada-002")
+
+def get_embeddings(model_name="text-embedding-ada-002", use_local_embedding=False, local_model_name=None, use_cache=True):
     """
     Get embedding model, decide whether to use standard OpenAI, Azure OpenAI or local model based on environment variables
     
     Args:
         model_name: Embedding model name, default is "text-embedding-ada-002"
-        use_local_embedding: Whether to use local embedding model
-        local_model_name: Local embedding model name
+        use_local_embedding: Whether to use local embedding model (settings in LOCAL_EMBEDDING_* variables)
+        local_model_name: Local embedding model name, default is LOCAL_EMBEDDING_MODEL
+        use_cache: Whether to reuse vectors of already embedded texts from the on-disk embedding cache
         
     Returns:
         Embedding model instance
     """
     if use_local_embedding:
-        return HuggingFaceEmbeddings(model_name=local_model_name)
+        embeddings = get_local_embeddings(local_model_name)
+        cache_name = embeddings.model_id
+    else:
+        embeddings = _get_api_embeddings(model_name)
+        cache_name = os.environ.get("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", model_name) if os.environ.get("AZURE_PAY_OPENAI_API_KEY") else model_name
     
+    if use_cache:
+        return CachedEmbeddings(embeddings, cache_name)
+    return embeddings
+
+def _get_api_embeddings(model_name):
+    """Get OpenAI or Azure OpenAI embedding model"""
     # Prioritize Azure OpenAI
     if os.environ.get("AZURE_PAY_OPENAI_API_KEY"):
         # Handle Azure endpoint URL, ensure it only contains base URL part
@@ -57,9 +91,31 @@ def get_embeddings(model_name="text-embedding-ada-002", use_local_embedding=Fals
         api_key=os.environ.get("OPENAI_API_KEY"),
         model=model_name
     )
+def fuse_document_rankings(rankings, weights):
+    """
+    Merge document rankings of several retrievers with weighted reciprocal rank fusion
+
+    Documents with the same content are the same result, as in langchain's EnsembleRetriever.
+
+    Args:
+        rankings: Document lists, best first
+        weights: Weight of each ranking
+
+    Returns:
+        Documents, best first
+    """
+    documents = {}
+    for ranking in rankings:
+        for doc in ranking:
+            documents.setdefault(doc.page_content, doc)
+    fused = reciprocal_rank_fusion([[doc.page_content for doc in ranking] for ranking in rankings], weights=weights)
+    return [documents[content] for content, _ in fused]
+
 class WebRetriever:
-    def __init__(self, chunk_size=2000, chunk_overlap=200):
-        self.embeddings = get_embeddings()
+    def __init__(self, chunk_size=2000, chunk_overlap=200, use_local_embedding=None):
+        if use_local_embedding is None:
+            use_local_embedding = use_local_embedding_enabled()
+        self.embeddings = get_embeddings(use_local_embedding=use_local_embedding)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
@@ -104,35 +160,21 @@ class WebRetriever:
         if len(all_documents)<1:
             return search_results
         
-        # Create Chroma vectorstore with unique collection name and persist directory
-        collection_name = f"search_{uuid.uuid4().hex}"
-        persist_directory = f"db/tmp/chroma_{collection_name}"
-        
-        vectorstore = Chroma.from_documents(
-            all_documents, 
-            self.embeddings, 
-            collection_name=collection_name,
-            persist_directory=persist_directory
+        # In-memory vector index of this search's chunks
+        vectorstore = create_vector_backend(DEFAULT_BACKEND, f"search_{uuid.uuid4().hex}")
+        vectorstore.upsert(
+            ids=[str(idx) for idx in range(len(all_documents))],
+            vectors=self.embeddings.embed_documents([doc.page_content for doc in all_documents]),
+            documents=[doc.page_content for doc in all_documents],
+            metadatas=[doc.metadata for doc in all_documents],
         )
         
-        # Create BM25 retriever
-        bm25_retriever = BM25Retriever.from_documents(all_documents)
-        bm25_retriever.k = k
-        
-        # Create ensemble retriever
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[vectorstore.as_retriever(search_kwargs={"k": k}), bm25_retriever],
-            weights=[0.6, 0.4]
-        )
-        
-        # Retrieve documents
-        retrieved_docs = ensemble_retriever.get_relevant_documents(query)
-
-        # Clean up
-        vectorstore.delete_collection()
-        import shutil
-        if os.path.exists(persist_directory):
-            shutil.rmtree(persist_directory)
+        # Lexical search over all chunks, fused with the vector search results
+        bm25_index = BM25Index()
+        bm25_index.add_many((str(idx), doc.page_content, None) for idx, doc in enumerate(all_documents))
+        bm25_docs = [all_documents[int(doc_id)] for doc_id, _ in bm25_index.search(query, k=k)]
+        vector_docs = [doc for doc, _ in vectorstore.search(self.embeddings.embed_query(query), k=k)]
+        retrieved_docs = fuse_document_rankings([vector_docs, bm25_docs], weights=[0.6, 0.4])
         
         top_results = []
         # for i, doc in enumerate(retrieved_docs[:k]):
@@ -165,20 +207,31 @@ class EmbeddingMatcher:
         chunk_overlap=100,
         embedding_weight=1.0,
         embedding_model_name=None, #sentence-transformers/all-MiniLM-L6-v2
-        use_local_embedding=False,
+        use_local_embedding=None,  # Defaults to the USE_LOCAL_EMBEDDING setting
         document_converter=None,
         persistent_db=False,
         persistent_db_path="db/persistent_chroma",
         persistent_collection_name="persistent_collection",
-        initial_docs=None
+        initial_docs=None,
+        incremental=False,  # Sync initial_docs into the persistent database instead of building a new one
+        chunk_max_age_days=30,  # Incremental mode: stored chunks no sync used for this long are deleted
+        embedding_workers=4,  # Concurrent embedding requests while ingesting documents
+        write_batch_size=4096,  # Chunks per bulk write to the vector store
+        vector_backend=DEFAULT_BACKEND,  # 'numpy' (in-process matrix) or 'chroma'
+        vector_dtype="float32"  # Vector storage type of the numpy backend, 'float16' halves memory and disk
     ):
         self.topk = topk
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.embedding_weight = embedding_weight
         
-        self.client = self._get_openai_client()
-        self.embedding_model = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME", "text-embedding-ada-002")
+        if use_local_embedding is None:
+            use_local_embedding = use_local_embedding_enabled()
+        self.use_local_embedding = use_local_embedding
+        
+        # Local mode runs offline, it needs no API client
+        self.client = None if use_local_embedding else self._get_openai_client()
+        self.embedding_model = get_embedding_model_name()
         
         self.embeddings = get_embeddings(
             model_name=self.embedding_model,
@@ -186,8 +239,15 @@ class EmbeddingMatcher:
             local_model_name=embedding_model_name
         )
         
-        self.persist_directory = None
-        self.collection_name = None
+        # A local model already uses every core for one batch, concurrent batches would only compete.
+        # Token counts only size batches, so local mode estimates them instead of loading a tiktoken encoding
+        if use_local_embedding:
+            self.ingestor = EmbeddingIngestor(self.embeddings, max_workers=1, count_tokens=estimate_token_counts)
+        else:
+            self.ingestor = EmbeddingIngestor(self.embeddings, max_workers=embedding_workers)
+        self.write_batch_size = write_batch_size
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
@@ -202,10 +262,15 @@ class EmbeddingMatcher:
         self.persistent_db_path = persistent_db_path
         self.persistent_collection_name = persistent_collection_name or "persistent_collection"
         self.vectorstore_db = None
+        self.bm25_index = None  # Lexical index over the same chunks as the vector store
+        self.chunk_max_age_days = chunk_max_age_days
+        self.active_ids = None  # Chunk IDs searched after an incremental sync, None searches all stored chunks
         
         # If persistent database is enabled
         if persistent_db:
-            if os.path.exists(self.persistent_db_path) and initial_docs is None:
+            if incremental and initial_docs:
+                self.sync_persistent_db(initial_docs)
+            elif os.path.exists(self.persistent_db_path) and initial_docs is None:
                 # If no initial documents provided but database path exists, load existing database
                 print(f"Loading existing persistent database from {self.persistent_db_path}")
                 self._load_persistent_db()
@@ -273,6 +338,14 @@ class EmbeddingMatcher:
             metadata=document.metadata
         ) for split in splits]
 
+    def _create_vector_backend(self, collection_name, persist_directory=None):
+        """Open a collection of the configured vector backend, in memory if persist_directory is None"""
+        if self.vector_backend == "chroma":
+            return create_vector_backend(self.vector_backend, collection_name, embeddings=self.embeddings,
+                                         persist_directory=persist_directory, write_batch_size=self.write_batch_size)
+        return create_vector_backend(self.vector_backend, collection_name, persist_directory=persist_directory,
+                                     dtype=self.vector_dtype)
+
     def _prepare_vectorstore_for_search(self, docs, persistent=False):
         """Prepare documents and create vector store
             docs: Documents to process
@@ -288,65 +361,132 @@ class EmbeddingMatcher:
         # import pdb; pdb.set_trace()
         
         collection_name = self.persistent_collection_name if persistent else f"matcher_{uuid.uuid4().hex}"
-        persist_directory = self.persistent_db_path if persistent else f"db/tmp/chroma_{collection_name}"
+        persist_directory = self.persistent_db_path if persistent else None
         
-        max_docs_iter = 100
-        if len(documents)>max_docs_iter:
-            self.vectorstore_db = Chroma.from_documents(
-                documents[:max_docs_iter], 
-                self.embeddings, 
-                collection_name=collection_name,
-                persist_directory=persist_directory
-            )
-            import time 
-            slice_size = max_docs_iter
-            # Calculate remaining document count
-            remaining_docs = len(documents) - max_docs_iter
-            # Calculate how many batches needed
-            batch_count = (remaining_docs + slice_size - 1) // slice_size  # Round up
-            print(f"Remaining {remaining_docs} documents, will be processed in {batch_count} batches, {slice_size} documents per batch")
+        self.active_ids = None
+        with collection_lock(self._collection_lock_path()) if persistent else nullcontext():
+            self.vectorstore_db = self._create_vector_backend(collection_name, persist_directory)
+            ids = [uuid.uuid4().hex for _ in documents]
+            self._ingest_documents(documents, ids=ids)
             
-            # Prepare batch document addition
-            for batch_idx in range(batch_count):
-                start_idx = max_docs_iter + batch_idx * slice_size
-                end_idx = min(start_idx + slice_size, len(documents))
-                batch_docs = documents[start_idx:end_idx]
-                
-                if batch_docs:
-                    try:
-                        # import pdb; pdb.set_trace()
-                        self.vectorstore_db.add_documents(batch_docs)
-                        print(f"Added batch {batch_idx+1}/{batch_count} documents, {len(batch_docs)} items", flush=True)
-                    except Exception as e:
-                        print(f"Error adding batch {batch_idx+1} documents: {e}", flush=True)
-                        
-                    # Brief pause after each batch to avoid API limits
-                    if batch_idx < batch_count - 1:
-                        time.sleep(1)
-                
-        else:
-            self.vectorstore_db = Chroma.from_documents(
-                documents, 
-                self.embeddings, 
-                collection_name=collection_name,
-                persist_directory=persist_directory
-            )
+            self.bm25_index = BM25Index()
+            self.bm25_index.add_many((chunk_key, doc.page_content, doc.metadata) for chunk_key, doc in zip(ids, documents))
             
+            if persistent:
+                self._save_bm25_index()
+                self.vectorstore_db.persist()
+                print(f"Created persistent database, path: {self.persistent_db_path}, collection name: {self.persistent_collection_name}", flush=True)
         
-        if persistent:
+        return documents
+
+    def _ingest_documents(self, documents, ids):
+        """Embed documents concurrently and write them to the vector store in bulk"""
+        vectors = self.ingestor.embed([doc.page_content for doc in documents])
+        stats = self.ingestor.stats
+        if documents:
+            print(f"Embedded {int(stats['chunks'])}/{len(documents)} chunks in {stats['seconds']:.1f}s "
+                  f"({stats['chunks_per_second']:.1f} chunks/s, {stats['tokens_per_second']:.0f} tokens/s, "
+                  f"{int(stats['rate_limited'])} rate limited)", flush=True)
+        
+        embedded = [(chunk_key, doc, vector) for chunk_key, doc, vector in zip(ids, documents, vectors) if vector is not None]
+        self.vectorstore_db.upsert(
+            ids=[chunk_key for chunk_key, _, _ in embedded],
+            vectors=[vector for _, _, vector in embedded],
+            documents=[doc.page_content for _, doc, _ in embedded],
+            metadatas=[doc.metadata for _, doc, _ in embedded],
+        )
+        return len(embedded)
+
+    def sync_persistent_db(self, docs):
+        """
+        Add the chunks of docs to the persistent database, embedding only chunks it does not hold yet
+
+        Chunk IDs are derived from metadata['doc_id'] and the chunk content, so a chunk whose
+        content is unchanged keeps its stored vector. The database is shared by all checkouts of a
+        repository: syncing never removes chunks another checkout may still use, searches are limited
+        to the chunks of docs instead, and chunks no sync used for chunk_max_age_days are deleted.
+        Concurrent syncs of the same collection run one after another.
+
+        Args:
+            docs: Documents to store (converted with document_converter)
+
+        Returns:
+            Number of newly embedded chunks
+        """
+        documents, ids = [], []
+        for doc in self.document_converter(docs):
+            doc_id = doc.metadata.get('doc_id')
+            if doc_id is None:
+                raise ValueError("Incremental persistent database requires metadata['doc_id'] on every document")
+            for chunk_index, chunk in enumerate(self.split_document(doc)):
+                documents.append(chunk)
+                ids.append(chunk_id(str(doc_id), chunk_index, chunk.page_content))
+        wanted_ids = set(ids)
+        
+        with collection_lock(self._collection_lock_path()):
+            # Reopen under the lock, so chunks other processes stored meanwhile are seen and kept
+            self.vectorstore_db = self._create_vector_backend(self.persistent_collection_name, self.persistent_db_path)
+            stored_ids = set(self.vectorstore_db.ids())
+            
+            new_chunks = {}
+            for chunk_key, doc in zip(ids, documents):
+                if chunk_key not in stored_ids:
+                    new_chunks.setdefault(chunk_key, doc)
+            self._ingest_documents(list(new_chunks.values()), ids=list(new_chunks))
+            stored_ids.update(new_chunks)
+            
+            # Collect chunks no checkout used for a while
+            usage = ChunkUsage(os.path.join(self.persistent_db_path, f"{self.persistent_collection_name}.usage.json"))
+            usage.track(stored_ids)
+            usage.touch(wanted_ids)
+            expired_ids = [chunk_key for chunk_key in usage.expired(self.chunk_max_age_days) if chunk_key not in wanted_ids]
+            self.vectorstore_db.delete(expired_ids)
+            usage.forget(expired_ids)
+            stored_ids.difference_update(expired_ids)
+            usage.forget([chunk_key for chunk_key in list(usage.last_used) if chunk_key not in stored_ids])
+            
+            # Bring the lexical index in line with the stored chunks
+            self.bm25_index = BM25Index.load(self._bm25_index_path()) or BM25Index()
+            for indexed_id in [indexed_id for indexed_id in self.bm25_index.doc_lengths if indexed_id not in stored_ids]:
+                self.bm25_index.remove(indexed_id)
+            for chunk_key, doc in zip(ids, documents):
+                if chunk_key not in self.bm25_index:
+                    self.bm25_index.add(chunk_key, doc.page_content, doc.metadata)
+            
+            self._save_bm25_index()
             self.vectorstore_db.persist()
-            print(f"Created persistent database, path: {self.persistent_db_path}, collection name: {self.persistent_collection_name}", flush=True)
+            usage.save()
         
-        return documents
+        self.active_ids = wanted_ids
+        print(f"Synced persistent database {self.persistent_db_path}: {len(new_chunks)} chunks embedded, "
+              f"{len(wanted_ids) - len(new_chunks)} reused, {len(expired_ids)} expired", flush=True)
+        return len(new_chunks)
+
+    def _collection_lock_path(self):
+        return os.path.join(self.persistent_db_path, f"{self.persistent_collection_name}.lock")
+
+    def _bm25_index_path(self):
+        return os.path.join(self.persistent_db_path, BM25_INDEX_FILE)
+
+    def _save_bm25_index(self):
+        """Write the lexical index next to the persistent vector store"""
+        if self.bm25_index is not None:
+            self.bm25_index.save(self._bm25_index_path())
+
+    def _get_bm25_index(self):
+        """Get the lexical index, building it from the vector store contents if there is none yet"""
+        if self.bm25_index is None:
+            self.bm25_index = BM25Index()
+            self.bm25_index.add_many(zip(*self.vectorstore_db.documents()))
+            if self.persistent_db:
+                self._save_bm25_index()
+        return self.bm25_index
 
     def _cleanup_vectorstore(self):
-        """Clean up Chroma resources."""
+        """Drop the per-search vector collection and lexical index."""
+        self.bm25_index = None
         if self.vectorstore_db:
-            self.vectorstore_db.delete_collection()
-            if self.persistent_db and self.persist_directory:
-                import shutil
-                if os.path.exists(self.persist_directory):
-                    shutil.rmtree(self.persist_directory)
+            self.vectorstore_db.destroy()
 
     def _default_similarity_processor(self, results):
         """Default similarity search result processor"""
@@ -367,11 +507,8 @@ class EmbeddingMatcher:
     def _load_persistent_db(self):
         """Load persistent vector database"""
         if os.path.exists(self.persistent_db_path):
-            self.vectorstore_db = Chroma(
-                collection_name=self.persistent_collection_name,
-                embedding_function=self.embeddings,
-                persist_directory=self.persistent_db_path
-            )
+            self.vectorstore_db = self._create_vector_backend(self.persistent_collection_name, self.persistent_db_path)
+            self.bm25_index = BM25Index.load(self._bm25_index_path())
             print(f"Loaded persistent database, path: {self.persistent_db_path}, collection name: {self.persistent_collection_name}")
         else:
             raise ValueError(f"Persistent database path does not exist: {self.persistent_db_path}")
@@ -383,15 +520,20 @@ class EmbeddingMatcher:
             
         documents = self.document_converter(docs)
         
-        # If persistent database is not loaded yet, load it
-        if self.vectorstore_db is None:
+        with collection_lock(self._collection_lock_path()):
+            # Reload under the lock, so documents other processes added meanwhile are kept
             self._load_persistent_db()
-        
-        # Add documents
-        self.vectorstore_db.add_documents(documents)
-        
-        # Persist to disk
-        self.vectorstore_db.persist()
+            
+            # Add documents
+            ids = [uuid.uuid4().hex for _ in documents]
+            self._ingest_documents(documents, ids=ids)
+            self._get_bm25_index().add_many((chunk_key, doc.page_content, doc.metadata) for chunk_key, doc in zip(ids, documents))
+            self._save_bm25_index()
+            if self.active_ids is not None:
+                self.active_ids.update(ids)
+            
+            # Persist to disk
+            self.vectorstore_db.persist()
         print(f"Added {len(documents)} documents to persistent database")
 
     def match_docs(self, user_input, docs=None, result_processor=None):
@@ -406,7 +548,7 @@ class EmbeddingMatcher:
         if docs is not None:
             self._prepare_vectorstore_for_search(docs)
 
-        results = self.vectorstore_db.similarity_search_with_score(user_input, k=self.topk)
+        results = self.vectorstore_db.search(self.embeddings.embed_query(user_input), k=self.topk, ids=self.active_ids)
         
         if docs is not None or not self.persistent_db:
             self._cleanup_vectorstore()
@@ -427,25 +569,20 @@ class EmbeddingMatcher:
         if docs is not None:
             self._prepare_vectorstore_for_search(docs)
             
-        # First use vector search to get topk*2 documents instead of loading all documents
-        initial_retriever_results = self.vectorstore_db.similarity_search(
-            user_input, 
-            k=max(self.topk*10, 100)
-        )
-        
-        # Create BM25 retriever
-        bm25_retriever = BM25Retriever.from_documents(initial_retriever_results)
-        bm25_retriever.k = self.topk
-        
-        # Create ensemble retriever
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=[self.vectorstore_db.as_retriever(search_kwargs={"k": self.topk}), bm25_retriever],
+        # Vector and lexical search run independently over all chunks, their rankings are fused
+        vector_results = [
+            doc for doc, _ in self.vectorstore_db.search(self.embeddings.embed_query(user_input), k=self.topk, ids=self.active_ids)
+        ]
+        bm25_index = self._get_bm25_index()
+        bm25_results = [
+            Document(page_content=bm25_index.documents[doc_id]['text'], metadata=bm25_index.documents[doc_id]['metadata'])
+            for doc_id, _ in bm25_index.search(user_input, k=self.topk, allowed=self.active_ids)
+        ]
+        results = fuse_document_rankings(
+            [vector_results, bm25_results],
             weights=[self.embedding_weight, 1 - self.embedding_weight]
         )
         
-        # Retrieve documents
-        results = ensemble_retriever.get_relevant_documents(user_input)
-        
         if docs is not None or not self.persistent_db:
             self._cleanup_vectorstore()
         
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+"""
+Vector backends - Storage and nearest-neighbour search of embedded chunks behind one interface
+
+EmbeddingMatcher embeds chunks itself and hands the vectors to a backend, so backends only store
+and search. The NumPy backend keeps L2-normalized vectors in one matrix and answers queries with an
+exact matrix-vector product, which for the corpora of a single repository or search (up to tens of
+thousands of chunks) is faster than a round trip through a database. Persistent NumPy collections
+are a memory-mapped .npy file plus a JSON file of chunk texts and metadata. Every save writes a new
+.npy file and then atomically replaces the JSON file, which names the .npy file it belongs to, so a
+reader always sees a matching pair. Chroma remains available as the 'chroma' backend.
+"""
+
+import os
+import json
+import uuid
+import logging
+import tempfile
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "numpy"
+# Rows converted to float32 at a time when searching a float16 matrix
+SEARCH_BLOCK_ROWS = 65536
+
+
+class VectorBackend:
+    """Interface of a collection of embedded chunks"""
+
+    def upsert(self, ids: Sequence[str], vectors: Sequence[Sequence[float]], documents: Sequence[str],
+               metadatas: Optional[Sequence[Dict]] = None) -> None:
+        """
+        Store chunks, replacing stored chunks with the same IDs
+
+        Args:
+            ids: Chunk IDs
+            vectors: Embedding of each chunk
+            documents: Text of each chunk
+            metadatas: Metadata of each chunk
+        """
+        raise NotImplementedError
+
+    def delete(self, ids: Sequence[str]) -> None:
+        """Drop chunks by ID, unknown IDs are ignored"""
+        raise NotImplementedError
+
+    def ids(self) -> List[str]:
+        """Get the IDs of all stored chunks"""
+        raise NotImplementedError
+
+    def documents(self) -> Tuple[List[str], List[str], List[Dict]]:
+        """Get (IDs, texts, metadatas) of all stored chunks"""
+        raise NotImplementedError
+
+    def search(self, query_vector: Sequence[float], k: int,
+               ids: Optional[Collection[str]] = None) -> List[Tuple[Document, float]]:
+        """
+        Find the chunks nearest to a query embedding
+
+        Args:
+            query_vector: Query embedding
+            k: Number of results
+            ids: Only search the chunks with these IDs (None searches all)
+
+        Returns:
+            Up to k (document, distance) tuples, nearest first
+        """
+        raise NotImplementedError
+
+    def persist(self) -> None:
+        """Write the collection to its persist directory, if it has one"""
+
+    def destroy(self) -> None:
+        """Drop the collection, including its files"""
+        raise NotImplementedError
+
+
+class NumpyVectorBackend(VectorBackend):
+    """Exact search over an in-process matrix of L2-normalized vectors"""
+
+    def __init__(self, collection_name: str, persist_directory: Optional[str] = None, dtype: str = "float32"):
+        """
+        Initialize collection, loading it from the persist directory if it was saved before
+
+        Args:
+            collection_name: Collection name, names the files in the persist directory
+            persist_directory: Directory of the collection files, None for an in-memory collection
+            dtype: Storage type of the vectors, 'float32' or 'float16' (half the memory and disk)
+        """
+        self.collection_name = collection_name
+        self.persist_directory = persist_directory
+        self.dtype = np.dtype(dtype)
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        if persist_directory:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _documents_path(self) -> str:
+        return os.path.join(self.persist_directory, f"{self.collection_name}.json")
+
+    def _matrix_files(self) -> List[str]:
+        """Get the names of all saved matrices of the collection, current and superseded"""
+        if not os.path.isdir(self.persist_directory):
+            return []
+        prefix = f"{self.collection_name}."
+        return [name for name in os.listdir(self.persist_directory) if name.startswith(prefix) and name.endswith('.npy')]
+
+    def _load(self, attempts: int = 3) -> None:
+        documents_path = self._documents_path()
+        for _ in range(attempts):
+            try:
+                with open(documents_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return
+            except (OSError, ValueError) as e:
+                logger.warning(f"Unreadable vector collection {documents_path}, starting an empty one: {e}")
+                return
+            matrix_path = os.path.join(self.persist_directory, data['matrix'])
+            try:
+                matrix = np.load(matrix_path, mmap_mode='r')
+                break
+            except FileNotFoundError:
+                # A concurrent save replaced the collection after the JSON file was read, read the new one
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning(f"Unreadable vector collection {matrix_path}, starting an empty one: {e}")
+                return
+        else:
+            logger.warning(f"Vector collection {documents_path} kept changing while loading, starting an empty one")
+            return
+        if matrix.shape[0] != len(data['ids']) or matrix.dtype != self.dtype:
+            logger.warning(f"Vector collection {matrix_path} does not match its documents or dtype, starting an empty one")
+            return
+        self._matrix = matrix
+        self._ids, self._texts, self._metadatas = data['ids'], data['documents'], data['metadatas']
+        self._positions = {chunk_key: idx for idx, chunk_key in enumerate(self._ids)}
+
+    def _normalize(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        rows = np.asarray(vectors, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (rows / norms).astype(self.dtype)
+
+    def upsert(self, ids, vectors, documents, metadatas=None):
+        if not ids:
+            return
+        metadatas = metadatas or [{} for _ in ids]
+        # The last occurrence of a repeated ID wins, as with repeated upserts
+        latest = {chunk_key: idx for idx, chunk_key in enumerate(ids)}
+        order = sorted(latest.values())
+        self.delete([chunk_key for chunk_key in latest if chunk_key in self._positions])
+
+        rows = self._normalize([vectors[idx] for idx in order])
+        self._matrix = rows if self._matrix is None or len(self._ids) == 0 else np.concatenate([self._matrix, rows])
+        for idx in order:
+            self._positions[ids[idx]] = len(self._ids)
+            self._ids.append(ids[idx])
+            self._texts.append(documents[idx])
+            self._metadatas.append(metadatas[idx] or {})
+
+    def delete(self, ids):
+        drop = [self._positions[chunk_key] for chunk_key in ids if chunk_key in self._positions]
+        if not drop:
+            return
+        keep = np.ones(len(self._ids), dtype=bool)
+        keep[drop] = False
+        self._matrix = self._matrix[keep]
+        self._ids = [chunk_key for chunk_key, kept in zip(self._ids, keep) if kept]
+        self._texts = [text for text, kept in zip(self._texts, keep) if kept]
+        self._metadatas = [metadata for metadata, kept in zip(self._metadatas, keep) if kept]
+        self._positions = {chunk_key: idx for idx, chunk_key in enumerate(self._ids)}
+
+    def ids(self):
+        return list(self._ids)
+
+    def documents(self):
+        return list(self._ids), list(self._texts), list(self._metadatas)
+
+    def _similarities(self, query: np.ndarray) -> np.ndarray:
+        if self._matrix.dtype == np.float32:
+            return self._matrix @ query
+        # NumPy has no BLAS kernels for float16, blocks are widened to float32 first
+        return np.concatenate([
+            self._matrix[start:start + SEARCH_BLOCK_ROWS].astype(np.float32) @ query
+            for start in range(0, len(self._ids), SEARCH_BLOCK_ROWS)
+        ])
+
+    def search(self, query_vector, k, ids=None):
+        if not self._ids or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        similarities = self._similarities(query)
+        if ids is not None:
+            # Chunks outside the searched set rank below every chunk in it
+            rows = np.fromiter((self._positions[chunk_key] for chunk_key in ids if chunk_key in self._positions), dtype=np.int64)
+            if len(rows) == 0:
+                return []
+            masked = np.full(len(self._ids), -np.inf, dtype=np.float32)
+            masked[rows] = similarities[rows]
+            similarities = masked
+            k = min(k, len(rows))
+        k = min(k, len(self._ids))
+        top = np.argpartition(-similarities, k - 1)[:k] if k < len(self._ids) else np.arange(len(self._ids))
+        top = top[np.argsort(-similarities[top], kind='stable')]
+        # Squared L2 distance of unit vectors, the score Chroma reports by default
+        return [
+            (Document(page_content=self._texts[idx], metadata=self._metadatas[idx]), float(2.0 - 2.0 * similarities[idx]))
+            for idx in top
+        ]
+
+    def persist(self):
+        if not self.persist_directory:
+            return
+        os.makedirs(self.persist_directory, exist_ok=True)
+        matrix = self._matrix if self._matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+        matrix_name = f"{self.collection_name}.{uuid.uuid4().hex}.npy"
+        data = {'matrix': matrix_name, 'ids': self._ids, 'documents': self._texts, 'metadatas': self._metadatas}
+
+        # The matrix goes to a new file, replacing the JSON file then switches readers to it in one step
+        for path, write in ((os.path.join(self.persist_directory, matrix_name), lambda f: np.save(f, matrix)),
+                            (self._documents_path(), lambda f: f.write(json.dumps(data, ensure_ascii=False).encode('utf-8')))):
+            fd, tmp_path = tempfile.mkstemp(dir=self.persist_directory, prefix=f".{self.collection_name}-")
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    write(f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        # Superseded matrices stay readable through existing memory maps after they are unlinked
+        for name in self._matrix_files():
+            if name != matrix_name:
+                os.remove(os.path.join(self.persist_directory, name))
+
+    def destroy(self):
+        self._matrix = None
+        self._ids, self._texts, self._metadatas, self._positions = [], [], [], {}
+        if self.persist_directory:
+            for name in self._matrix_files() + [os.path.basename(self._documents_path())]:
+                path = os.path.join(self.persist_directory, name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class ChromaVectorBackend(VectorBackend):
+    """Collection in a Chroma database"""
+
+    def __init__(self, collection_name: str, embeddings, persist_directory: Optional[str] = None,
+                 write_batch_size: int = 4096):
+        """
+        Initialize collection, opening it if it exists
+
+        Args:
+            collection_name: Chroma collection name
+            embeddings: Embedding model of the collection
+            persist_directory: Database directory, None for an in-memory database
+            write_batch_size: Chunks per bulk write
+        """
+        from langchain_community.vectorstores import Chroma
+
+        self.persist_directory = persist_directory
+        self.write_batch_size = write_batch_size
+        self.vectorstore = Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            persist_directory=persist_directory
+        )
+
+    def upsert(self, ids, vectors, documents, metadatas=None):
+        metadatas = metadatas or [{} for _ in ids]
+        items = list(zip(ids, vectors, documents, metadatas))
+        # Chroma rejects empty metadata dicts, chunks with and without metadata are written separately
+        for has_metadata in (True, False):
+            group = [item for item in items if bool(item[3]) == has_metadata]
+            for start_idx in range(0, len(group), self.write_batch_size):
+                batch = group[start_idx:start_idx + self.write_batch_size]
+                self.vectorstore._collection.upsert(
+                    ids=[item[0] for item in batch],
+                    embeddings=[item[1] for item in batch],
+                    documents=[item[2] for item in batch],
+                    metadatas=[item[3] for item in batch] if has_metadata else None,
+                )
+
+    def delete(self, ids):
+        if ids:
+            self.vectorstore.delete(ids=list(ids))
+
+    def ids(self):
+        return self.vectorstore.get(include=[])['ids']
+
+    def documents(self):
+        stored = self.vectorstore.get(include=["documents", "metadatas"])
+        return stored['ids'], stored['documents'], [metadata or {} for metadata in stored['metadatas']]
+
+    def search(self, query_vector, k, ids=None):
+        if ids is None:
+            return self.vectorstore.similarity_search_by_vector_with_relevance_scores(list(query_vector), k=k)
+
+        # Chroma cannot restrict a query to IDs, the query is widened until enough results are in the set
+        total = self.vectorstore._collection.count()
+        n_results = min(max(k * 4, k), total)
+        while n_results > 0:
+            result = self.vectorstore._collection.query(
+                query_embeddings=[list(query_vector)],
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"],
+            )
+            matches = [
+                (Document(page_content=text, metadata=metadata or {}), distance)
+                for chunk_key, text, metadata, distance in zip(
+                    result['ids'][0], result['documents'][0], result['metadatas'][0], result['distances'][0])
+                if chunk_key in ids
+            ]
+            if len(matches) >= k or n_results >= total:
+                return matches[:k]
+            n_results = min(n_results * 4, total)
+        return []
+
+    def persist(self):
+        if self.persist_directory:
+            self.vectorstore.persist()
+
+    def destroy(self):
+        # The persist directory may hold other collections, only this collection is dropped
+        self.vectorstore.delete_collection()
+
+
+def create_vector_backend(kind: str, collection_name: str, embeddings=None, persist_directory: Optional[str] = None,
+                          **kwargs) -> VectorBackend:
+    """
+    Create a vector backend
+
+    Args:
+        kind: 'numpy' or 'chroma'
+        collection_name: Collection name
+        embeddings: Embedding model (used by Chroma only)
+        persist_directory: Directory of the collection, None for an in-memory collection
+        **kwargs: Backend-specific options (dtype for NumPy, write_batch_size for Chroma)
+
+    Returns:
+        Vector backend
+    """
+    if kind == "numpy":
+        return NumpyVectorBackend(collection_name, persist_directory=persist_directory, **kwargs)
+    if kind == "chroma":
+        return ChromaVectorBackend(collection_name, embeddings, persist_directory=persist_directory, **kwargs)
+    raise ValueError(f"Unknown vector backend: {kind}")